@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+
+import log_export
+import log_filters
+
+try:
+    import duckdb
+except ImportError:  # The columnar path is optional; SQLite stays the fallback
+    duckdb = None
+
+# How stale (in seconds) the Parquet snapshots may get before queries go to SQLite instead
+ANALYTICS_MAX_LAG_SECONDS = float(os.getenv("ANALYTICS_MAX_LAG_SECONDS", "30"))
+# After a write, wait this long for more writes before re-exporting
+ANALYTICS_REFRESH_DEBOUNCE_SECONDS = float(os.getenv("ANALYTICS_REFRESH_DEBOUNCE_SECONDS", "1"))
+ANALYTICS_SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", "analytics_snapshots")
+
+
+class AnalyticsEngine:
+    """DuckDB over periodically exported Parquet snapshots of the SQLite log tables.
+
+    Snapshots are only exported by the background thread. Writers call
+    mark_dirty(), which wakes it; until the next export has caught up,
+    is_fresh() is False and callers answer from SQLite instead.
+    """
+
+    def __init__(self, db_path: str, snapshot_dir: str = ANALYTICS_SNAPSHOT_DIR,
+                 max_lag_seconds: float = ANALYTICS_MAX_LAG_SECONDS,
+                 debounce_seconds: float = ANALYTICS_REFRESH_DEBOUNCE_SECONDS):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.max_lag_seconds = max_lag_seconds
+        self.debounce_seconds = debounce_seconds
+        self.last_refresh = 0.0
+        self.changed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def available(self) -> bool:
+        return duckdb is not None and log_export.pq is not None
+
+    def snapshot_path(self, log_type: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{log_type}.parquet")
+
+    def refresh(self):
+        """Export every log table to Parquet and atomically replace the previous snapshot"""
+        with self._refresh_lock:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            started = time.time()
+            for log_type in log_export.EXPORT_TABLES:
+                path = self.snapshot_path(log_type)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    for chunk in log_export.stream_export(self.db_path, log_type, "parquet"):
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+            # Rows written after the export started may be missing, so date the snapshot from the start
+            self.last_refresh = started
+
+    def mark_dirty(self):
+        """Note that the log tables changed, so snapshots are stale until the next export"""
+        self.changed_at = time.time()
+        self._wake.set()
+
+    def is_fresh(self) -> bool:
+        """True when the snapshots include every write marked so far and are within the allowed lag"""
+        if not self.available or not self.last_refresh:
+            return False
+        return self.changed_at < self.last_refresh and time.time() - self.last_refresh <= self.max_lag_seconds
+
+    def start(self):
+        """Refresh snapshots in a background thread after writes, and at least every half the allowed lag"""
+        if not self.available or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Analytics snapshot refresh failed: {e}")
+            if self._wake.wait(self.max_lag_seconds / 2):
+                # Let a burst of writes land before exporting again
+                self._stop.wait(self.debounce_seconds)
+
+    def query(self, sql: str, params: list = None, where: str = "") -> list:
+        """Run a DuckDB query with {commute_logs} / {energy_consumption} bound to the snapshots"""
+        sql = sql.format(
+            commute_logs=f"read_parquet('{self.snapshot_path('commute-logs')}')",
+            energy_consumption=f"read_parquet('{self.snapshot_path('energy-logs')}')",
+            where=where,
+        )
+        conn = duckdb.connect()
+        try:
+            return conn.execute(sql, params or []).fetchall()
+        finally:
+            conn.close()
+
+    def monthly_data(self, device_id: str = None, user_id: str = None) -> list:
+        """Monthly commute and energy totals, newest month first"""
+        conditions, params = log_filters.owner_filters(device_id, user_id)
+        where = log_filters.where_clause(conditions)
+        rows = self.query("""
+            WITH commute AS (
+                SELECT
+                    year(TRY_CAST(date AS TIMESTAMP)) AS year,
+                    month(TRY_CAST(date AS TIMESTAMP)) AS month,
+                    SUM(co2_emissions_kg) AS total_commute_co2,
+                    SUM(distance_km) AS total_distance
+                FROM {commute_logs}
+                {where}
+                GROUP BY ALL
+            ),
+            energy AS (
+                SELECT
+                    year(TRY_CAST(date AS TIMESTAMP)) AS year,
+                    month(TRY_CAST(date AS TIMESTAMP)) AS month,
+                    SUM(co2_emissions_kg) AS total_energy_co2,
+                    SUM(energy_kwh) AS total_energy,
+                    SUM(cost_rupees) AS total_energy_cost
+                FROM {energy_consumption}
+                {where}
+                GROUP BY ALL
+            )
+            SELECT
+                COALESCE(c.year, e.year) AS year,
+                COALESCE(c.month, e.month) AS month,
+                COALESCE(total_commute_co2, 0),
+                COALESCE(total_energy_co2, 0),
+                COALESCE(total_distance, 0),
+                COALESCE(total_energy, 0),
+                COALESCE(total_energy_cost, 0)
+            FROM commute c
+            FULL OUTER JOIN energy e ON c.year = e.year AND c.month = e.month
+            WHERE COALESCE(c.year, e.year) IS NOT NULL
+            ORDER BY year DESC, month DESC
+        """, params + params, where)
+        return [
+            {
+                "year": row[0],
+                "month": row[1],
+                "total_commute_co2": row[2],
+                "total_energy_co2": row[3],
+                "commute_distance_km": row[4],
+                "energy_consumption_kwh": row[5],
+                "total_energy_cost": row[6],
+            }
+            for row in rows
+        ]
+
+    def dashboard_stats(self, current_month: str, device_id: str = None, user_id: str = None) -> dict:
+        """All-time and current-month CO2 and cost totals"""
+        conditions, params = log_filters.owner_filters(device_id, user_id)
+        where = log_filters.where_clause(conditions)
+        commute = self.query("""
+            SELECT
+                COALESCE(SUM(co2_emissions_kg), 0),
+                COALESCE(SUM(co2_emissions_kg) FILTER (WHERE strftime(TRY_CAST(date AS TIMESTAMP), '%Y-%m') = ?), 0)
+            FROM {commute_logs}
+            {where}
+        """, [current_month] + params, where)[0]
+        energy = self.query("""
+            SELECT
+                COALESCE(SUM(co2_emissions_kg), 0),
+                COALESCE(SUM(cost_rupees), 0),
+                COALESCE(SUM(co2_emissions_kg) FILTER (WHERE strftime(TRY_CAST(date AS TIMESTAMP), '%Y-%m') = ?), 0),
+                COALESCE(SUM(cost_rupees) FILTER (WHERE strftime(TRY_CAST(date AS TIMESTAMP), '%Y-%m') = ?), 0)
+            FROM {energy_consumption}
+            {where}
+        """, [current_month, current_month] + params, where)[0]
+        return {
+            "total_commute_co2": commute[0],
+            "month_commute_co2": commute[1],
+            "total_energy_co2": energy[0],
+            "total_energy_cost": energy[1],
+            "month_energy_co2": energy[2],
+            "month_energy_cost": energy[3],
+        }
@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import threading
+import time
+
+import log_filters
+from power_stats import PowerStats
+
+# Flag spikes, stuck sensors and dropouts as readings arrive
+ANOMALY_DETECTION_ENABLED = os.getenv("ANOMALY_DETECTION_ENABLED", "1") == "1"
+# A reading this many standard deviations from the device's running mean is a spike
+ANOMALY_SPIKE_SIGMAS = float(os.getenv("ANOMALY_SPIKE_SIGMAS", "4"))
+# Standard deviation floor, so a near-constant signal doesn't turn every small step into a spike
+ANOMALY_MIN_STD_WATTS = float(os.getenv("ANOMALY_MIN_STD_WATTS", "1"))
+# This many consecutive readings within the tolerance of each other is a stuck sensor
+ANOMALY_FLATLINE_READINGS = int(os.getenv("ANOMALY_FLATLINE_READINGS", "30"))
+ANOMALY_FLATLINE_TOLERANCE_WATTS = float(os.getenv("ANOMALY_FLATLINE_TOLERANCE_WATTS", "0.05"))
+# A device silent (or with a hole in its readings) for longer than this has dropped out
+ANOMALY_DROPOUT_SECONDS = float(os.getenv("ANOMALY_DROPOUT_SECONDS", "120"))
+# How often silent devices are looked for
+ANOMALY_SWEEP_SECONDS = 10
+
+# Below this a steady reading is an idle load, not a stuck sensor
+IDLE_WATTS = 0.5
+
+ANOMALY_KINDS = ("spike", "flatline", "dropout")
+
+ANOMALY_INSERT_SQL = """
+    INSERT INTO anomalies (device_id, kind, ts_ms, power_watts, expected_watts, score, detail)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def ensure_anomaly_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS anomalies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            ts_ms INTEGER NOT NULL,
+            power_watts REAL,
+            expected_watts REAL,
+            score REAL,
+            detail TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_ts ON anomalies (ts_ms)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_device_ts ON anomalies (device_id, ts_ms)")
+
+
+def anomaly_row(event: dict) -> tuple:
+    """anomalies row (ANOMALY_INSERT_SQL order) for a detected event"""
+    return (event["device_id"], event["kind"], event["ts_ms"], event["power_watts"], event["expected_watts"],
+            event["score"], event["detail"])
+
+
+def message_readings(message: dict, received_ms: int) -> list:
+    """(ts_ms, power_watts) readings carried by a decoded message"""
+    if message.get("type") == "samples":
+        return [(sample[0], sample[1]) for sample in message["samples"]]
+    if message.get("type") == "energy":
+        # Energy messages carry no reading time of their own
+        return [(received_ms, message.get("power_watts", 0))]
+    return []
+
+
+class DeviceDetector:
+    """O(1) detection state for one device"""
+
+    __slots__ = ("power", "last_ts_ms", "last_seen", "silent", "in_spike",
+                 "flat_power", "flat_count", "flat_reported")
+
+    def __init__(self):
+        self.power = PowerStats()
+        self.last_ts_ms = None
+        self.last_seen = None
+        # Already reported as dropped out; cleared by the next reading
+        self.silent = False
+        # Inside a run of spike readings, which is reported once
+        self.in_spike = False
+        self.flat_power = None
+        self.flat_count = 0
+        self.flat_reported = False
+
+
+class AnomalyDetector:
+    """Streaming per-device anomaly detection on the ingest path.
+
+    Each reading is checked against the device's exponentially weighted mean
+    and variance (spike), a counter of consecutive near-identical readings
+    (flatline, a stuck sensor) and the gap since its previous reading
+    (dropout, for holes a device fills in later); sweep() reports devices that
+    went silent. A run of consecutive anomalous readings is one event. Events
+    are returned to the caller to store and passed to on_event if set.
+    """
+
+    def __init__(self, spike_sigmas: float = ANOMALY_SPIKE_SIGMAS, min_std_watts: float = ANOMALY_MIN_STD_WATTS,
+                 flatline_readings: int = ANOMALY_FLATLINE_READINGS,
+                 flatline_tolerance_watts: float = ANOMALY_FLATLINE_TOLERANCE_WATTS,
+                 dropout_seconds: float = ANOMALY_DROPOUT_SECONDS, on_event=None):
+        self.spike_sigmas = spike_sigmas
+        self.min_std_watts = min_std_watts
+        self.flatline_readings = flatline_readings
+        self.flatline_tolerance_watts = flatline_tolerance_watts
+        self.dropout_ms = dropout_seconds * 1000
+        self.on_event = on_event
+        self.devices = {}
+        self.readings = 0
+        self.events = dict.fromkeys(ANOMALY_KINDS, 0)
+        self.busy_ns = 0
+        self._lock = threading.Lock()
+
+    def check(self, message: dict, received_ms: int = None) -> list:
+        """Check a decoded message's readings; returns the anomaly events they raise"""
+        received_ms = received_ms or int(time.time() * 1000)
+        readings = message_readings(message, received_ms)
+        if not readings:
+            return []
+        device_id = message.get("device_id", "unknown")
+        events = []
+        started = time.perf_counter_ns()
+        with self._lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceDetector()
+            state.last_seen = received_ms
+            for ts_ms, power_watts in readings:
+                self._check(state, device_id, ts_ms, power_watts, events)
+            self.readings += len(readings)
+            self.busy_ns += time.perf_counter_ns() - started
+        self._emit(events)
+        return events
+
+    def _check(self, state: DeviceDetector, device_id: str, ts_ms: int, power_watts: float, events: list):
+        if state.last_ts_ms is not None:
+            gap_ms = ts_ms - state.last_ts_ms
+            if gap_ms > self.dropout_ms and not state.silent:
+                events.append(self._event(device_id, "dropout", ts_ms, power_watts, state.power.mean, gap_ms / 1000,
+                                          f"no readings for {gap_ms / 1000:.0f} s"))
+            if gap_ms <= 0:
+                # Duplicate or late reading: already checked, or too late to matter
+                return
+        state.silent = False
+        state.last_ts_ms = ts_ms
+
+        if state.power.warmed_up:
+            std = max(state.power.std, self.min_std_watts)
+            score = abs(power_watts - state.power.mean) / std
+            if score > self.spike_sigmas:
+                if not state.in_spike:
+                    events.append(self._event(device_id, "spike", ts_ms, power_watts, state.power.mean, score,
+                                              f"{score:.1f} standard deviations from the mean"))
+                state.in_spike = True
+            else:
+                state.in_spike = False
+
+        if state.flat_power is not None and abs(power_watts - state.flat_power) <= self.flatline_tolerance_watts:
+            state.flat_count += 1
+            if (state.flat_count >= self.flatline_readings and not state.flat_reported
+                    and abs(power_watts) >= IDLE_WATTS):
+                state.flat_reported = True
+                events.append(self._event(device_id, "flatline", ts_ms, power_watts, state.power.mean, state.flat_count,
+                                          f"{state.flat_count} identical readings"))
+        else:
+            state.flat_power, state.flat_count, state.flat_reported = power_watts, 1, False
+
+        # Scored against the statistics before this reading, then folded in
+        state.power.add(power_watts)
+
+    def sweep(self, now_ms: int = None) -> list:
+        """Report devices that have sent nothing for longer than the dropout time"""
+        now_ms = now_ms or int(time.time() * 1000)
+        events = []
+        with self._lock:
+            for device_id, state in self.devices.items():
+                if not state.silent and now_ms - state.last_seen > self.dropout_ms:
+                    state.silent = True
+                    silent_seconds = (now_ms - state.last_seen) / 1000
+                    events.append(self._event(device_id, "dropout", now_ms, None, state.power.mean, silent_seconds,
+                                              f"silent for {silent_seconds:.0f} s"))
+        self._emit(events)
+        return events
+
+    def _event(self, device_id: str, kind: str, ts_ms: int, power_watts, expected_watts: float, score: float,
+               detail: str) -> dict:
+        self.events[kind] += 1
+        return {
+            "type": "anomaly",
+            "device_id": device_id,
+            "kind": kind,
+            "ts_ms": int(ts_ms),
+            "power_watts": power_watts,
+            "expected_watts": expected_watts,
+            "score": score,
+            "detail": detail,
+        }
+
+    def _emit(self, events: list):
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
+
+    def stats(self) -> dict:
+        with self._lock:
+            busy_seconds = self.busy_ns / 1e9
+            return {
+                "devices": len(self.devices),
+                "readings": self.readings,
+                "events": dict(self.events),
+                "readings_per_cpu_second": self.readings / busy_seconds if busy_seconds else 0.0,
+            }
+
+
+def query_anomalies(db_path: str, device_id: str = None, kind: str = None, start_ms: int = None,
+                    end_ms: int = None, limit: int = 100) -> list:
+    """Stored anomaly events, newest first"""
+    conditions, params = log_filters.owner_filters(device_id)
+    if kind:
+        conditions.append("kind = ?")
+        params.append(kind)
+    time_conditions, time_params = log_filters.time_range_filters(start_ms, end_ms)
+    where = log_filters.where_clause(conditions + time_conditions)
+    params += time_params
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f"""
+            SELECT id, device_id, kind, ts_ms, power_watts, expected_watts, score, detail, created_at
+            FROM anomalies {where}
+            ORDER BY ts_ms DESC LIMIT ?
+        """, (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
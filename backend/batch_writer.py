@@ -0,0 +1,410 @@
+import glob
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# A batch is committed once it has this many rows or its oldest row has waited this long
+BATCH_WRITER_MAX_ROWS = int(os.getenv("BATCH_WRITER_MAX_ROWS", "500"))
+BATCH_WRITER_MAX_DELAY_MS = float(os.getenv("BATCH_WRITER_MAX_DELAY_MS", "200"))
+# Rows that may wait for the writer before the overflow policy applies
+BATCH_WRITER_QUEUE_SIZE = int(os.getenv("BATCH_WRITER_QUEUE_SIZE", "10000"))
+# What submit() does when the queue is full: block, drop_oldest or coalesce
+BATCH_WRITER_POLICY = os.getenv("BATCH_WRITER_POLICY", "block")
+# Directory for NDJSON spill files written while the database is locked; empty disables spilling
+BATCH_WRITER_SPILL_DIR = os.getenv("BATCH_WRITER_SPILL_DIR", "")
+# How long a write waits on a locked database, and how long a stall lasts before the database is retried
+BATCH_WRITER_BUSY_TIMEOUT_MS = float(os.getenv("BATCH_WRITER_BUSY_TIMEOUT_MS", "5000"))
+BATCH_WRITER_RETRY_SECONDS = float(os.getenv("BATCH_WRITER_RETRY_SECONDS", "1"))
+
+POLICIES = ("block", "drop_oldest", "coalesce")
+
+# Flush latencies kept for the percentile stats
+LATENCY_SAMPLES = 1000
+
+SPILL_SUFFIX = ".ndjson"
+REPLAY_SUFFIX = ".replaying"
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def is_stall(error: Exception) -> bool:
+    """Whether a write failed only because another connection holds the database"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class BatchWriter:
+    """Group-commit writer: rows from any thread are buffered and inserted with
+    executemany, one transaction per batch, on a single writer thread.
+
+    When the bounded queue is full, submit() follows the overflow policy:
+      block        wait for room (or refuse the new row if called with block=False)
+      drop_oldest  evict the oldest queued row to make room
+      coalesce     fold the row into the queued row with the same key (merge(old, new),
+                   or the new row replaces the old); rows without a match evict the oldest
+
+    With a spill directory, batches that fail because the database is locked or
+    busy are appended to an NDJSON file instead of being lost, and replayed
+    between live batches once writes succeed again. Any other error (a missing
+    table, a constraint) only costs the rows of the statement that raised it.
+
+    stop() returns only after every row submitted before it has been written or spilled.
+    """
+
+    def __init__(self, db_path: str, max_rows: int = BATCH_WRITER_MAX_ROWS,
+                 max_delay_ms: float = BATCH_WRITER_MAX_DELAY_MS, queue_size: int = BATCH_WRITER_QUEUE_SIZE,
+                 policy: str = BATCH_WRITER_POLICY, spill_dir: str = BATCH_WRITER_SPILL_DIR,
+                 busy_timeout_ms: float = BATCH_WRITER_BUSY_TIMEOUT_MS,
+                 retry_seconds: float = BATCH_WRITER_RETRY_SECONDS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.policy = policy
+        self.spill_dir = spill_dir or None
+        self.busy_timeout = busy_timeout_ms / 1000
+        self.retry_seconds = retry_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.coalesced = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.flush_seconds = deque(maxlen=LATENCY_SAMPLES)
+        # Optional callback, run on the writer thread with the {sql: rows} of each committed batch
+        self.on_commit = None
+        # Optional prepare(cursor, sql, rows) -> rows, run inside each write transaction just before
+        # the rows are inserted (e.g. to price them against counters it also updates)
+        self.prepare = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # coalesce policy: (sql, key) -> the queued slot it would fold into
+        self._slots = {}
+        self._slots_lock = threading.RLock()
+        self._stalled_until = 0.0
+        self._spill_path = None
+        self._spill_sequence = 0
+        self._replay_file = None
+        self._replay_path = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._release_orphaned_replays()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Write everything already submitted, then stop the writer thread"""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, sql: str, row: tuple, block: bool = True, timeout: float = None,
+               key=None, merge=None) -> bool:
+        """Queue a row for insertion; returns False (and counts a drop) if the overflow policy refused it.
+
+        key identifies rows that may be coalesced (e.g. a device id); merge(old, new)
+        combines them, otherwise the newer row wins.
+        """
+        slot = [sql, row, key]
+        if self.policy == "coalesce" and key is not None:
+            with self._slots_lock:
+                queued = self._slots.get((sql, key))
+                if queued is not None and self.queue.full():
+                    queued[1] = merge(queued[1], row) if merge else row
+                    self.coalesced += 1
+                    return True
+                if not self._put(slot, block=False, timeout=None):
+                    return False
+                self._slots[(sql, key)] = slot
+                return True
+        return self._put(slot, block, timeout)
+
+    def _put(self, slot: list, block: bool, timeout: float) -> bool:
+        if self.policy == "block":
+            try:
+                self.queue.put(slot, block=block, timeout=timeout)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(slot)
+                    break
+                except queue.Full:
+                    try:
+                        self._forget(self.queue.get_nowait())
+                        self.evicted += 1
+                    except queue.Empty:
+                        pass
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def _forget(self, slot: list):
+        """Stop coalescing into a slot that has left the queue"""
+        if slot[2] is not None:
+            with self._slots_lock:
+                if self._slots.get((slot[0], slot[2])) is slot:
+                    del self._slots[(slot[0], slot[2])]
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+        try:
+            while True:
+                try:
+                    slot = self.queue.get(timeout=self.max_delay)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    self._replay(conn, self.max_rows * 4)
+                    continue
+                self._forget(slot)
+                batch = [slot]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        slot = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._forget(slot)
+                    batch.append(slot)
+                if self._flush(conn, batch):
+                    # Interleave spilled rows with live ones so replay never starves the queue
+                    self._replay(conn, self.max_rows)
+        finally:
+            self._close_replay()
+            conn.close()
+
+    def _flush(self, conn: sqlite3.Connection, batch: list) -> bool:
+        statements = {}
+        for sql, row, _ in batch:
+            statements.setdefault(sql, []).append(row)
+        if self.spill_dir and time.monotonic() < self._stalled_until:
+            # Still inside a stall; don't wait out another busy timeout
+            self._spill(statements, len(batch))
+            return False
+        started = time.perf_counter()
+        try:
+            with conn:
+                written = self._write(conn, statements)
+        except Exception as e:
+            if is_stall(e):
+                self._stalled(statements, len(batch), e)
+                return False
+            # One bad row kind (e.g. a missing table) must not take the rest of the batch down with it
+            return self._flush_each(conn, statements)
+        self.flush_seconds.append(time.perf_counter() - started)
+        self.written += len(batch)
+        self.batches += 1
+        if self.on_commit is not None:
+            self.on_commit(written)
+        return True
+
+    def _write(self, conn: sqlite3.Connection, statements: dict) -> dict:
+        """Insert every statement's rows in the open transaction; returns the rows as written"""
+        if self.prepare is not None:
+            # prepare may read what it updates, so hold the write lock from its first read
+            conn.execute("BEGIN IMMEDIATE")
+        written = {}
+        for sql, rows in statements.items():
+            if self.prepare is not None:
+                rows = self.prepare(conn.cursor(), sql, rows)
+            conn.executemany(sql, rows)
+            written[sql] = rows
+        return written
+
+    def _flush_each(self, conn: sqlite3.Connection, statements: dict) -> bool:
+        """Write each row kind in its own transaction, dropping the kinds the database rejects"""
+        committed = {}
+        items = list(statements.items())
+        for index, (sql, rows) in enumerate(items):
+            try:
+                with conn:
+                    committed.update(self._write(conn, {sql: rows}))
+            except Exception as e:
+                if is_stall(e):
+                    remaining = dict(items[index:])
+                    self._stalled(remaining, sum(len(rows) for rows in remaining.values()), e)
+                    break
+                self.failed += len(rows)
+                print(f"Batch write rejected, {len(rows)} rows lost: {e}")
+                continue
+            self.written += len(rows)
+        if committed:
+            self.batches += 1
+            if self.on_commit is not None:
+                self.on_commit(committed)
+        return time.monotonic() >= self._stalled_until
+
+    def _stalled(self, statements: dict, count: int, error: sqlite3.Error):
+        """Spill rows the locked database could not take, or count them lost without a spill directory"""
+        if not self.spill_dir:
+            self.failed += count
+            print(f"Batch write failed, {count} rows lost: {error}")
+            return
+        self._stalled_until = time.monotonic() + self.retry_seconds
+        self._spill(statements, count)
+        print(f"Database unavailable ({error}); spilled {count} rows to {self._spill_path}")
+
+    def _spill(self, statements: dict, count: int):
+        if self._spill_path is None:
+            self._spill_sequence += 1
+            name = f"spill-{os.getpid()}-{id(self):x}-{time.time_ns()}-{self._spill_sequence}{SPILL_SUFFIX}"
+            self._spill_path = os.path.join(self.spill_dir, name)
+        with open(self._spill_path, "a", encoding="utf-8") as spill:
+            for sql, rows in statements.items():
+                spill.write(json.dumps({"sql": sql, "rows": rows}) + "\n")
+            spill.flush()
+            os.fsync(spill.fileno())
+        self.spilled += count
+
+    def _replay(self, conn: sqlite3.Connection, max_rows: int):
+        """Write up to max_rows spilled rows back to the database"""
+        if not self.spill_dir or time.monotonic() < self._stalled_until:
+            return
+        replayed = 0
+        while replayed < max_rows:
+            if self._replay_file is None and not self._claim_spill_file():
+                return
+            position = self._replay_file.tell()
+            line = self._replay_file.readline()
+            if not line:
+                self._close_replay(finished=True)
+                continue
+            entry = json.loads(line)
+            try:
+                with conn:
+                    written = self._write(conn, {entry["sql"]: entry["rows"]})
+            except Exception as e:
+                if is_stall(e):
+                    # Stalled again; retry this line later
+                    self._replay_file.seek(position)
+                    self._stalled_until = time.monotonic() + self.retry_seconds
+                    return
+                self.failed += len(entry["rows"])
+                print(f"Spilled batch rejected, {len(entry['rows'])} rows lost: {e}")
+            else:
+                self.written += len(entry["rows"])
+                self.replayed += len(entry["rows"])
+                if self.on_commit is not None:
+                    self.on_commit(written)
+            replayed += len(entry["rows"])
+
+    def _claim_spill_file(self) -> bool:
+        """Take the oldest spill file for replay; renaming it keeps other writers off it"""
+        # New spills go to a fresh file while this one is replayed
+        self._spill_path = None
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "*" + SPILL_SUFFIX)), key=os.path.getmtime):
+            claimed = f"{path}.{os.getpid()}{REPLAY_SUFFIX}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            self._replay_path = claimed
+            self._replay_file = open(claimed, "r", encoding="utf-8")
+            return True
+        return False
+
+    def _close_replay(self, finished: bool = False):
+        if self._replay_file is None:
+            return
+        if finished:
+            self._replay_file.close()
+            os.remove(self._replay_path)
+        else:
+            # Put the unreplayed remainder back as an ordinary spill file
+            remainder = self._replay_file.read()
+            self._replay_file.close()
+            spill_path = self._replay_path.rsplit(".", 2)[0]
+            with open(spill_path, "w", encoding="utf-8") as spill:
+                spill.write(remainder)
+            os.remove(self._replay_path)
+        self._replay_file = None
+        self._replay_path = None
+
+    def _release_orphaned_replays(self):
+        """Return files a crashed writer was replaying to the spill pool"""
+        for path in glob.glob(os.path.join(self.spill_dir, "*" + REPLAY_SUFFIX)):
+            spill_path, pid, _ = path.rsplit(".", 2)
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                os.rename(path, spill_path)
+
+    def spill_backlog(self) -> dict:
+        """Spill files waiting to be replayed and their size"""
+        if not self.spill_dir:
+            return {"files": 0, "bytes": 0}
+        paths = glob.glob(os.path.join(self.spill_dir, "*" + SPILL_SUFFIX))
+        paths += glob.glob(os.path.join(self.spill_dir, "*" + REPLAY_SUFFIX))
+        sizes = []
+        for path in paths:
+            try:
+                sizes.append(os.path.getsize(path))
+            except FileNotFoundError:
+                continue
+        return {"files": len(sizes), "bytes": sum(sizes)}
+
+    def stats(self) -> dict:
+        latencies = list(self.flush_seconds)
+        return {
+            "policy": self.policy,
+            "queued": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_capacity": self.queue.maxsize,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "coalesced": self.coalesced,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "spill_backlog": self.spill_backlog(),
+            "stalled": time.monotonic() < self._stalled_until,
+            "batches": self.batches,
+            "write_latency_ms": {
+                "p50": percentile(latencies, 0.50) * 1000,
+                "p95": percentile(latencies, 0.95) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+                "max": max(latencies, default=0.0) * 1000,
+            },
+        }
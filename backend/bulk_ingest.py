@@ -0,0 +1,236 @@
+import csv
+import io
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+
+import consumption_counters
+import tariff_registry
+
+# Rows per executemany/commit when writing a bulk upload
+BULK_CHUNK_SIZE = 2000
+
+
+def detect_format(content_type: str = "", filename: str = "") -> str:
+    """Guess the upload format from the content type or file extension"""
+    content_type = (content_type or "").lower()
+    filename = (filename or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if "csv" in content_type or filename.endswith(".csv"):
+        return "csv"
+    return "json"
+
+
+def parse_records(payload: bytes, fmt: str):
+    """Decode a bulk upload into (row_number, record) pairs plus per-row parse errors"""
+    text = payload.decode("utf-8-sig")
+    records = []
+    errors = []
+
+    if fmt == "ndjson":
+        for row_number, line in enumerate(text.splitlines()):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                errors.append({"row": row_number, "error": f"Invalid JSON: {e}"})
+                continue
+            if not isinstance(record, dict):
+                errors.append({"row": row_number, "error": "Each line must be a JSON object"})
+                continue
+            records.append((row_number, record))
+    elif fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        for row_number, record in enumerate(reader):
+            # Empty CSV cells mean "not provided"
+            records.append((row_number, {k: v for k, v in record.items() if v not in ("", None)}))
+    else:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("records", [])
+        if not isinstance(data, list):
+            raise ValueError("JSON body must be an array of records")
+        for row_number, record in enumerate(data):
+            if not isinstance(record, dict):
+                errors.append({"row": row_number, "error": "Each record must be a JSON object"})
+                continue
+            records.append((row_number, record))
+
+    return records, errors
+
+
+def _to_frame(records: list, columns: list) -> pd.DataFrame:
+    """Build a DataFrame with the expected columns from parsed records"""
+    # object columns keep integer ids as ints instead of widening them to floats next to missing values
+    frame = pd.DataFrame([record for _, record in records], columns=columns, dtype=object)
+    frame.insert(0, "row", [row_number for row_number, _ in records])
+    return frame
+
+
+def _collect_errors(frame: pd.DataFrame, checks: list) -> tuple:
+    """Apply (mask, message) checks column-wise and split the frame into valid rows and errors"""
+    errors = []
+    invalid = pd.Series(False, index=frame.index)
+    for mask, message in checks:
+        mask = mask & ~invalid
+        for row_number in frame.loc[mask, "row"]:
+            errors.append({"row": int(row_number), "error": message})
+        invalid |= mask
+    return frame[~invalid].copy(), errors
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """Parse ISO date strings, leaving NaT for anything unparseable"""
+    return pd.to_datetime(values.astype("string"), errors="coerce", format="ISO8601")
+
+
+def prepare_commute_logs(records: list, emission_factors: dict, default_factor: float = 0.1) -> tuple:
+    """Validate commute records and compute CO2 for the whole batch"""
+    frame = _to_frame(records, ["date", "transport_mode", "distance_km", "device_id", "user_id"])
+    frame["distance_km"] = pd.to_numeric(frame["distance_km"], errors="coerce")
+    parsed_dates = _parse_dates(frame["date"])
+
+    frame, errors = _collect_errors(frame, [
+        (frame["date"].isna(), "date is required"),
+        (parsed_dates.isna(), "date must be an ISO date (YYYY-MM-DD)"),
+        (frame["transport_mode"].isna(), "transport_mode is required"),
+        (frame["distance_km"].isna(), "distance_km must be a number"),
+        (frame["distance_km"] < 0, "distance_km must not be negative"),
+    ])
+
+    modes = frame["transport_mode"].astype(str)
+    factors = modes.str.lower().map(emission_factors).fillna(default_factor)
+    frame["transport_mode"] = modes
+    frame["co2_emissions_kg"] = frame["distance_km"] * factors
+    _owner_values(frame)
+    return frame, errors
+
+
+def prepare_energy_logs(records: list, boards: dict, default_board: str = "mseb", default_factor: float = 0.5,
+                        resolve_board=None) -> tuple:
+    """Validate energy records and compute kWh and CO2 for the whole batch.
+
+    Rows come back in date order, so chunks priced one after another with
+    price_energy_logs see each month's consumption in the order it happened.
+    """
+    frame = _to_frame(records, ["date", "power_consumption_watts", "duration_hours",
+                                "electricity_board", "latitude", "longitude", "device_id", "user_id"])
+    for column in ("power_consumption_watts", "duration_hours", "latitude", "longitude"):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce")
+    parsed_dates = _parse_dates(frame["date"])
+
+    # Resolve boards from coordinates once per distinct location
+    if resolve_board is not None:
+        needs_lookup = frame["electricity_board"].isna() & frame["latitude"].notna() & frame["longitude"].notna()
+        if needs_lookup.any():
+            locations = frame.loc[needs_lookup, ["latitude", "longitude"]].drop_duplicates()
+            resolved = {
+                (lat, lon): resolve_board(lat, lon)
+                for lat, lon in locations.itertuples(index=False)
+            }
+            frame.loc[needs_lookup, "electricity_board"] = [
+                resolved[(lat, lon)]
+                for lat, lon in frame.loc[needs_lookup, ["latitude", "longitude"]].itertuples(index=False)
+            ]
+    frame["electricity_board"] = frame["electricity_board"].fillna(default_board).astype(str)
+
+    frame["month"] = parsed_dates.dt.strftime("%Y-%m")
+    frame, errors = _collect_errors(frame, [
+        (frame["date"].isna(), "date is required"),
+        (parsed_dates.isna(), "date must be an ISO date (YYYY-MM-DD)"),
+        (frame["power_consumption_watts"].isna(), "power_consumption_watts must be a number"),
+        (frame["duration_hours"].isna(), "duration_hours must be a number"),
+        (frame["power_consumption_watts"] < 0, "power_consumption_watts must not be negative"),
+        (frame["duration_hours"] < 0, "duration_hours must not be negative"),
+        (~frame["electricity_board"].map(lambda board_id: tariff_registry.known_board(boards, board_id)),
+         tariff_registry.UNKNOWN_BOARD_ERROR),
+    ])
+
+    frame["energy_kwh"] = frame["power_consumption_watts"] * frame["duration_hours"] / 1000
+    board_factors = {board_id: data["emission_factor"] for board_id, data in boards.items()}
+    frame["co2_emissions_kg"] = frame["energy_kwh"] * frame["electricity_board"].map(board_factors).fillna(default_factor)
+
+    _owner_values(frame)
+    frame["consumer_id"] = [
+        consumption_counters.consumer_key(user_id, device_id)
+        for user_id, device_id in zip(frame["user_id"], frame["device_id"])
+    ]
+
+    frame = frame.sort_values(["date", "row"], kind="stable")
+    return frame, errors
+
+
+def price_energy_logs(frame: pd.DataFrame, boards: dict, tariffs: dict, month_to_date: dict) -> pd.DataFrame:
+    """Add tiered cost and effective price to prepared energy rows.
+
+    month_to_date maps (board, consumer, month) to the consumption already
+    stored; rows are billed in frame order on top of it.
+    """
+    frame = frame.copy()
+    # Slab pricing depends on the month's consumption before each reading,
+    # so accumulate per board, consumer and month in date order
+    counter_keys = ["electricity_board", "consumer_id", "month"]
+    month_keys = list(zip(frame["electricity_board"], frame["consumer_id"], frame["month"]))
+    baseline = pd.Series([month_to_date.get(key, 0) for key in month_keys], index=frame.index, dtype=float)
+    running = frame.groupby(counter_keys, sort=False)["energy_kwh"].cumsum()
+    frame["month_to_date"] = baseline + running - frame["energy_kwh"]
+    frame["cost_rupees"] = 0.0
+    for board_id, group in frame.groupby("electricity_board"):
+        frame.loc[group.index, "cost_rupees"] = tariffs[board_id].price_many(
+            group["energy_kwh"].to_numpy(), group["month_to_date"].to_numpy()
+        )
+
+    board_prices = {board_id: data["price_per_kwh"] for board_id, data in boards.items()}
+    frame["price_per_kwh"] = np.where(
+        frame["energy_kwh"] > 0,
+        frame["cost_rupees"] / frame["energy_kwh"].where(frame["energy_kwh"] > 0, 1),
+        frame["electricity_board"].map(board_prices),
+    )
+    return frame
+
+
+def _owner_values(frame: pd.DataFrame):
+    """Store device/user ids as text, keeping missing ones as NULL"""
+    for column in ("device_id", "user_id"):
+        frame[column] = pd.Series([None if pd.isna(value) else str(value) for value in frame[column]],
+                                  index=frame.index, dtype=object)
+
+
+def insert_in_chunks(conn: sqlite3.Connection, sql: str, frame: pd.DataFrame, columns: list,
+                     chunk_size: int = BULK_CHUNK_SIZE, before_chunk=None, after_chunk=None,
+                     after_commit=None) -> tuple:
+    """Insert rows with executemany, one transaction per chunk, collecting failed chunks as row errors.
+
+    Each transaction takes the write lock up front (BEGIN IMMEDIATE).
+    before_chunk(cursor, chunk) -> chunk and after_chunk(cursor, chunk) run
+    inside it, so values read from the database (like month-to-date counters)
+    can't change before the rows that depend on them are written, and derived
+    tables commit or roll back with the rows. after_commit(chunk) runs once a
+    chunk's transaction has committed, e.g. to publish the rows it wrote.
+    """
+    inserted = 0
+    errors = []
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        try:
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                if before_chunk is not None:
+                    chunk = before_chunk(cursor, chunk)
+                rows = list(chunk[columns].itertuples(index=False, name=None))
+                cursor.executemany(sql, rows)
+                if after_chunk is not None:
+                    after_chunk(cursor, chunk)
+        except sqlite3.Error as e:
+            for row_number in chunk["row"]:
+                errors.append({"row": int(row_number), "error": f"Database error: {e}"})
+            continue
+        inserted += len(rows)
+        if after_commit is not None:
+            after_commit(chunk)
+    return inserted, errors
@@ -0,0 +1,62 @@
+def consumer_key(user_id: str = None, device_id: str = None) -> str:
+    """Who a reading is billed to: the user, else the device, else the shared '' consumer"""
+    return str(user_id or device_id or "")
+
+
+def ensure_counter_table(cursor):
+    """Create the month-to-date counter table, backfilling it from existing rows the first time"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'month_to_date_consumption'")
+    exists = cursor.fetchone() is not None
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS month_to_date_consumption (
+            electricity_board TEXT NOT NULL,
+            consumer_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            energy_kwh REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (electricity_board, consumer_id, month)
+        ) WITHOUT ROWID
+    """)
+
+    if not exists:
+        # Empty ids fall through like in consumer_key, so backfilled totals land on the keys inserts read
+        cursor.execute("""
+            INSERT INTO month_to_date_consumption (electricity_board, consumer_id, month, energy_kwh)
+            SELECT electricity_board, COALESCE(NULLIF(user_id, ''), NULLIF(device_id, ''), ''),
+                   strftime('%Y-%m', date), SUM(energy_kwh)
+            FROM energy_consumption
+            WHERE electricity_board IS NOT NULL AND strftime('%Y-%m', date) IS NOT NULL
+            GROUP BY 1, 2, 3
+        """)
+
+
+def read_month_to_date(cursor, board: str, consumer: str, month: str) -> float:
+    """Consumption already recorded this month for a board and consumer"""
+    cursor.execute("""
+        SELECT energy_kwh FROM month_to_date_consumption
+        WHERE electricity_board = ? AND consumer_id = ? AND month = ?
+    """, (board, consumer, month))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def read_many(cursor, keys: list) -> dict:
+    """Month-to-date totals for a list of (board, consumer, month) keys"""
+    totals = {}
+    for key in set(keys):
+        totals[key] = read_month_to_date(cursor, *key)
+    return totals
+
+
+def add_consumption_many(cursor, rows: list):
+    """Add (board, consumer, month, energy_kwh) amounts to the counters; call inside the insert's transaction"""
+    cursor.executemany("""
+        INSERT INTO month_to_date_consumption (electricity_board, consumer_id, month, energy_kwh)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (electricity_board, consumer_id, month)
+        DO UPDATE SET energy_kwh = energy_kwh + excluded.energy_kwh
+    """, rows)
+
+
+def add_consumption(cursor, board: str, consumer: str, month: str, energy_kwh: float):
+    add_consumption_many(cursor, [(board, consumer, month, energy_kwh)])
@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import threading
+import time
+
+import energy_integrator
+from power_stats import PowerStats
+
+# Send reporting configs to devices that announce support with a config_ack message
+DEVICE_CONTROL_ENABLED = os.getenv("DEVICE_CONTROL_ENABLED", "1") == "1"
+# How often configs are re-planned and unacknowledged ones resent
+DEVICE_CONTROL_INTERVAL_SECONDS = float(os.getenv("DEVICE_CONTROL_INTERVAL_SECONDS", "10"))
+# Reporting interval bounds; the longest stays well inside the integrator's gap cap,
+# so a quiet device whose reading comes a little late is not counted as a gap
+DEVICE_MIN_INTERVAL_MS = int(os.getenv("DEVICE_MIN_INTERVAL_MS", "1000"))
+DEVICE_MAX_INTERVAL_MS = min(int(os.getenv("DEVICE_MAX_INTERVAL_MS", "30000")), energy_integrator.ENERGY_MAX_GAP_MS // 2)
+# Dead-band at no load, and the most it is widened to when ingest is busy
+DEVICE_MIN_DEADBAND_WATTS = float(os.getenv("DEVICE_MIN_DEADBAND_WATTS", "0.5"))
+DEVICE_MAX_DEADBAND_WATTS = float(os.getenv("DEVICE_MAX_DEADBAND_WATTS", "16"))
+# Datagrams/s this node ingests comfortably; above it the fleet is asked to report less
+DEVICE_CONTROL_TARGET_PPS = float(os.getenv("DEVICE_CONTROL_TARGET_PPS", "2000"))
+
+# Writer queue fill at which ingest counts as fully loaded
+QUEUE_HIGH_WATER = 0.5
+# An unacknowledged config is resent this often, this many times
+RESEND_SECONDS = 30
+MAX_RETRIES = 3
+# A level only moves once the target is this far past it, so configs don't flap at a boundary
+HYSTERESIS = 0.75
+
+
+def ingest_pressure(metrics, writer, target_pps: float = DEVICE_CONTROL_TARGET_PPS) -> float:
+    """Load relative to capacity: 1.0 is fully loaded, by datagram rate or writer queue fill"""
+    writer_stats = writer.stats()
+    queue_fill = writer_stats["queued"] / writer_stats["queue_capacity"] if writer_stats["queue_capacity"] else 0.0
+    return max(metrics.packets_per_second() / target_pps, queue_fill / QUEUE_HIGH_WATER)
+
+
+def _settle(level, target: float, highest: int) -> int:
+    """Move an integer level towards target with hysteresis, within [0, highest]"""
+    if level is None or abs(target - level) >= HYSTERESIS:
+        level = round(target)
+    return min(max(level, 0), highest)
+
+
+class DeviceControl:
+    """Config state for one device: where to reach it, its signal statistics and what it was last sent"""
+
+    __slots__ = ("addr", "via", "power", "last_seen", "controllable",
+                 "interval_level", "deadband_level", "version", "acked_version", "sent_at", "retries")
+
+    def __init__(self):
+        self.addr = None
+        self.via = None
+        self.power = PowerStats()
+        self.last_seen = None
+        self.controllable = False
+        self.interval_level = None
+        self.deadband_level = None
+        # Versions count up per device; 0 is the device's built-in default
+        self.version = 0
+        self.acked_version = 0
+        self.sent_at = None
+        self.retries = 0
+
+    def to_dict(self, controller: "DeviceController") -> dict:
+        return {
+            "controllable": self.controllable,
+            "address": f"{self.addr[0]}:{self.addr[1]}" if self.addr else None,
+            "readings": self.power.readings,
+            "mean_power_watts": self.power.mean,
+            "power_std_watts": self.power.std,
+            "config": controller.config(self) if self.version else None,
+            "acked": self.version == self.acked_version,
+            "acked_version": self.acked_version,
+            "last_seen": self.last_seen,
+        }
+
+
+class DeviceController:
+    """Adaptive reporting configs for devices: a downlink over the UDP ingest socket.
+
+    A device reports a reading once its power moves by deadband_watts from the
+    last one it reported, and at least every interval_ms otherwise. The
+    controller lengthens a device's interval by one doubling for each doubling
+    its power spread sits below the dead-band, and doubles every dead-band and
+    interval per doubling of ingest pressure; once ingest is over capacity, a
+    noisy device's dead-band also widens to its spread. The fleet so sends
+    fewer, more informative packets when ingest is busy.
+
+    Devices opt in by sending {"type": "config_ack", "device_id": ..., "version": 0}
+    at boot and acknowledge each config with its version; the reply goes to the
+    address (and socket, via) the device last sent from.
+    """
+
+    def __init__(self, min_interval_ms: int = DEVICE_MIN_INTERVAL_MS, max_interval_ms: int = DEVICE_MAX_INTERVAL_MS,
+                 min_deadband_watts: float = DEVICE_MIN_DEADBAND_WATTS,
+                 max_deadband_watts: float = DEVICE_MAX_DEADBAND_WATTS):
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.min_deadband_watts = min_deadband_watts
+        self.max_deadband_watts = max_deadband_watts
+        self.max_interval_level = math.ceil(math.log2(max(max_interval_ms / min_interval_ms, 1)))
+        self.max_deadband_level = math.ceil(math.log2(max(max_deadband_watts / min_deadband_watts, 1)))
+        self.pressure = 0.0
+        self.sent = 0
+        self.resent = 0
+        self.acks = 0
+        self.devices = {}
+        self._lock = threading.Lock()
+
+    def observe(self, message: dict, addr, via=None, now: float = None):
+        """Fold a decoded message into its device's statistics and remember where to reach the device"""
+        now = now or time.time()
+        device_id = message.get("device_id", "unknown")
+        message_type = message.get("type")
+        with self._lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceControl()
+            state.addr, state.via, state.last_seen = addr, via, now
+            if message_type == "samples":
+                for sample in message["samples"]:
+                    state.power.add(sample[1])
+            elif message_type == "energy":
+                state.power.add(message.get("power_watts", 0))
+            elif message_type == "config_ack":
+                self._acknowledge(state, int(message.get("version", 0)))
+
+    def _acknowledge(self, state: DeviceControl, version: int):
+        self.acks += 1
+        state.controllable = True
+        state.acked_version = version
+        if version != state.version:
+            # The device restarted on its defaults (or acked a stale config): resend at the next plan
+            state.sent_at = None
+            state.retries = 0
+
+    def config(self, state: DeviceControl) -> dict:
+        return {
+            "version": state.version,
+            "interval_ms": min(self.min_interval_ms << state.interval_level, self.max_interval_ms),
+            "deadband_watts": min(self.min_deadband_watts * (1 << state.deadband_level), self.max_deadband_watts),
+        }
+
+    def plan(self, pressure: float, now: float = None) -> list:
+        """Re-plan every controllable device for the current ingest pressure.
+
+        Returns (via, addr, payload) downlinks for configs that changed, or were
+        never acknowledged and are due for a resend.
+        """
+        now = now or time.time()
+        load_level = math.log2(max(pressure, 1.0))
+        downlinks = []
+        with self._lock:
+            self.pressure = pressure
+            for device_id, state in self.devices.items():
+                if not state.controllable or not state.power.warmed_up or state.addr is None:
+                    continue
+                spread = max(state.power.std, 1e-3)
+                # Once busy, noisy devices also stop reporting changes within their own spread
+                noise_level = max(math.log2(spread / self.min_deadband_watts), 0.0)
+                deadband_level = _settle(state.deadband_level, load_level + min(load_level, 1.0) * noise_level,
+                                         self.max_deadband_level)
+                # Doublings of quiet: how far the power spread sits below the dead-band
+                quiet = math.log2(self.min_deadband_watts * (1 << deadband_level) / spread)
+                interval_level = _settle(state.interval_level, max(quiet, 0.0) + load_level, self.max_interval_level)
+                if (interval_level, deadband_level) != (state.interval_level, state.deadband_level):
+                    state.interval_level, state.deadband_level = interval_level, deadband_level
+                    state.version += 1
+                    state.sent_at = None
+                    state.retries = 0
+                if state.version == 0 or state.acked_version == state.version:
+                    continue
+                if state.sent_at is not None:
+                    if state.retries >= MAX_RETRIES or now - state.sent_at < RESEND_SECONDS:
+                        continue
+                    state.retries += 1
+                    self.resent += 1
+                else:
+                    self.sent += 1
+                state.sent_at = now
+                payload = json.dumps({"type": "config", "device_id": device_id, **self.config(state)},
+                                     separators=(",", ":")).encode("utf-8")
+                downlinks.append((state.via, state.addr, payload))
+        return downlinks
+
+    def device(self, device_id: str) -> dict:
+        with self._lock:
+            state = self.devices.get(device_id)
+            return state.to_dict(self) if state else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = list(self.devices.values())
+            controllable = [state for state in states if state.controllable]
+            return {
+                "devices": len(states),
+                "controllable": len(controllable),
+                "configured": sum(1 for state in controllable if state.version),
+                "pending": sum(1 for state in controllable if state.version != state.acked_version),
+                "pressure": self.pressure,
+                "sent": self.sent,
+                "resent": self.resent,
+                "acks": self.acks,
+            }
+
+    def snapshot(self) -> dict:
+        """Controller counters and every controllable device's statistics and config"""
+        with self._lock:
+            devices = {device_id: state.to_dict(self) for device_id, state in self.devices.items() if state.controllable}
+        return {**self.stats(), "device_configs": devices}
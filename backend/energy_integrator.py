@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+# "server" integrates power over reading timestamps; "device" keeps trusting duration_hours from the payload
+ENERGY_INTEGRATION = os.getenv("ENERGY_INTEGRATION", "server")
+# Readings further apart than this are a gap: the earlier power is held for this long and no longer
+ENERGY_MAX_GAP_MS = int(os.getenv("ENERGY_MAX_GAP_MS", "60000"))
+# A device clock that steps this far (ahead of our receive clock, or back from its last reading) is re-anchored
+ENERGY_DRIFT_TOLERANCE_MS = int(os.getenv("ENERGY_DRIFT_TOLERANCE_MS", "5000"))
+
+
+class DeviceIntegral:
+    """O(1) integration state for one device: the previous reading and running counters"""
+
+    __slots__ = ("last_ts_ms", "last_power", "offset_ms", "energy_wh", "readings",
+                 "gaps", "duplicates", "late", "clock_resets")
+
+    def __init__(self):
+        self.last_ts_ms = None
+        self.last_power = None
+        # Receive time minus device time the device is trusted at; NTP-synced devices stay >= 0
+        self.offset_ms = 0
+        self.energy_wh = 0.0
+        self.readings = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.late = 0
+        self.clock_resets = 0
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class EnergyIntegrator:
+    """Per-device trapezoidal integration of power readings into energy.
+
+    Each reading adds the area between it and the device's previous reading:
+    (p0 + p1) / 2 * dt, or the previous power held for max_gap_ms when the
+    readings are further apart. Duplicate and late (older) readings add nothing.
+
+    Clock steps re-anchor the device instead of being integrated across. A step
+    back is a reading more than drift_tolerance_ms older than the last one. A
+    step forward is found with received times: a (synced, or consistently
+    offset) device never reports a time ahead of when we receive it, while
+    buffered uploads only lag behind, so a reading more than drift_tolerance_ms
+    ahead of the device's accepted offset means its clock jumped.
+    """
+
+    def __init__(self, max_gap_ms: int = ENERGY_MAX_GAP_MS, drift_tolerance_ms: int = ENERGY_DRIFT_TOLERANCE_MS):
+        self.max_gap_ms = max_gap_ms
+        self.drift_tolerance_ms = drift_tolerance_ms
+        self.devices = {}
+        self._lock = threading.Lock()
+
+    def add(self, device_id: str, ts_ms: int, power_watts: float, received_ms: int = None) -> tuple:
+        """Integrate one reading; returns (energy_wh, duration_ms, started) since the device's previous reading.
+
+        started is True when there was no previous reading to integrate from (first
+        reading or clock reset), as opposed to a duplicate or late one.
+        """
+        with self._lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceIntegral()
+            return self._add(state, ts_ms, power_watts, received_ms)
+
+    def add_many(self, device_id: str, samples, received_ms: int = None) -> tuple:
+        """Integrate (ts_ms, power_watts, ...) readings in order; returns their total (energy_wh, duration_ms)"""
+        energy_wh = 0.0
+        duration_ms = 0
+        with self._lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceIntegral()
+            # Only the newest reading is compared against the receive clock
+            last = len(samples) - 1
+            for i, sample in enumerate(samples):
+                added_wh, added_ms, _ = self._add(state, sample[0], sample[1], received_ms if i == last else None)
+                energy_wh += added_wh
+                duration_ms += added_ms
+        return energy_wh, duration_ms
+
+    def _add(self, state: DeviceIntegral, ts_ms: int, power_watts: float, received_ms: int = None) -> tuple:
+        state.readings += 1
+        if received_ms is not None:
+            offset = received_ms - ts_ms
+            if offset < state.offset_ms - self.drift_tolerance_ms:
+                # Device clock is (now) ahead of ours: trust the new offset and start again from this reading
+                state.offset_ms = offset
+                if state.last_ts_ms is not None:
+                    return self._reanchor(state, ts_ms, power_watts)
+
+        if state.last_ts_ms is None:
+            state.last_ts_ms, state.last_power = ts_ms, power_watts
+            return 0.0, 0, True
+        dt_ms = ts_ms - state.last_ts_ms
+        if dt_ms == 0:
+            state.duplicates += 1
+            return 0.0, 0, False
+        if dt_ms < -self.drift_tolerance_ms:
+            # Device clock stepped back
+            if received_ms is not None:
+                state.offset_ms = min(received_ms - ts_ms, 0)
+            return self._reanchor(state, ts_ms, power_watts)
+        if dt_ms < 0:
+            state.late += 1
+            return 0.0, 0, False
+        if dt_ms > self.max_gap_ms:
+            state.gaps += 1
+            dt_ms = self.max_gap_ms
+            energy_wh = state.last_power * dt_ms / 3_600_000
+        else:
+            energy_wh = (state.last_power + power_watts) / 2 * dt_ms / 3_600_000
+        state.last_ts_ms, state.last_power = ts_ms, power_watts
+        state.energy_wh += energy_wh
+        return energy_wh, dt_ms, False
+
+    @staticmethod
+    def _reanchor(state: DeviceIntegral, ts_ms: int, power_watts: float) -> tuple:
+        state.clock_resets += 1
+        state.last_ts_ms, state.last_power = ts_ms, power_watts
+        return 0.0, 0, True
+
+    def device(self, device_id: str) -> dict:
+        with self._lock:
+            state = self.devices.get(device_id)
+            return state.to_dict() if state else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = list(self.devices.values())
+        return {
+            "devices": len(states),
+            "readings": sum(state.readings for state in states),
+            "gaps": sum(state.gaps for state in states),
+            "duplicates": sum(state.duplicates for state in states),
+            "late": sum(state.late for state in states),
+            "clock_resets": sum(state.clock_resets for state in states),
+        }
+
+
+def integrate_series(timestamps_ms, power_watts, device_ids=None, max_gap_ms: int = ENERGY_MAX_GAP_MS) -> dict:
+    """Vectorized trapezoidal integration of historical readings, with the same gap rule as EnergyIntegrator.
+
+    Readings are sorted by (device, timestamp); returns per-reading interval energy
+    (the area ending at each reading, in input order; 0 for duplicates) and per-device totals.
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    power_watts = np.asarray(power_watts, dtype=np.float64)
+    if device_ids is None:
+        device_ids = np.zeros(len(timestamps_ms), dtype=np.int64)
+    devices, device_index = np.unique(np.asarray(device_ids), return_inverse=True)
+
+    # Stable sort, so of several readings with the same timestamp the first one given is kept
+    order = np.lexsort((timestamps_ms, device_index))
+    device = device_index[order]
+    repeated = np.zeros(len(order), dtype=bool)
+    repeated[1:] = (device[1:] == device[:-1]) & (np.diff(timestamps_ms[order]) == 0)
+    kept = order[~repeated]
+
+    ts = timestamps_ms[kept]
+    power = power_watts[kept]
+    device = device_index[kept]
+    dt = np.diff(ts)
+    same_device = device[1:] == device[:-1]
+    gap = same_device & (dt > max_gap_ms)
+    held = np.minimum(dt, max_gap_ms)
+    area = np.where(gap, power[:-1] * held, (power[:-1] + power[1:]) / 2 * dt)
+    # Device boundaries are not intervals
+    interval_wh = np.zeros(len(ts))
+    interval_wh[1:] = np.where(same_device, area, 0.0) / 3_600_000
+    interval_ms = np.zeros(len(ts), dtype=np.int64)
+    interval_ms[1:] = np.where(same_device, held, 0)
+
+    energy_wh = np.zeros(len(timestamps_ms))
+    energy_wh[kept] = interval_wh
+    duration_ms = np.zeros(len(timestamps_ms), dtype=np.int64)
+    duration_ms[kept] = interval_ms
+    return {
+        "energy_wh": energy_wh,
+        "duration_ms": duration_ms,
+        "devices": devices,
+        "device_energy_wh": np.bincount(device, weights=interval_wh, minlength=len(devices)),
+        "device_duration_ms": np.bincount(device, weights=interval_ms, minlength=len(devices)),
+        "gaps": np.bincount(device[1:][gap], minlength=len(devices)),
+        "duplicates": np.bincount(device_index[order][repeated], minlength=len(devices)),
+    }
+
+
+def reintegrate_samples(db_path: str, device_id: str, start_ms: int, end_ms: int,
+                        max_gap_ms: int = ENERGY_MAX_GAP_MS) -> dict:
+    """Recompute one device's energy from its stored raw samples in [start_ms, end_ms)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        frame = pd.read_sql_query(
+            "SELECT ts_ms, power_watts FROM sensor_samples WHERE device_id = ? AND ts_ms >= ? AND ts_ms < ? ORDER BY ts_ms",
+            conn, params=(device_id, start_ms, end_ms),
+        )
+    finally:
+        conn.close()
+    result = integrate_series(frame["ts_ms"].to_numpy(), frame["power_watts"].to_numpy(), max_gap_ms=max_gap_ms)
+    energy_wh = float(result["device_energy_wh"].sum())
+    duration_ms = int(result["device_duration_ms"].sum())
+    return {
+        "device_id": device_id,
+        "start_ms": start_ms,
+        "end_ms": end_ms,
+        "samples": len(frame),
+        "energy_wh": energy_wh,
+        "energy_kwh": energy_wh / 1000,
+        "covered_hours": duration_ms / 3_600_000,
+        "avg_power_watts": energy_wh * 3_600_000 / duration_ms if duration_ms else 0.0,
+        "gaps": int(result["gaps"].sum()),
+        "duplicates": int(result["duplicates"].sum()),
+        "max_gap_ms": max_gap_ms,
+    }
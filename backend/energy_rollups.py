@@ -0,0 +1,115 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import log_filters
+
+ROLLUP_INTERVALS = ("hour", "day", "week", "month")
+
+# SQLite pre-aggregates into 15 minute UTC slots; every real UTC offset is a
+# multiple of 15 minutes, so slots never straddle a local bucket boundary.
+SLOT_SECONDS = 900
+# Length of a bare YYYY-MM-DD value, as written by the energy log API and UDP ingest
+DATE_ONLY_LENGTH = 10
+
+
+def bucket_start(moment: datetime, interval: str) -> datetime:
+    """Truncate a local datetime to the start of its rollup bucket"""
+    if interval == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "day":
+        return day
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def query_slots(db_path: str, start_date: str = None, end_date: str = None,
+                device_id: str = None, user_id: str = None) -> list:
+    """Aggregate energy rows into 15 minute UTC slots, or per calendar day for rows that store only a date.
+
+    Each row is (local_day, slot, ...totals) with exactly one of local_day and slot set.
+    """
+    conditions, params = log_filters.owner_filters(device_id, user_id)
+    conditions.append("date IS NOT NULL")
+    # Widen the date filter by a day on each side so that rows near the
+    # edges survive until they are placed in the requested time zone.
+    if start_date:
+        conditions.append("date >= date(?, '-1 day')")
+        params.append(start_date)
+    if end_date:
+        conditions.append("date < date(?, '+2 day')")
+        params.append(end_date)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT
+            CASE WHEN length(date) = {DATE_ONLY_LENGTH} THEN date END AS local_day,
+            CASE WHEN length(date) = {DATE_ONLY_LENGTH} THEN NULL
+                 ELSE CAST(strftime('%s', date) AS INTEGER) / {SLOT_SECONDS} END AS slot,
+            SUM(energy_kwh),
+            SUM(co2_emissions_kg),
+            SUM(COALESCE(cost_rupees, 0)),
+            COUNT(*),
+            MIN(power_consumption_watts),
+            MAX(power_consumption_watts),
+            SUM(power_consumption_watts)
+        FROM energy_consumption
+        {log_filters.where_clause(conditions)}
+        GROUP BY local_day, slot
+        HAVING local_day IS NOT NULL OR slot IS NOT NULL
+    """, params)
+    slots = cursor.fetchall()
+    conn.close()
+    return slots
+
+
+def rollup_energy(db_path: str, interval: str = "day", tz_name: str = "UTC",
+                  start_date: str = None, end_date: str = None, device_id: str = None, user_id: str = None) -> list:
+    """Return time-bucketed energy totals in the requested time zone"""
+    tz = ZoneInfo(tz_name)
+    range_start = datetime.fromisoformat(start_date).replace(tzinfo=tz) if start_date else None
+    range_end = datetime.fromisoformat(end_date).replace(tzinfo=tz) + timedelta(days=1) if end_date else None
+
+    buckets = {}
+    for local_day, slot, energy, co2, cost, count, min_power, max_power, sum_power in query_slots(
+            db_path, start_date, end_date, device_id, user_id):
+        if local_day is not None:
+            # A bare date is a calendar day where the reading was taken, not a UTC instant
+            try:
+                moment = datetime.fromisoformat(local_day).replace(tzinfo=tz)
+            except ValueError:
+                continue
+        else:
+            # Stored timestamps without an offset are treated as UTC
+            moment = datetime.fromtimestamp(slot * SLOT_SECONDS, timezone.utc).astimezone(tz)
+        if (range_start and moment < range_start) or (range_end and moment >= range_end):
+            continue
+        key = bucket_start(moment, interval)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [energy, co2, cost, count, min_power, max_power, sum_power]
+        else:
+            bucket[0] += energy
+            bucket[1] += co2
+            bucket[2] += cost
+            bucket[3] += count
+            bucket[4] = min(bucket[4], min_power)
+            bucket[5] = max(bucket[5], max_power)
+            bucket[6] += sum_power
+
+    return [
+        {
+            "bucket_start": key.isoformat(),
+            "energy_kwh": energy,
+            "co2_emissions_kg": co2,
+            "cost_rupees": cost,
+            "readings": count,
+            "min_power_watts": min_power,
+            "max_power_watts": max_power,
+            "avg_power_watts": sum_power / count if count else 0,
+        }
+        for key, (energy, co2, cost, count, min_power, max_power, sum_power) in sorted(buckets.items())
+    ]
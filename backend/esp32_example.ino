@@ -21,6 +21,8 @@
 #include <WiFi.h>
 #include <WiFiUdp.h>
 #include <ArduinoJson.h>
+#include <time.h>
+#include <sys/time.h>
 
 // WiFi credentials
 const char* ssid = "YOUR_WIFI_SSID";
@@ -49,6 +51,35 @@ bool bulbOn = false;
 // UDP
 WiFiUDP udp;
 
+// Binary sample packets (see backend/packet_codec.py): readings are batched
+// and delta-encoded, 6 bytes each instead of a JSON document per reading
+const bool USE_BINARY_PACKETS = true;
+const char* DEVICE_ID = "esp32_001";
+const uint16_t SAMPLE_PERIOD_MS = 1000;
+const int SAMPLES_PER_PACKET = 30;
+
+struct Sample {
+  uint64_t tsMs;
+  int32_t powerDeciWatts;
+  int32_t currentMilliAmps;
+};
+Sample sampleBuffer[SAMPLES_PER_PACKET];
+int bufferedSamples = 0;
+uint32_t packetSeq = 0;
+// A partly filled packet is sent once its first reading is this old
+const uint32_t MAX_BATCH_AGE_MS = 60000;
+
+// Adaptive reporting (see backend/device_control.py): the server sends
+// {"type":"config","interval_ms":...,"deadband_watts":...,"version":...}.
+// A reading is buffered once power moves by reportDeadbandWatts from the last
+// one buffered, or reportIntervalMs after it otherwise.
+uint32_t reportIntervalMs = SAMPLE_PERIOD_MS;
+float reportDeadbandWatts = 0.0;
+uint32_t configVersion = 0;
+float lastReportedPower = 0.0;
+unsigned long lastReportMs = 0;
+bool reportedOnce = false;
+
 void setup() {
   Serial.begin(115200);
   
@@ -69,6 +100,10 @@ void setup() {
   
   // Start UDP
   udp.begin(serverPort);
+  sendConfigAck();  // Version 0: running on defaults, ready for configs
+  
+  // Wall-clock time for sample timestamps (IST)
+  configTime(19800, 0, "pool.ntp.org");
   
   Serial.println("ESP32 Carbon Footprint Monitor Ready!");
   Serial.println("Commands:");
@@ -78,6 +113,8 @@ void setup() {
 }
 
 void loop() {
+  checkForConfig();
+  
   // Check for serial commands
   if (Serial.available()) {
     String command = Serial.readString();
@@ -117,6 +154,9 @@ void stopMonitoring() {
     digitalWrite(RELAY_PIN, LOW);   // Turn off bulb
     bulbOn = false;
     duration = millis() - startTime;
+    if (USE_BINARY_PACKETS) {
+      sendSampleBatch();  // Flush readings not yet sent
+    }
     
     // Calculate total energy consumption
     float totalEnergy = (power * duration) / (1000.0 * 3600.0);  // Convert to kWh
@@ -161,6 +201,114 @@ void measureCurrent() {
   
   // Print current measurement
   Serial.printf("Current: %.3f A, Power: %.2f W\n", current, power);
+  
+  if (USE_BINARY_PACKETS && shouldReport(power)) {
+    bufferSample(current, power);
+  }
+}
+
+bool shouldReport(float powerWatts) {
+  unsigned long now = millis();
+  if (reportedOnce && fabsf(powerWatts - lastReportedPower) < reportDeadbandWatts &&
+      now - lastReportMs < reportIntervalMs) {
+    return false;
+  }
+  reportedOnce = true;
+  lastReportedPower = powerWatts;
+  lastReportMs = now;
+  return true;
+}
+
+void checkForConfig() {
+  int size = udp.parsePacket();
+  if (size <= 0) return;
+  char buffer[256];
+  int n = udp.read(buffer, sizeof(buffer) - 1);
+  if (n <= 0) return;
+  buffer[n] = '\0';
+  
+  StaticJsonDocument<256> doc;
+  if (deserializeJson(doc, buffer) || strcmp(doc["type"] | "", "config") != 0) return;
+  reportIntervalMs = doc["interval_ms"] | reportIntervalMs;
+  reportDeadbandWatts = doc["deadband_watts"] | reportDeadbandWatts;
+  configVersion = doc["version"] | configVersion;
+  Serial.printf("Config %u: report every %u ms or on %.2f W change\n",
+                configVersion, reportIntervalMs, reportDeadbandWatts);
+  sendConfigAck();
+}
+
+void sendConfigAck() {
+  StaticJsonDocument<128> doc;
+  doc["type"] = "config_ack";
+  doc["device_id"] = DEVICE_ID;
+  doc["version"] = configVersion;
+  
+  String jsonString;
+  serializeJson(doc, jsonString);
+  udp.beginPacket(serverIP, serverPort);
+  udp.write((uint8_t*)jsonString.c_str(), jsonString.length());
+  udp.endPacket();
+}
+
+uint64_t epochMillis() {
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  return (uint64_t)tv.tv_sec * 1000 + tv.tv_usec / 1000;
+}
+
+void bufferSample(float currentAmps, float powerWatts) {
+  Sample s = {epochMillis(), (int32_t)lroundf(powerWatts * 10), (int32_t)lroundf(currentAmps * 1000)};
+  if (bufferedSamples > 0) {
+    // Start a new packet if a delta would overflow its 16-bit field, or the buffered readings are getting old
+    Sample& prev = sampleBuffer[bufferedSamples - 1];
+    if (s.tsMs - sampleBuffer[0].tsMs >= MAX_BATCH_AGE_MS || s.tsMs - prev.tsMs > 0xFFFF || abs(s.powerDeciWatts - prev.powerDeciWatts) > 32767 ||
+        abs(s.currentMilliAmps - prev.currentMilliAmps) > 32767) {
+      sendSampleBatch();
+    }
+  }
+  sampleBuffer[bufferedSamples++] = s;
+  if (bufferedSamples == SAMPLES_PER_PACKET) {
+    sendSampleBatch();
+  }
+}
+
+void sendSampleBatch() {
+  if (bufferedSamples == 0) return;
+  uint8_t packet[1024];
+  size_t idLength = strlen(DEVICE_ID);
+  size_t n = 0;
+  
+  // Header: magic, version, device id length, seq, first timestamp, period, count (little-endian)
+  packet[n++] = 0xCF;
+  packet[n++] = 0xB1;
+  packet[n++] = 1;
+  packet[n++] = (uint8_t)idLength;
+  memcpy(packet + n, &packetSeq, 4); n += 4;
+  memcpy(packet + n, &sampleBuffer[0].tsMs, 8); n += 8;
+  memcpy(packet + n, &SAMPLE_PERIOD_MS, 2); n += 2;
+  uint16_t count = bufferedSamples;
+  memcpy(packet + n, &count, 2); n += 2;
+  memcpy(packet + n, DEVICE_ID, idLength); n += idLength;
+  
+  // First reading in full, the rest as deltas from the previous reading
+  memcpy(packet + n, &sampleBuffer[0].powerDeciWatts, 4); n += 4;
+  memcpy(packet + n, &sampleBuffer[0].currentMilliAmps, 4); n += 4;
+  for (int i = 1; i < bufferedSamples; i++) {
+    uint16_t dt = sampleBuffer[i].tsMs - sampleBuffer[i - 1].tsMs;
+    int16_t dp = sampleBuffer[i].powerDeciWatts - sampleBuffer[i - 1].powerDeciWatts;
+    int16_t dc = sampleBuffer[i].currentMilliAmps - sampleBuffer[i - 1].currentMilliAmps;
+    memcpy(packet + n, &dt, 2); n += 2;
+    memcpy(packet + n, &dp, 2); n += 2;
+    memcpy(packet + n, &dc, 2); n += 2;
+  }
+  
+  udp.beginPacket(serverIP, serverPort);
+  udp.write(packet, n);
+  udp.endPacket();
+  
+  Serial.printf("Sent %d samples in %u bytes (seq %u)\n", bufferedSamples, (unsigned)n, packetSeq);
+  packetSeq++;
+  bufferedSamples = 0;
 }
 
 void sendEnergyData(float powerWatts, float durationHours, float energyKwh) {
@@ -230,6 +378,13 @@ String getCurrentTimestamp() {
  *   "timestamp": "2024-01-15T14:30:00"
  * }
  * 
+ * Config acknowledgement (at boot with version 0, then for each config received):
+ * {
+ *   "type": "config_ack",
+ *   "device_id": "esp32_001",
+ *   "version": 3
+ * }
+ * 
  * Status:
  * {
  *   "type": "status",
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import deque
+
+# Sequence numbers remembered per device for duplicate / late-arrival detection
+SEQUENCE_WINDOW = 1024
+# Throughput is averaged over this many seconds
+RATE_WINDOW_SECONDS = 60
+
+_SEQ_MODULUS = 2 ** 32
+
+
+class DeviceSequence:
+    """Sequence-number bookkeeping for one device's packets"""
+
+    def __init__(self, seq: int, now: float):
+        self.highest = seq
+        self.packets = 1
+        self.missing = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.resets = 0
+        self.last_seen = now
+        self._recent = {seq}
+        self._order = deque([seq])
+
+    def observe(self, seq: int, now: float):
+        self.packets += 1
+        self.last_seen = now
+        ahead = (seq - self.highest) % _SEQ_MODULUS
+        if seq in self._recent:
+            self.duplicates += 1
+            return
+        if 0 < ahead < _SEQ_MODULUS // 2 and ahead <= SEQUENCE_WINDOW * 64:
+            # Newer packet (wrapping at 2^32); anything skipped is missing until it shows up
+            self.missing += ahead - 1
+            self.highest = seq
+        elif (self.highest - seq) % _SEQ_MODULUS <= SEQUENCE_WINDOW:
+            # Older packet we had counted as missing
+            self.out_of_order += 1
+            self.missing = max(self.missing - 1, 0)
+        else:
+            # Far outside the window: the device restarted its counter
+            self.resets += 1
+            self.highest = seq
+            self._recent.clear()
+            self._order.clear()
+        self._recent.add(seq)
+        self._order.append(seq)
+        if len(self._order) > SEQUENCE_WINDOW:
+            self._recent.discard(self._order.popleft())
+
+    def to_dict(self) -> dict:
+        return {
+            "packets": self.packets,
+            "last_seq": self.highest,
+            "missing": self.missing,
+            "duplicates": self.duplicates,
+            "out_of_order": self.out_of_order,
+            "resets": self.resets,
+            "loss_ratio": self.missing / (self.packets + self.missing) if self.packets + self.missing else 0.0,
+            "last_seen": self.last_seen,
+        }
+
+
+class IngestMetrics:
+    """Thread-safe counters for the UDP ingest: datagram rate, decode errors and per-device sequence health"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.datagrams = 0
+        self.decode_errors = 0
+        self.receive_dropped = 0
+        self.devices = {}
+        self._per_second = deque()
+        self._lock = threading.Lock()
+
+    def record_datagram(self, count: int = 1, now: float = None):
+        now = now or time.time()
+        second = int(now)
+        with self._lock:
+            self.datagrams += count
+            if self._per_second and self._per_second[-1][0] == second:
+                self._per_second[-1][1] += count
+            else:
+                self._per_second.append([second, count])
+            while self._per_second and self._per_second[0][0] <= second - RATE_WINDOW_SECONDS:
+                self._per_second.popleft()
+
+    def record_decode_error(self, count: int = 1):
+        with self._lock:
+            self.decode_errors += count
+
+    def record_receive_drop(self, count: int = 1):
+        """Datagrams received but dropped because the decode stage was full"""
+        with self._lock:
+            self.receive_dropped += count
+
+    def record_sequence(self, device_id: str, seq: int, now: float = None):
+        now = now or time.time()
+        with self._lock:
+            device = self.devices.get(device_id)
+            if device is None:
+                self.devices[device_id] = DeviceSequence(seq, now)
+            else:
+                device.observe(seq, now)
+
+    def observe_message(self, message: dict):
+        """Record a decoded message's sequence number, if its format carries one"""
+        if message.get("seq") is not None:
+            self.record_sequence(message.get("device_id", "unknown"), message["seq"])
+
+    def packets_per_second(self, now: float = None) -> float:
+        now = now or time.time()
+        with self._lock:
+            window = min(RATE_WINDOW_SECONDS, max(now - self.started, 1.0))
+            recent = sum(count for second, count in self._per_second if second > now - window)
+        return recent / window
+
+    def snapshot(self) -> dict:
+        rate = self.packets_per_second()
+        with self._lock:
+            devices = {device_id: device.to_dict() for device_id, device in self.devices.items()}
+            datagrams, decode_errors, receive_dropped = self.datagrams, self.decode_errors, self.receive_dropped
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "datagrams": datagrams,
+            "packets_per_second": rate,
+            "decode_errors": decode_errors,
+            "receive_dropped": receive_dropped,
+            "sequenced_devices": len(devices),
+            "missing": sum(device["missing"] for device in devices.values()),
+            "duplicates": sum(device["duplicates"] for device in devices.values()),
+            "out_of_order": sum(device["out_of_order"] for device in devices.values()),
+            "devices": devices,
+        }
@@ -0,0 +1,88 @@
+import sqlite3
+from typing import Dict
+
+import anomaly_detector
+import sample_store
+
+
+def add_missing_columns(cursor, table: str, columns: Dict[str, str]):
+    """Add any columns missing from an existing table"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, column_type in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def ensure_ingest_tables(cursor):
+    """Create or migrate every table device ingest writes to, for the API and the standalone receivers alike"""
+    # Commute logs table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS commute_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            transport_mode TEXT NOT NULL,
+            distance_km REAL NOT NULL,
+            co2_emissions_kg REAL NOT NULL,
+            device_id TEXT,
+            user_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Energy consumption table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS energy_consumption (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            power_consumption_watts REAL NOT NULL,
+            duration_hours REAL NOT NULL,
+            energy_kwh REAL NOT NULL,
+            co2_emissions_kg REAL NOT NULL,
+            electricity_board TEXT,
+            price_per_kwh REAL,
+            cost_rupees REAL,
+            device_id TEXT,
+            user_id TEXT,
+            tariff_version TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Bring databases created by older versions up to the current columns
+    add_missing_columns(cursor, "commute_logs", {
+        "device_id": "TEXT",
+        "user_id": "TEXT"
+    })
+    add_missing_columns(cursor, "energy_consumption", {
+        "electricity_board": "TEXT",
+        "price_per_kwh": "REAL",
+        "cost_rupees": "REAL",
+        "device_id": "TEXT",
+        "user_id": "TEXT",
+        "tariff_version": "TEXT"
+    })
+
+    # Raw per-device sensor samples and their rollups
+    sample_store.ensure_sample_tables(cursor)
+
+    # Spikes, stuck sensors and dropouts flagged during UDP ingest
+    anomaly_detector.ensure_anomaly_table(cursor)
+
+    # Date index for range filters and time-bucketed rollups
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_energy_consumption_date ON energy_consumption(date)")
+
+    # Per-device and per-user indexes so one household's queries only scan its own rows
+    for table in ("commute_logs", "energy_consumption"):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_device_date ON {table}(device_id, date)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_date ON {table}(user_id, date)")
+
+
+def init_ingest_db(db_path: str):
+    """Prepare a database for a receiver running without the API"""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_ingest_tables(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
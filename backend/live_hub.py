@@ -0,0 +1,239 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+# Events each subscriber may have waiting; a slow client loses the oldest ones
+LIVE_SUBSCRIBER_BUFFER = int(os.getenv("LIVE_SUBSCRIBER_BUFFER", "1000"))
+# Rolling aggregates cover this many seconds and are pushed this often
+LIVE_AGGREGATE_WINDOW_SECONDS = float(os.getenv("LIVE_AGGREGATE_WINDOW_SECONDS", "60"))
+LIVE_AGGREGATE_INTERVAL_SECONDS = float(os.getenv("LIVE_AGGREGATE_INTERVAL_SECONDS", "1"))
+# Idle streams get a keep-alive this often so proxies don't close them
+LIVE_KEEPALIVE_SECONDS = 15
+
+
+def parse_devices(device_id: str = None):
+    """Comma-separated device ids from a query string, or None for every device"""
+    if not device_id:
+        return None
+    return {device for device in (part.strip() for part in device_id.split(",")) if device}
+
+
+class Subscription:
+    """One client's ring buffer of pending events, optionally limited to some devices"""
+
+    def __init__(self, devices=None, buffer_size: int = LIVE_SUBSCRIBER_BUFFER):
+        self.devices = frozenset(devices) if devices else None
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def wants(self, device_id: str) -> bool:
+        return self.devices is None or device_id in self.devices
+
+    async def next_events(self, timeout: float = None) -> list:
+        """Wait for events and take everything buffered; [] on timeout or once the hub stops"""
+        if not self.buffer and not self.closed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self.ready.clear()
+        # popleft is atomic, so readings published from other threads meanwhile are never lost
+        events = []
+        while self.buffer:
+            events.append(self.buffer.popleft())
+        return events
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class DeviceWindow:
+    """Running sums over the readings a device sent in the last window_seconds"""
+
+    def __init__(self, window_seconds: float):
+        self.window = window_seconds
+        self.readings = deque()
+        self.energy_kwh = 0.0
+        self.power_sum = 0.0
+        self.last_power_watts = None
+        self.last_seen = None
+
+    def add(self, now: float, power_watts: float, energy_kwh: float):
+        self.readings.append((now, power_watts, energy_kwh))
+        self.power_sum += power_watts
+        self.energy_kwh += energy_kwh
+        self.last_power_watts = power_watts
+        self.last_seen = now
+
+    def expire(self, now: float):
+        while self.readings and self.readings[0][0] <= now - self.window:
+            _, power_watts, energy_kwh = self.readings.popleft()
+            self.power_sum -= power_watts
+            self.energy_kwh -= energy_kwh
+
+    def summary(self, device_id: str) -> dict:
+        count = len(self.readings)
+        return {
+            "type": "aggregate",
+            "device_id": device_id,
+            "window_seconds": self.window,
+            "readings": count,
+            "energy_kwh": max(self.energy_kwh, 0.0),
+            "avg_power_watts": self.power_sum / count if count else 0.0,
+            "last_power_watts": self.last_power_watts,
+            "last_seen": self.last_seen,
+        }
+
+
+class LiveHub:
+    """Publish/subscribe fan-out of new readings and per-device rolling aggregates.
+
+    publish_reading() may be called from any thread; subscribers are consumed on the
+    event loop the hub was started on (WebSocket and SSE handlers).
+    """
+
+    def __init__(self, buffer_size: int = LIVE_SUBSCRIBER_BUFFER,
+                 window_seconds: float = LIVE_AGGREGATE_WINDOW_SECONDS,
+                 aggregate_interval: float = LIVE_AGGREGATE_INTERVAL_SECONDS):
+        self.buffer_size = buffer_size
+        self.window_seconds = window_seconds
+        self.aggregate_interval = aggregate_interval
+        self.published = 0
+        self._subscribers = set()
+        self._windows = {}
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread = None
+        self._wake_pending = False
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.create_task(self._aggregate_loop())
+
+    async def stop(self):
+        """Stop pushing aggregates and release every waiting subscriber"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.closed = True
+            subscription.ready.set()
+
+    def subscribe(self, devices=None) -> Subscription:
+        subscription = Subscription(devices, self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            # Start the client with the current aggregates for what it follows
+            for device_id, window in self._windows.items():
+                if subscription.wants(device_id):
+                    subscription.buffer.append(window.summary(device_id))
+        if subscription.buffer:
+            subscription.ready.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish_reading(self, device_id: str, power_watts: float, energy_kwh: float, source: str,
+                        **fields):
+        """Push a new reading to subscribers and fold it into the device's rolling window"""
+        now = time.time()
+        event = {
+            "type": "reading",
+            "device_id": device_id,
+            "ts_ms": int(now * 1000),
+            "power_watts": power_watts,
+            "energy_kwh": energy_kwh,
+            "source": source,
+            **fields,
+        }
+        with self._lock:
+            window = self._windows.get(device_id)
+            if window is None:
+                window = self._windows[device_id] = DeviceWindow(self.window_seconds)
+            window.add(now, power_watts, energy_kwh)
+            self._changed.add(device_id)
+            self._fan_out(event, device_id)
+
+    def publish_event(self, event: dict):
+        """Push another kind of per-device event (e.g. an anomaly) to subscribers as-is"""
+        with self._lock:
+            self._fan_out(event, event["device_id"])
+
+    def _fan_out(self, event: dict, device_id: str):
+        """Append an event to every interested ring buffer (lock held) and wake their readers"""
+        delivered = False
+        for subscription in self._subscribers:
+            if subscription.wants(device_id):
+                if len(subscription.buffer) == subscription.buffer.maxlen:
+                    subscription.dropped += 1
+                subscription.buffer.append(event)
+                delivered = True
+        self.published += 1
+        if delivered and self._loop is not None and not self._wake_pending:
+            self._wake_pending = True
+            if threading.get_ident() == self._loop_thread:
+                self._loop.call_soon(self._wake)
+            else:
+                self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        with self._lock:
+            self._wake_pending = False
+            subscribers = [subscription for subscription in self._subscribers if subscription.buffer]
+        for subscription in subscribers:
+            subscription.ready.set()
+
+    async def _aggregate_loop(self):
+        while True:
+            await asyncio.sleep(self.aggregate_interval)
+            self.push_aggregates()
+
+    def push_aggregates(self, now: float = None):
+        """Send the rolling aggregates of devices that changed (or emptied) since the last push"""
+        now = now or time.time()
+        with self._lock:
+            for device_id, window in list(self._windows.items()):
+                before = len(window.readings)
+                window.expire(now)
+                if len(window.readings) != before:
+                    self._changed.add(device_id)
+                if not window.readings and now - window.last_seen > self.window_seconds * 2:
+                    # Quiet devices are forgotten; their last aggregate already showed zero readings
+                    del self._windows[device_id]
+                    self._changed.discard(device_id)
+            changed, self._changed = self._changed, set()
+            for device_id in changed:
+                self._fan_out(self._windows[device_id].summary(device_id), device_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "subscribers": len(self._subscribers),
+                "devices": len(self._windows),
+                "published": self.published,
+                "buffered": sum(len(subscription.buffer) for subscription in self._subscribers),
+            }
@@ -0,0 +1,411 @@
+"""Simulated ESP32 fleet for benchmarking UDP ingest.
+
+Runs a UDPServer in a child process on localhost, drives it with N simulated
+devices (or a recorded capture replayed at any speed) and reports sustained
+throughput, loss and send-to-commit latency percentiles.
+
+    python load_generator.py --devices 500 --rate 2 --format binary --duration 30
+    python load_generator.py --devices 50 --format mixed --record capture.ndjson
+    python load_generator.py --replay capture.pcap --speed 20
+    python load_generator.py --devices 200 --format binary --spike-rate 0.001
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import ingest_schema
+import packet_codec
+import udp_server
+from batch_writer import percentile
+
+FORMATS = ("json", "csv", "binary")
+LOCALHOST = ("127.0.0.1", 0)
+
+# libpcap link types with a fixed-size header in front of the IPv4 packet
+_PCAP_LINK_HEADERS = {0: 4, 1: 14, 101: 0, 113: 16, 228: 0, 276: 20}
+
+
+# Every message produces exactly one energy_consumption row; latency and loss are measured on those rows.
+# A device's rows are committed in the order its datagrams were sent, so rows are matched by device id
+# (server-side energy integration makes the other columns depend on receive time).
+def row_key(row) -> str:
+    """The device id of an energy_consumption row (ENERGY_INSERT_SQL order)"""
+    return row[5]
+
+
+def expected_key(payload: bytes, addr=LOCALHOST):
+    """The key of the energy row the server will write for this datagram, or None if it writes none"""
+    try:
+        rows = udp_server.decode_rows(payload, addr)
+    except Exception:
+        return None
+    for kind, row in rows:
+        if udp_server.INSERT_STATEMENTS[kind] == udp_server.ENERGY_INSERT_SQL:
+            return row_key(row)
+    return None
+
+
+class SimulatedDevice:
+    """One ESP32 reporting a wandering power draw in JSON, CSV or binary sample packets"""
+
+    def __init__(self, index: int, fmt: str, interval_seconds: float, samples_per_packet: int, rng: random.Random,
+                 spike_rate: float = 0.0):
+        self.device_id = f"sim_{index:05d}"
+        self.format = fmt
+        self.interval = interval_seconds
+        self.samples_per_packet = samples_per_packet
+        self.rng = rng
+        self.power = rng.uniform(5, 1500)
+        self.seq = rng.randrange(0, 2 ** 32)
+        self.energy_wh = 0.0
+        self.spike_rate = spike_rate
+        self.spikes = 0
+
+    def _next_power(self) -> float:
+        self.power = min(max(self.power + self.rng.gauss(0, self.power * 0.02 + 0.5), 0.0), 3000.0)
+        if self.spike_rate and self.rng.random() < self.spike_rate:
+            # An injected spike for the anomaly detector; the draw itself carries on wandering
+            self.spikes += 1
+            return self.power * 3 + 50
+        return self.power
+
+    def payloads(self, now: float) -> list:
+        """The datagrams this device sends at time now"""
+        if self.format == "json":
+            # The esp32_example.ino energy message
+            power = round(self._next_power(), 3)
+            duration_hours = self.interval / 3600
+            message = {
+                "type": "energy",
+                "device_id": self.device_id,
+                "power_watts": power,
+                "duration_hours": duration_hours,
+                "energy_kwh": power * duration_hours / 1000,
+                "timestamp": datetime.fromtimestamp(now).isoformat(),
+            }
+            return [json.dumps(message).encode("utf-8")]
+        if self.format == "csv":
+            # The "Current,Power,Energy,Cost" line; the server attributes it to the sender address
+            power = self._next_power()
+            self.energy_wh += power * self.interval / 3600
+            return [f"{power / 230:.3f},{power:.2f},{self.energy_wh:.4f},{self.energy_wh * 0.008:.4f}".encode("utf-8")]
+        # Binary: samples_per_packet readings spread over the reporting interval, ending now
+        period_ms = max(int(self.interval * 1000 / self.samples_per_packet), 1)
+        end_ms = int(now * 1000)
+        samples = []
+        for i in range(self.samples_per_packet):
+            power = self._next_power()
+            samples.append((end_ms - (self.samples_per_packet - 1 - i) * period_ms, power, power / 230))
+        packets = packet_codec.encode_samples(self.device_id, samples, seq=self.seq, period_ms=period_ms)
+        self.seq = (self.seq + len(packets)) % 2 ** 32
+        return packets
+
+
+def read_capture(path: str, port: int = None) -> list:
+    """Load (offset_seconds, payload) pairs from a --record NDJSON capture or a libpcap file of UDP datagrams"""
+    with open(path, "rb") as capture:
+        head = capture.read(4)
+    if head in (b"\xd4\xc3\xb2\xa1", b"\xa1\xb2\xc3\xd4", b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d"):
+        return _read_pcap(path, port)
+    packets = []
+    with open(path, "r", encoding="utf-8") as capture:
+        for line in capture:
+            if line.strip():
+                entry = json.loads(line)
+                packets.append((entry["t"], base64.b64decode(entry["data"])))
+    return packets
+
+
+def _read_pcap(path: str, port: int = None) -> list:
+    with open(path, "rb") as capture:
+        data = capture.read()
+    magic = data[:4]
+    endian = "<" if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1") else ">"
+    nanoseconds = magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+    link_type = struct.unpack_from(endian + "I", data, 20)[0] & 0x0FFFFFFF
+    if link_type not in _PCAP_LINK_HEADERS:
+        raise ValueError(f"Unsupported pcap link type {link_type}")
+    link_header = _PCAP_LINK_HEADERS[link_type]
+    record = struct.Struct(endian + "IIII")
+
+    packets = []
+    offset = 24
+    first = None
+    while offset + record.size <= len(data):
+        seconds, fraction, captured, _ = record.unpack_from(data, offset)
+        offset += record.size
+        frame = data[offset:offset + captured]
+        offset += captured
+        timestamp = seconds + fraction / (1e9 if nanoseconds else 1e6)
+
+        ip = frame[link_header:]
+        if link_type == 1 and frame[12:14] == b"\x81\x00":
+            # 802.1Q VLAN tag
+            ip = frame[18:]
+        if len(ip) < 20 or ip[0] >> 4 != 4 or ip[9] != 17:
+            continue
+        udp = ip[(ip[0] & 0x0F) * 4:]
+        if len(udp) < 8:
+            continue
+        destination_port, length = struct.unpack_from("!HH", udp, 2)
+        if port is not None and destination_port != port:
+            continue
+        if first is None:
+            first = timestamp
+        packets.append((timestamp - first, bytes(udp[8:length])))
+    return packets
+
+
+def _serve(db_path, host, port, rcvbuf, verbose, detect_anomalies, ready, stop, commits, results):
+    """Child process: run a UDPServer and report the key and commit time of every energy row written"""
+    server = udp_server.UDPServer(host, port, db_path, rcvbuf=rcvbuf, verbose=verbose)
+    if not detect_anomalies:
+        server.detector = None
+
+    def committed(statements):
+        rows = statements.get(udp_server.ENERGY_INSERT_SQL)
+        if rows:
+            commits.put((time.time(), [row_key(row) for row in rows]))
+
+    server.writer.on_commit = committed
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    while not server.running and thread.is_alive():
+        time.sleep(0.01)
+    ready.set()
+    stop.wait()
+    server.stop()
+    thread.join()
+    metrics = server.metrics.snapshot()
+    metrics.pop("devices")
+    results.put({"metrics": metrics, "writer": server.writer.stats(),
+                 "anomalies": server.detector.stats() if server.detector is not None else None})
+
+
+class LatencyTracker:
+    """Matches each device's committed energy rows, in order, to the times its datagrams were sent"""
+
+    def __init__(self):
+        self.pending = {}
+        self.latencies = []
+        self.committed = 0
+        self.unmatched = 0
+        self.last_commit_at = None
+        self._lock = threading.Lock()
+
+    def sent(self, key, sent_at: float):
+        if key is None:
+            return
+        with self._lock:
+            self.pending.setdefault(key, deque()).append(sent_at)
+
+    def commit(self, committed_at: float, keys: list):
+        with self._lock:
+            self.last_commit_at = committed_at
+            for key in keys:
+                self.committed += 1
+                times = self.pending.get(key)
+                if not times:
+                    self.unmatched += 1
+                    continue
+                self.latencies.append(committed_at - times.popleft())
+                if not times:
+                    del self.pending[key]
+
+
+def run_benchmark(args) -> dict:
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="ingest-bench-"), "bench.db")
+    ingest_schema.init_ingest_db(db_path)
+    target = ("127.0.0.1", args.port)
+
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Event(), context.Event()
+    commits, results = context.Queue(), context.Queue()
+    server = context.Process(
+        target=_serve,
+        args=(db_path, target[0], args.port, args.rcvbuf, args.verbose, not args.no_anomaly_detection,
+              ready, stop, commits, results),
+        daemon=True,
+    )
+    server.start()
+    if not ready.wait(30):
+        raise RuntimeError("UDP server did not start")
+
+    tracker = LatencyTracker()
+    collecting = threading.Event()
+
+    def collect():
+        while not collecting.is_set() or not commits.empty():
+            try:
+                tracker.commit(*commits.get(timeout=0.1))
+            except queue.Empty:
+                continue
+
+    collector = threading.Thread(target=collect, daemon=True)
+    collector.start()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    sock.connect(target)
+    client_addr = (sock.getsockname()[0], 0)
+    record = open(args.record, "w", encoding="utf-8") if args.record else None
+
+    sent = 0
+    tracked = 0
+    send_errors = 0
+    fleet = []
+    started = time.time()
+    try:
+        for offset, payload in schedule(args, fleet):
+            delay = started + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.time()
+            key = expected_key(payload, client_addr)
+            try:
+                sock.send(payload)
+            except OSError:
+                send_errors += 1
+                continue
+            sent += 1
+            if key is not None:
+                tracked += 1
+                tracker.sent(key, now)
+            if record is not None:
+                record.write(json.dumps({"t": now - started, "data": base64.b64encode(payload).decode("ascii")}) + "\n")
+    finally:
+        if record is not None:
+            record.close()
+    send_seconds = time.time() - started
+
+    # Let the pipeline drain, then stop the server (which flushes the writer)
+    time.sleep(args.drain)
+    stop.set()
+    server_stats = results.get(timeout=60)
+    server.join(10)
+    collecting.set()
+    collector.join()
+    sock.close()
+
+    latencies = tracker.latencies
+    metrics, writer = server_stats["metrics"], server_stats["writer"]
+    return {
+        "sent": sent,
+        "send_errors": send_errors,
+        "send_seconds": send_seconds,
+        "send_rate": sent / send_seconds if send_seconds else 0.0,
+        "target_rate": None if args.replay else args.devices * args.rate,
+        "received": metrics["datagrams"],
+        "socket_loss": sent - metrics["datagrams"],
+        "receive_dropped": metrics["receive_dropped"],
+        "decode_errors": metrics["decode_errors"],
+        "sequence_gaps": metrics["missing"],
+        "energy_rows_written": tracker.committed,
+        "loss_ratio": 1 - len(latencies) / tracked if tracked else 0.0,
+        "write_rate": tracker.committed / (tracker.last_commit_at - started) if tracker.last_commit_at else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        "writer": {key: writer[key] for key in (
+            "policy", "batches", "max_queue_depth", "dropped", "evicted", "coalesced", "spilled", "failed")},
+        "anomalies": server_stats["anomalies"] and {
+            "injected_spikes": sum(device.spikes for device in fleet),
+            **server_stats["anomalies"],
+        },
+        "db_path": db_path,
+    }
+
+
+def schedule(args, fleet: list = None):
+    """Yield (offset_seconds, payload) for a replayed capture or the simulated fleet (added to fleet if given)"""
+    if args.replay:
+        for offset, payload in read_capture(args.replay, args.replay_port):
+            yield offset / args.speed, payload
+        return
+
+    rng = random.Random(args.seed)
+    formats = FORMATS if args.format == "mixed" else (args.format,)
+    interval = 1 / args.rate
+    devices = [
+        SimulatedDevice(i, formats[i % len(formats)], interval, args.samples_per_packet, rng, args.spike_rate)
+        for i in range(args.devices)
+    ]
+    if fleet is not None:
+        fleet.extend(devices)
+    # Devices report round-robin, staggered evenly across each interval
+    step = interval / len(devices)
+    sends = int(args.duration * args.rate) * len(devices)
+    base = time.time()
+    for n in range(sends):
+        offset = n * step
+        for payload in devices[n % len(devices)].payloads(base + offset):
+            yield offset, payload
+
+
+def print_report(report: dict):
+    latency = report["latency_ms"]
+    writer = report["writer"]
+    target = f", target {report['target_rate']:.0f}/s" if report["target_rate"] else ""
+    print(f"Sent      {report['sent']} datagrams in {report['send_seconds']:.1f} s ({report['send_rate']:.0f}/s{target})"
+          + (f", {report['send_errors']} send errors" if report["send_errors"] else ""))
+    print(f"Received  {report['received']} ({report['socket_loss']} lost before recvfrom, "
+          f"{report['receive_dropped']} dropped at decode stage, {report['decode_errors']} decode errors, "
+          f"{report['sequence_gaps']} sequence gaps)")
+    print(f"Written   {report['energy_rows_written']} energy rows ({report['write_rate']:.0f}/s), "
+          f"loss {report['loss_ratio']:.2%}")
+    print(f"Latency   send to commit p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+          f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms")
+    print(f"Writer    policy {writer['policy']}, {writer['batches']} batches, peak queue {writer['max_queue_depth']}, "
+          f"{writer['dropped']} dropped, {writer['evicted']} evicted, {writer['coalesced']} coalesced, "
+          f"{writer['spilled']} spilled, {writer['failed']} failed")
+    anomalies = report["anomalies"]
+    if anomalies:
+        events = anomalies["events"]
+        print(f"Anomalies {anomalies['readings']} readings checked ({anomalies['readings_per_cpu_second']:.0f}/CPU s), "
+              f"{events['spike']} spikes ({anomalies['injected_spikes']} injected), {events['flatline']} flatlines, "
+              f"{events['dropout']} dropouts")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark UDP ingest with a simulated ESP32 fleet")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=1.0, help="datagrams per second per device")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of simulated traffic")
+    parser.add_argument("--format", choices=FORMATS + ("mixed",), default="json")
+    parser.add_argument("--samples-per-packet", type=int, default=10, help="readings per binary packet")
+    parser.add_argument("--replay", help="replay an NDJSON capture (see --record) or a .pcap instead of simulating")
+    parser.add_argument("--replay-port", type=int, default=None, help="only replay pcap datagrams sent to this port")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor")
+    parser.add_argument("--record", help="write every datagram sent to an NDJSON capture")
+    parser.add_argument("--port", type=int, default=18888, help="localhost port for the server under test")
+    parser.add_argument("--rcvbuf", type=int, default=None, help="server socket receive buffer, in bytes")
+    parser.add_argument("--db", help="database to write to (default: a fresh temporary file)")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for the writer after sending")
+    parser.add_argument("--spike-rate", type=float, default=0.0,
+                        help="fraction of simulated readings replaced by a spike, for the anomaly detector")
+    parser.add_argument("--no-anomaly-detection", action="store_true",
+                        help="benchmark without the anomaly detector, for comparison")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="log every message the server receives")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Geohash length used as the cache key; 5 characters is a cell of roughly 5 km x 5 km
+LOCATION_CACHE_PRECISION = int(os.getenv("LOCATION_CACHE_PRECISION", "5"))
+LOCATION_CACHE_SIZE = int(os.getenv("LOCATION_CACHE_SIZE", "4096"))
+# State boundaries rarely change; failed lookups are retried much sooner
+LOCATION_CACHE_TTL_SECONDS = float(os.getenv("LOCATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LOCATION_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("LOCATION_CACHE_NEGATIVE_TTL_SECONDS", "600"))
+
+UNKNOWN_STATE = "Unknown"
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude: float, longitude: float, precision: int = LOCATION_CACHE_PRECISION) -> str:
+    """Standard base32 geohash of a coordinate"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def ensure_cache_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS location_state_cache (
+            geohash TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+class LocationCache:
+    """Coordinate-to-state lookups cached by geohash cell, in memory (LRU) and in SQLite.
+
+    A failed lookup ("Unknown") is cached too, with a shorter TTL, so an
+    unreachable geocoder is not hit again on every insert from the same place.
+    """
+
+    def __init__(self, db_path: str, precision: int = LOCATION_CACHE_PRECISION, max_size: int = LOCATION_CACHE_SIZE,
+                 ttl_seconds: float = LOCATION_CACHE_TTL_SECONDS,
+                 negative_ttl_seconds: float = LOCATION_CACHE_NEGATIVE_TTL_SECONDS):
+        self.db_path = db_path
+        self.precision = precision
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached_state(self, latitude: float, longitude: float) -> str:
+        """The cached state for a coordinate, or None if it has to be looked up"""
+        key = geohash(latitude, longitude, self.precision)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT state, expires_at FROM location_state_cache WHERE geohash = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # Table not created yet (init_db has not run)
+            row = None
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        self._remember(key, row[0], row[1])
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def lookup(self, latitude: float, longitude: float, resolve) -> str:
+        """State for a coordinate, calling resolve(latitude, longitude) only on a cache miss"""
+        state = self.cached_state(latitude, longitude)
+        if state is not None:
+            return state
+
+        with self._lock:
+            self.misses += 1
+        state = resolve(latitude, longitude)
+        ttl = self.negative_ttl_seconds if state == UNKNOWN_STATE else self.ttl_seconds
+        key = geohash(latitude, longitude, self.precision)
+        expires_at = time.time() + ttl
+        self._remember(key, state, expires_at)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("""
+                    INSERT INTO location_state_cache (geohash, state, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT (geohash) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at
+                """, (key, state, expires_at))
+        except sqlite3.OperationalError as e:
+            print(f"Could not persist location cache entry: {e}")
+        finally:
+            conn.close()
+        return state
+
+    def _remember(self, key: str, state: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (state, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
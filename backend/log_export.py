@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import sqlite3
+
+import log_filters
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# Rows fetched from the cursor per chunk (and per Parquet row group)
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_TABLES = {
+    "commute-logs": {
+        "table": "commute_logs",
+        "columns": ["id", "date", "transport_mode", "distance_km", "co2_emissions_kg",
+                    "device_id", "user_id", "created_at"],
+        "types": ["int", "text", "text", "real", "real", "text", "text", "text"],
+    },
+    "energy-logs": {
+        "table": "energy_consumption",
+        "columns": ["id", "date", "power_consumption_watts", "duration_hours", "energy_kwh",
+                    "co2_emissions_kg", "electricity_board", "price_per_kwh", "cost_rupees",
+                    "device_id", "user_id", "tariff_version", "created_at"],
+        "types": ["int", "text", "real", "real", "real", "real", "text", "real", "real", "text", "text", "text", "text"],
+    },
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_row_chunks(db_path: str, log_type: str, start_date: str = None, end_date: str = None,
+                    device_id: str = None, user_id: str = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield lists of rows from a log table, fetching chunk_size rows at a time"""
+    spec = EXPORT_TABLES[log_type]
+    conditions, params = log_filters.log_filters(device_id, user_id, start_date, end_date)
+    where = log_filters.where_clause(conditions)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(spec['columns'])}
+            FROM {spec['table']}
+            {where}
+            ORDER BY id
+        """, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def stream_csv(columns: list, chunks):
+    """Encode row chunks as CSV text"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(columns: list, chunks):
+    """Encode row chunks as newline-delimited JSON"""
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_schema(columns: list, types: list):
+    """Build the Arrow schema for an export from its column types"""
+    arrow_types = {"int": pa.int64(), "real": pa.float64(), "text": pa.string()}
+    return pa.schema([(column, arrow_types[column_type]) for column, column_type in zip(columns, types)])
+
+
+def stream_parquet(columns: list, types: list, chunks):
+    """Encode row chunks as Parquet, one row group per chunk"""
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+
+    schema = parquet_schema(columns, types)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            # Transpose the chunk into columns for Arrow
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(db_path: str, log_type: str, fmt: str, start_date: str = None, end_date: str = None,
+                  device_id: str = None, user_id: str = None):
+    """Stream a full log table export in the requested format"""
+    columns = EXPORT_TABLES[log_type]["columns"]
+    types = EXPORT_TABLES[log_type]["types"]
+    chunks = iter_row_chunks(db_path, log_type, start_date, end_date, device_id, user_id)
+    if fmt == "csv":
+        return stream_csv(columns, chunks)
+    if fmt == "ndjson":
+        return stream_ndjson(columns, chunks)
+    return stream_parquet(columns, types, chunks)
@@ -0,0 +1,50 @@
+def owner_filters(device_id: str = None, user_id: str = None) -> tuple:
+    """Conditions and parameters restricting a log query to one device and/or user"""
+    conditions = []
+    params = []
+    if device_id:
+        conditions.append("device_id = ?")
+        params.append(device_id)
+    if user_id:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    return conditions, params
+
+
+def date_range_filters(start_date: str = None, end_date: str = None) -> tuple:
+    """SQLite conditions for an inclusive YYYY-MM-DD date range"""
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append("date >= ?")
+        params.append(start_date)
+    if end_date:
+        # Inclusive end date, also covering values stored with a time part
+        conditions.append("date < date(?, '+1 day')")
+        params.append(end_date)
+    return conditions, params
+
+
+def time_range_filters(start_ms: int = None, end_ms: int = None, column: str = "ts_ms") -> tuple:
+    """SQLite conditions for a half-open [start_ms, end_ms) range of epoch milliseconds"""
+    conditions = []
+    params = []
+    if start_ms is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(start_ms)
+    if end_ms is not None:
+        conditions.append(f"{column} < ?")
+        params.append(end_ms)
+    return conditions, params
+
+
+def log_filters(device_id: str = None, user_id: str = None, start_date: str = None, end_date: str = None) -> tuple:
+    """Combined owner and date range conditions for a log query"""
+    conditions, params = owner_filters(device_id, user_id)
+    date_conditions, date_params = date_range_filters(start_date, end_date)
+    return conditions + date_conditions, params + date_params
+
+
+def where_clause(conditions: list) -> str:
+    """Join conditions into a WHERE clause (empty when there are none)"""
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
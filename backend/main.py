@@ -1,21 +1,41 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 from datetime import datetime, date
 import sqlite3
 import json
-from pathlib import Path
+import asyncio
 import requests
-import csv
-import pandas as pd
+import numpy as np
 import google.generativeai as genai
 from voice_assistant import transcribe_audio, get_ai_response, text_to_speech_elevenlabs
 from fastapi import UploadFile, File, Form
 import base64
 import os
 from image_processor import ImageProcessor
+import bulk_ingest
+import consumption_counters
+import recompute_job
+import tariff_engine
+import tariff_registry
+import tod_engine
+import location_cache
+import udp_ingest
+import udp_server
+import live_hub
+import sample_store
+import energy_integrator
+import anomaly_detector
+import ingest_schema
+import log_export
+import log_filters
+import energy_rollups
+from analytics_engine import AnalyticsEngine
+from zoneinfo import ZoneInfoNotFoundError
 
 app = FastAPI(title="Carbon Footprint Visualizer API", version="1.0.0")
 
@@ -40,35 +60,20 @@ app.add_middleware(
 # Database setup
 DB_PATH = "carbon_footprint.db"
 
-# Load KSEB slab rates
-def load_kseb_slabs():
-    """Load KSEB tiered pricing from CSV"""
-    slabs = []
-    try:
-        with open('kseb_slabs.csv', 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                slabs.append({
-                    'units_min': int(row['units_min']),
-                    'units_max': int(row['units_max']),
-                    'rate_per_kwh': float(row['rate_per_kwh']),
-                    'slab_description': row['slab_description']
-                })
-    except FileNotFoundError:
-        # Default slab if CSV not found
-        slabs = [
-            {'units_min': 0, 'units_max': 250, 'rate_per_kwh': 6.50, 'slab_description': '0-250 units'},
-            {'units_min': 0, 'units_max': 300, 'rate_per_kwh': 6.50, 'slab_description': '0-300 units'},
-            {'units_min': 0, 'units_max': 350, 'rate_per_kwh': 7.60, 'slab_description': '0-350 units'},
-            {'units_min': 0, 'units_max': 400, 'rate_per_kwh': 7.60, 'slab_description': '0-400 units'},
-            {'units_min': 0, 'units_max': 500, 'rate_per_kwh': 7.60, 'slab_description': '0-500 units'},
-            {'units_min': 500, 'units_max': 999999, 'rate_per_kwh': 8.70, 'slab_description': 'above 500 units'}
-        ]
-    return slabs
-
-KSEB_SLABS = load_kseb_slabs()
-
-# Indian Electricity Board Data
+# Columnar read path for the analytical endpoints (SQLite stays the write store)
+analytics = AnalyticsEngine(DB_PATH)
+
+# Default KSEB slab rates, used when kseb_slabs.csv is not found
+DEFAULT_KSEB_SLABS = [
+    {'units_min': 0, 'units_max': 250, 'rate_per_kwh': 6.50, 'slab_description': '0-250 units'},
+    {'units_min': 0, 'units_max': 300, 'rate_per_kwh': 6.50, 'slab_description': '0-300 units'},
+    {'units_min': 0, 'units_max': 350, 'rate_per_kwh': 7.60, 'slab_description': '0-350 units'},
+    {'units_min': 0, 'units_max': 400, 'rate_per_kwh': 7.60, 'slab_description': '0-400 units'},
+    {'units_min': 0, 'units_max': 500, 'rate_per_kwh': 7.60, 'slab_description': '0-500 units'},
+    {'units_min': 500, 'units_max': 999999, 'rate_per_kwh': 8.70, 'slab_description': 'above 500 units'}
+]
+
+# Indian Electricity Board Data (built-in defaults; electricity_boards.json may override or extend them)
 INDIAN_ELECTRICITY_BOARDS = {
     "mseb": {
         "name": "Maharashtra State Electricity Board (MSEB)",
@@ -192,6 +197,32 @@ INDIAN_ELECTRICITY_BOARDS = {
     }
 }
 
+# Versioned board data and compiled slab tariffs, reloaded when kseb_slabs.csv, any other
+# <board>_slabs.csv or electricity_boards.json changes. Boards may set "telescopic" and
+# "fixed_charge_rupees". Read tariffs.current() once per request and use that snapshot throughout.
+tariffs = tariff_registry.TariffRegistry(INDIAN_ELECTRICITY_BOARDS, {"kseb": DEFAULT_KSEB_SLABS}, db_path=DB_PATH)
+
+# Coordinate-to-state lookups cached by geohash cell so inserts rarely hit the geocoder
+locations = location_cache.LocationCache(DB_PATH)
+
+# New readings and rolling per-device aggregates pushed to dashboards over WebSocket/SSE
+live = live_hub.LiveHub()
+
+# ESP32 UDP ingest on the API's event loop (enable with UDP_INGEST_ENABLED=1)
+iot_ingest = udp_ingest.UDPIngest(DB_PATH, hub=live)
+iot_ingest.writer.on_commit = lambda statements: analytics.mark_dirty()
+# Price ingested energy rows like API inserts, inside the writer's transaction
+iot_ingest.writer.prepare = udp_server.energy_pricer(tariffs.current)
+
+# Minute/hour/day rollups and retention for raw sensor samples
+sample_rollups = sample_store.SampleRollupJob(DB_PATH)
+
+# Background repricing of stored rows after tariff or emission factor changes
+recompute_jobs = recompute_job.RecomputeJobRunner(DB_PATH, tariffs.current)
+
+# Largest batch accepted by /api/calculate-tiered-cost/batch
+COST_PREVIEW_MAX_SCENARIOS = 100000
+
 # State to Board mapping for automatic selection
 STATE_TO_BOARD = {
     "Maharashtra": "mseb",
@@ -210,33 +241,20 @@ def init_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    # Commute logs table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS commute_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            transport_mode TEXT NOT NULL,
-            distance_km REAL NOT NULL,
-            co2_emissions_kg REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    # Energy, commute, sample and anomaly tables shared with the standalone UDP receivers
+    ingest_schema.ensure_ingest_tables(cursor)
     
-    # Energy consumption table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS energy_consumption (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            power_consumption_watts REAL NOT NULL,
-            duration_hours REAL NOT NULL,
-            energy_kwh REAL NOT NULL,
-            co2_emissions_kg REAL NOT NULL,
-            electricity_board TEXT,
-            price_per_kwh REAL,
-            cost_rupees REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    # Published tariff versions, referenced by energy_consumption.tariff_version
+    tariffs.ensure_version_table(cursor)
+    
+    # Persistent geohash -> state cache behind get_electricity_board_from_location
+    location_cache.ensure_cache_table(cursor)
+    
+    # Running month-to-date kWh per board and consumer, for O(1) slab selection
+    consumption_counters.ensure_counter_table(cursor)
+    
+    # Progress of background cost/emission recompute jobs
+    recompute_job.ensure_job_table(cursor)
     
     # Monthly aggregations table
     cursor.execute("""
@@ -262,6 +280,8 @@ class CommuteLog(BaseModel):
     date: str
     transport_mode: str
     distance_km: float
+    device_id: Optional[str] = None
+    user_id: Optional[str] = None
 
 class EnergyLog(BaseModel):
     date: str
@@ -270,6 +290,8 @@ class EnergyLog(BaseModel):
     electricity_board: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    device_id: Optional[str] = None
+    user_id: Optional[str] = None
 
 class CommuteLogResponse(BaseModel):
     id: int
@@ -277,6 +299,8 @@ class CommuteLogResponse(BaseModel):
     transport_mode: str
     distance_km: float
     co2_emissions_kg: float
+    device_id: Optional[str] = None
+    user_id: Optional[str] = None
     created_at: str
 
 class EnergyLogResponse(BaseModel):
@@ -289,6 +313,9 @@ class EnergyLogResponse(BaseModel):
     electricity_board: Optional[str]
     price_per_kwh: Optional[float]
     cost_rupees: Optional[float]
+    device_id: Optional[str] = None
+    user_id: Optional[str] = None
+    tariff_version: Optional[str] = None
     created_at: str
 
 class MonthlyData(BaseModel):
@@ -301,6 +328,25 @@ class MonthlyData(BaseModel):
     energy_consumption_kwh: float
     total_energy_cost: float
 
+class RecomputeJobRequest(BaseModel):
+    electricity_board: str
+    start_date: str
+    end_date: str
+
+class CostPreviewBatch(BaseModel):
+    # Columnar scenarios; a single board or monthly_consumption applies to every row
+    energy_kwh: List[float]
+    electricity_board: Union[str, List[str]]
+    monthly_consumption: Union[float, List[float]] = 0
+
+class IntervalReadings(BaseModel):
+    # Columnar power samples; timestamps are Unix epoch seconds
+    electricity_board: str
+    timestamps: List[float]
+    power_watts: List[float]
+    monthly_consumption: float = 0
+    sample_seconds: Optional[float] = None
+
 class ElectricityBoard(BaseModel):
     id: str
     name: str
@@ -844,27 +890,27 @@ Be thorough, technical, and practical in your analysis. Consider real-world impl
         }
 
 # Carbon footprint calculation functions
+COMMUTE_EMISSION_FACTORS = {
+    "car": 0.192,  # kg CO2/km
+    "motorcycle": 0.103,
+    "bus": 0.089,
+    "train": 0.041,
+    "bicycle": 0.0,
+    "walking": 0.0,
+    "electric_car": 0.053,
+    "hybrid_car": 0.120
+}
+
 def calculate_commute_co2(transport_mode: str, distance_km: float) -> float:
     """Calculate CO2 emissions for different transport modes (kg CO2/km)"""
-    emission_factors = {
-        "car": 0.192,  # kg CO2/km
-        "motorcycle": 0.103,
-        "bus": 0.089,
-        "train": 0.041,
-        "bicycle": 0.0,
-        "walking": 0.0,
-        "electric_car": 0.053,
-        "hybrid_car": 0.120
-    }
-    return distance_km * emission_factors.get(transport_mode.lower(), 0.1)
+    return distance_km * COMMUTE_EMISSION_FACTORS.get(transport_mode.lower(), 0.1)
 
-def calculate_energy_co2(energy_kwh: float, electricity_board: str = None) -> float:
+def calculate_energy_co2(energy_kwh: float, electricity_board: str = None,
+                         snapshot: tariff_registry.TariffSnapshot = None) -> float:
     """Calculate CO2 emissions for energy consumption (kg CO2/kWh)"""
-    if electricity_board and electricity_board in INDIAN_ELECTRICITY_BOARDS:
-        emission_factor = INDIAN_ELECTRICITY_BOARDS[electricity_board]["emission_factor"]
-    else:
-        emission_factor = 0.5  # Default emission factor
-    return energy_kwh * emission_factor
+    snapshot = snapshot or tariffs.current()
+    # Default emission factor of 0.5 for unknown boards
+    return energy_kwh * snapshot.emission_factor(electricity_board, 0.5)
 
 def get_location_from_coordinates(latitude: float, longitude: float) -> str:
     """Get state from coordinates using reverse geocoding"""
@@ -883,35 +929,33 @@ def get_location_from_coordinates(latitude: float, longitude: float) -> str:
 
 def get_electricity_board_from_location(latitude: float, longitude: float) -> str:
     """Get electricity board based on location"""
-    state = get_location_from_coordinates(latitude, longitude)
+    state = locations.lookup(latitude, longitude, get_location_from_coordinates)
     return STATE_TO_BOARD.get(state, "mseb")  # Default to MSEB if state not found
 
-def calculate_tiered_cost(energy_kwh: float, electricity_board: str, monthly_consumption: float = 0) -> float:
-    """Calculate cost based on tiered pricing for KSEB"""
-    if electricity_board == "kseb":
-        # For KSEB, use tiered pricing based on monthly consumption
-        total_monthly_kwh = monthly_consumption + energy_kwh
-        
-        # Find the appropriate slab
-        applicable_slab = None
-        for slab in KSEB_SLABS:
-            if total_monthly_kwh >= slab['units_min'] and total_monthly_kwh <= slab['units_max']:
-                applicable_slab = slab
-                break
-        
-        if applicable_slab:
-            return energy_kwh * applicable_slab['rate_per_kwh']
-        else:
-            # Default to highest rate if no slab matches
-            return energy_kwh * 8.70
-    else:
-        # For other boards, use flat rate
-        board_data = INDIAN_ELECTRICITY_BOARDS.get(electricity_board, INDIAN_ELECTRICITY_BOARDS["mseb"])
-        return energy_kwh * board_data["price_per_kwh"]
+def calculate_tiered_cost(energy_kwh: float, electricity_board: str, monthly_consumption: float = 0,
+                          snapshot: tariff_registry.TariffSnapshot = None) -> float:
+    """Calculate cost using the board's compiled slab tariff (flat rate for boards without slabs)"""
+    snapshot = snapshot or tariffs.current()
+    return snapshot.tariff(electricity_board).price(energy_kwh, monthly_consumption)
 
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    tariffs.start()
+    analytics.start()
+    recompute_jobs.resume_incomplete()
+    sample_rollups.start()
+    await live.start()
+    if udp_ingest.UDP_INGEST_ENABLED:
+        await iot_ingest.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await iot_ingest.stop()
+    await live.stop()
+    sample_rollups.stop()
+    analytics.stop()
+    tariffs.stop()
 
 @app.get("/")
 async def root():
@@ -926,13 +970,14 @@ async def create_commute_log(log: CommuteLog):
     cursor = conn.cursor()
     
     cursor.execute("""
-        INSERT INTO commute_logs (date, transport_mode, distance_km, co2_emissions_kg)
-        VALUES (?, ?, ?, ?)
-    """, (log.date, log.transport_mode, log.distance_km, co2_emissions))
+        INSERT INTO commute_logs (date, transport_mode, distance_km, co2_emissions_kg, device_id, user_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (log.date, log.transport_mode, log.distance_km, co2_emissions, log.device_id, log.user_id))
     
     log_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    analytics.mark_dirty()
     
     return CommuteLogResponse(
         id=log_id,
@@ -940,55 +985,51 @@ async def create_commute_log(log: CommuteLog):
         transport_mode=log.transport_mode,
         distance_km=log.distance_km,
         co2_emissions_kg=co2_emissions,
+        device_id=log.device_id,
+        user_id=log.user_id,
         created_at=datetime.now().isoformat()
     )
 
-@app.post("/api/energy-logs", response_model=EnergyLogResponse)
-async def create_energy_log(log: EnergyLog):
-    """Add a new energy consumption log entry"""
+def insert_energy_log(log: EnergyLog, electricity_board: str) -> EnergyLogResponse:
+    """Price and insert one energy log, updating its month-to-date counter in the same transaction"""
     energy_kwh = (log.power_consumption_watts * log.duration_hours) / 1000
     
-    # Determine electricity board
-    electricity_board = log.electricity_board
-    if not electricity_board and log.latitude and log.longitude:
-        electricity_board = get_electricity_board_from_location(log.latitude, log.longitude)
-    elif not electricity_board:
-        electricity_board = "mseb"  # Default to MSEB
-    
-    # Get board data
-    board_data = INDIAN_ELECTRICITY_BOARDS.get(electricity_board, INDIAN_ELECTRICITY_BOARDS["mseb"])
+    # Price the whole log against one tariff version
+    snapshot = tariffs.current()
+    board_data = snapshot.board(electricity_board)
     
-    # Calculate monthly consumption for tiered pricing
-    current_month = datetime.now().strftime('%Y-%m')
-    monthly_consumption = 0
-    if electricity_board == "kseb":
-        conn_temp = sqlite3.connect(DB_PATH)
-        cursor_temp = conn_temp.cursor()
-        cursor_temp.execute("""
-            SELECT SUM(energy_kwh) FROM energy_consumption 
-            WHERE electricity_board = ? AND strftime('%Y-%m', date) = ?
-        """, (electricity_board, current_month))
-        result = cursor_temp.fetchone()
-        monthly_consumption = result[0] if result[0] else 0
-        conn_temp.close()
-    
-    # Calculate cost using tiered pricing for KSEB
-    cost_rupees = calculate_tiered_cost(energy_kwh, electricity_board, monthly_consumption)
-    price_per_kwh = cost_rupees / energy_kwh if energy_kwh > 0 else board_data["price_per_kwh"]
-    co2_emissions = calculate_energy_co2(energy_kwh, electricity_board)
+    co2_emissions = calculate_energy_co2(energy_kwh, electricity_board, snapshot)
+    consumer = consumption_counters.consumer_key(log.user_id, log.device_id)
+    month = log.date[:7]
     
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO energy_consumption 
-        (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg, electricity_board, price_per_kwh, cost_rupees)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (log.date, log.power_consumption_watts, log.duration_hours, energy_kwh, co2_emissions, electricity_board, price_per_kwh, cost_rupees))
-    
-    log_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        # Take the write lock first so the month-to-date read, the insert and the
+        # counter update happen in one transaction
+        cursor.execute("BEGIN IMMEDIATE")
+        monthly_consumption = consumption_counters.read_month_to_date(cursor, electricity_board, consumer, month)
+        
+        # Calculate cost using the board's slab tariff
+        cost_rupees = calculate_tiered_cost(energy_kwh, electricity_board, monthly_consumption, snapshot)
+        price_per_kwh = cost_rupees / energy_kwh if energy_kwh > 0 else board_data["price_per_kwh"]
+        
+        cursor.execute("""
+            INSERT INTO energy_consumption 
+            (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg, electricity_board, price_per_kwh, cost_rupees, device_id, user_id, tariff_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (log.date, log.power_consumption_watts, log.duration_hours, energy_kwh, co2_emissions, electricity_board, price_per_kwh, cost_rupees, log.device_id, log.user_id, snapshot.version))
+        
+        log_id = cursor.lastrowid
+        consumption_counters.add_consumption(cursor, electricity_board, consumer, month, energy_kwh)
+        conn.commit()
+    except Exception:
+        # Release the write lock now rather than whenever the connection is collected
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     
     return EnergyLogResponse(
         id=log_id,
@@ -1000,20 +1041,156 @@ async def create_energy_log(log: EnergyLog):
         electricity_board=electricity_board,
         price_per_kwh=price_per_kwh,
         cost_rupees=cost_rupees,
+        device_id=log.device_id,
+        user_id=log.user_id,
+        tariff_version=snapshot.version,
         created_at=datetime.now().isoformat()
     )
 
+@app.post("/api/energy-logs", response_model=EnergyLogResponse)
+async def create_energy_log(log: EnergyLog):
+    """Add a new energy consumption log entry"""
+    # Determine electricity board
+    electricity_board = log.electricity_board
+    if not electricity_board and log.latitude and log.longitude:
+        # Usually a cache hit; a miss calls the geocoder, so keep it off the event loop
+        electricity_board = await run_in_threadpool(get_electricity_board_from_location, log.latitude, log.longitude)
+    elif not electricity_board:
+        electricity_board = "mseb"  # Default to MSEB
+    if not tariff_registry.known_board(tariffs.current().boards, electricity_board):
+        # Same rule as bulk uploads: don't store a board we'd have to price as another one
+        raise HTTPException(status_code=400, detail=tariff_registry.UNKNOWN_BOARD_ERROR)
+    
+    # The write transaction can wait on the database lock; the event loop also serves UDP ingest and live streams
+    entry = await run_in_threadpool(insert_energy_log, log, electricity_board)
+    analytics.mark_dirty()
+    
+    live.publish_reading(entry.device_id or "unknown", entry.power_consumption_watts, entry.energy_kwh, "api",
+                         co2_emissions_kg=entry.co2_emissions_kg, cost_rupees=entry.cost_rupees,
+                         electricity_board=entry.electricity_board)
+    
+    return entry
+
+async def read_bulk_upload(request: Request, format: Optional[str] = None):
+    """Read a bulk upload body (raw or multipart) and decode it into records"""
+    content_type = request.headers.get("content-type", "")
+    filename = ""
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart uploads must include a 'file' field")
+        filename = upload.filename or ""
+        payload = await upload.read()
+        content_type = upload.content_type or ""
+    else:
+        payload = await request.body()
+
+    fmt = format or bulk_ingest.detect_format(content_type, filename)
+    if fmt not in ("json", "ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be one of: json, ndjson, csv")
+    try:
+        return bulk_ingest.parse_records(payload, fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse {fmt} upload: {e}")
+
+def insert_commute_batch(records: list) -> dict:
+    """Validate, price and insert a batch of commute records"""
+    frame, errors = bulk_ingest.prepare_commute_logs(records, COMMUTE_EMISSION_FACTORS)
+
+    conn = sqlite3.connect(DB_PATH)
+    inserted, db_errors = bulk_ingest.insert_in_chunks(conn, """
+        INSERT INTO commute_logs (date, transport_mode, distance_km, co2_emissions_kg, device_id, user_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, frame, ["date", "transport_mode", "distance_km", "co2_emissions_kg", "device_id", "user_id"])
+    conn.close()
+    analytics.mark_dirty()
+
+    return {"inserted": inserted, "errors": errors + db_errors}
+
+def insert_energy_batch(records: list) -> dict:
+    """Validate, price and insert a batch of energy records"""
+    snapshot = tariffs.current()
+    frame, errors = bulk_ingest.prepare_energy_logs(
+        records, snapshot.boards, resolve_board=get_electricity_board_from_location
+    )
+    frame["tariff_version"] = snapshot.version
+    
+    # Price each chunk under its own write lock from the counters as committed so far:
+    # concurrent single inserts can't slip in between, and a failed chunk's kWh is never carried forward
+    def price_chunk(chunk_cursor, chunk):
+        keys = list(zip(chunk["electricity_board"], chunk["consumer_id"], chunk["month"]))
+        month_to_date = consumption_counters.read_many(chunk_cursor, keys)
+        return bulk_ingest.price_energy_logs(chunk, snapshot.boards, snapshot.tariffs, month_to_date)
+    
+    def update_counters(chunk_cursor, chunk):
+        totals = chunk.groupby(["electricity_board", "consumer_id", "month"])["energy_kwh"].sum()
+        consumption_counters.add_consumption_many(
+            chunk_cursor, [(board, consumer, month, kwh) for (board, consumer, month), kwh in totals.items()]
+        )
+    
+    def publish_chunk(chunk):
+        # Live subscribers see bulk rows once they are committed, like single inserts
+        for row in chunk.itertuples(index=False):
+            live.publish_reading(row.device_id or "unknown", float(row.power_consumption_watts), float(row.energy_kwh),
+                                 "bulk", co2_emissions_kg=float(row.co2_emissions_kg),
+                                 cost_rupees=float(row.cost_rupees), electricity_board=row.electricity_board)
+
+    conn = sqlite3.connect(DB_PATH)
+    inserted, db_errors = bulk_ingest.insert_in_chunks(conn, """
+        INSERT INTO energy_consumption 
+        (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg, electricity_board, price_per_kwh, cost_rupees, device_id, user_id, tariff_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, frame, ["date", "power_consumption_watts", "duration_hours", "energy_kwh",
+                 "co2_emissions_kg", "electricity_board", "price_per_kwh", "cost_rupees", "device_id", "user_id",
+                 "tariff_version"],
+        before_chunk=price_chunk, after_chunk=update_counters, after_commit=publish_chunk)
+    conn.close()
+    analytics.mark_dirty()
+
+    return {"inserted": inserted, "errors": errors + db_errors}
+
+@app.post("/api/commute-logs/bulk")
+async def bulk_create_commute_logs(request: Request, format: Optional[str] = None):
+    """Add many commute logs from a JSON array, NDJSON or CSV upload"""
+    records, parse_errors = await read_bulk_upload(request, format)
+    result = await run_in_threadpool(insert_commute_batch, records)
+    errors = sorted(parse_errors + result["errors"], key=lambda error: error["row"])
+    return {
+        "status": "success" if not errors else "partial",
+        "received": len(records) + len(parse_errors),
+        "inserted": result["inserted"],
+        "failed": len(errors),
+        "errors": errors
+    }
+
+@app.post("/api/energy-logs/bulk")
+async def bulk_create_energy_logs(request: Request, format: Optional[str] = None):
+    """Add many energy logs from a JSON array, NDJSON or CSV upload"""
+    records, parse_errors = await read_bulk_upload(request, format)
+    result = await run_in_threadpool(insert_energy_batch, records)
+    errors = sorted(parse_errors + result["errors"], key=lambda error: error["row"])
+    return {
+        "status": "success" if not errors else "partial",
+        "received": len(records) + len(parse_errors),
+        "inserted": result["inserted"],
+        "failed": len(errors),
+        "errors": errors
+    }
+
 @app.get("/api/commute-logs", response_model=List[CommuteLogResponse])
-async def get_commute_logs():
-    """Get all commute logs"""
+async def get_commute_logs(device_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Get all commute logs, optionally for one device or user"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT id, date, transport_mode, distance_km, co2_emissions_kg, created_at
+    conditions, params = log_filters.owner_filters(device_id, user_id)
+    cursor.execute(f"""
+        SELECT id, date, transport_mode, distance_km, co2_emissions_kg, created_at, device_id, user_id
         FROM commute_logs
+        {log_filters.where_clause(conditions)}
         ORDER BY date DESC
-    """)
+    """, params)
     
     logs = []
     for row in cursor.fetchall():
@@ -1023,24 +1200,28 @@ async def get_commute_logs():
             transport_mode=row[2],
             distance_km=row[3],
             co2_emissions_kg=row[4],
-            created_at=row[5]
+            created_at=row[5],
+            device_id=row[6],
+            user_id=row[7]
         ))
     
     conn.close()
     return logs
 
 @app.get("/api/energy-logs", response_model=List[EnergyLogResponse])
-async def get_energy_logs():
-    """Get all energy consumption logs"""
+async def get_energy_logs(device_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Get all energy consumption logs, optionally for one device or user"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    cursor.execute("""
+    conditions, params = log_filters.owner_filters(device_id, user_id)
+    cursor.execute(f"""
         SELECT id, date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg, 
-               electricity_board, price_per_kwh, cost_rupees, created_at
+               electricity_board, price_per_kwh, cost_rupees, created_at, device_id, user_id, tariff_version
         FROM energy_consumption
+        {log_filters.where_clause(conditions)}
         ORDER BY date DESC
-    """)
+    """, params)
     
     logs = []
     for row in cursor.fetchall():
@@ -1054,138 +1235,217 @@ async def get_energy_logs():
             electricity_board=row[6],
             price_per_kwh=row[7],
             cost_rupees=row[8],
-            created_at=row[9]
+            created_at=row[9],
+            device_id=row[10],
+            user_id=row[11],
+            tariff_version=row[12]
         ))
     
     conn.close()
     return logs
 
-@app.get("/api/monthly-data", response_model=List[MonthlyData])
-async def get_monthly_data():
-    """Get monthly aggregated data"""
+@app.get("/api/export/{log_type}")
+async def export_logs(log_type: str, format: str = "csv", start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      device_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Stream the full commute or energy log history as CSV, NDJSON or Parquet"""
+    if log_type not in log_export.EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown log type. Must be one of: {list(log_export.EXPORT_TABLES)}")
+    if format not in log_export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Must be one of: {list(log_export.EXPORT_FORMATS)}")
+    if format == "parquet" and log_export.pq is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed")
+    for value in (start_date, end_date):
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+    filename = f"{log_type}.{format}"
+    return StreamingResponse(
+        log_export.stream_export(DB_PATH, log_type, format, start_date, end_date, device_id, user_id),
+        media_type=log_export.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/energy-rollups")
+async def get_energy_rollups(interval: str = "day", timezone: str = "Asia/Kolkata",
+                             start_date: Optional[str] = None, end_date: Optional[str] = None,
+                             device_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Get hourly/daily/weekly/monthly energy buckets computed server-side"""
+    if interval not in energy_rollups.ROLLUP_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Invalid interval. Must be one of: {list(energy_rollups.ROLLUP_INTERVALS)}")
+    for value in (start_date, end_date):
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+    try:
+        buckets = await run_in_threadpool(energy_rollups.rollup_energy, DB_PATH, interval, timezone,
+                                          start_date, end_date, device_id, user_id)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown time zone '{timezone}'")
+    
+    return {
+        "interval": interval,
+        "timezone": timezone,
+        "buckets": buckets
+    }
+
+def sqlite_monthly_data(device_id: str = None, user_id: str = None) -> list:
+    """Monthly commute and energy totals computed directly on SQLite"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    conditions, params = log_filters.owner_filters(device_id, user_id)
+    where = log_filters.where_clause(conditions)
     
     # Calculate monthly aggregations
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT 
             strftime('%Y', date) as year,
             strftime('%m', date) as month,
             SUM(co2_emissions_kg) as total_commute_co2,
             SUM(distance_km) as total_distance
         FROM commute_logs
+        {where}
         GROUP BY year, month
-        ORDER BY year DESC, month DESC
-    """)
+        HAVING year IS NOT NULL
+    """, params)
     
     commute_data = {}
     for row in cursor.fetchall():
-        key = f"{row[0]}-{row[1]}"
-        commute_data[key] = {
-            'year': int(row[0]),
-            'month': int(row[1]),
+        commute_data[(int(row[0]), int(row[1]))] = {
             'total_commute_co2': row[2] or 0,
             'total_distance': row[3] or 0
         }
     
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT 
             strftime('%Y', date) as year,
             strftime('%m', date) as month,
             SUM(co2_emissions_kg) as total_energy_co2,
-            SUM(energy_kwh) as total_energy
+            SUM(energy_kwh) as total_energy,
+            SUM(cost_rupees) as total_energy_cost
         FROM energy_consumption
+        {where}
         GROUP BY year, month
-        ORDER BY year DESC, month DESC
-    """)
+        HAVING year IS NOT NULL
+    """, params)
     
     energy_data = {}
     for row in cursor.fetchall():
-        key = f"{row[0]}-{row[1]}"
-        energy_data[key] = {
+        energy_data[(int(row[0]), int(row[1]))] = {
             'total_energy_co2': row[2] or 0,
-            'total_energy': row[3] or 0
+            'total_energy': row[3] or 0,
+            'total_energy_cost': row[4] or 0
         }
+    conn.close()
     
     # Combine data
     monthly_data = []
-    all_months = set(commute_data.keys()) | set(energy_data.keys())
-    
-    for month_key in sorted(all_months, reverse=True):
-        commute = commute_data.get(month_key, {})
-        energy = energy_data.get(month_key, {})
-        
-        total_co2 = (commute.get('total_commute_co2', 0) + 
-                    energy.get('total_energy_co2', 0))
-        
-        monthly_data.append(MonthlyData(
-            year=commute.get('year', 0),
-            month=commute.get('month', 0),
-            total_commute_co2=commute.get('total_commute_co2', 0),
-            total_energy_co2=energy.get('total_energy_co2', 0),
-            total_co2=total_co2,
-            commute_distance_km=commute.get('total_distance', 0),
-            energy_consumption_kwh=energy.get('total_energy', 0)
-        ))
-    
-    conn.close()
+    for year, month in sorted(set(commute_data) | set(energy_data), reverse=True):
+        commute = commute_data.get((year, month), {})
+        energy = energy_data.get((year, month), {})
+        monthly_data.append({
+            "year": year,
+            "month": month,
+            "total_commute_co2": commute.get('total_commute_co2', 0),
+            "total_energy_co2": energy.get('total_energy_co2', 0),
+            "commute_distance_km": commute.get('total_distance', 0),
+            "energy_consumption_kwh": energy.get('total_energy', 0),
+            "total_energy_cost": energy.get('total_energy_cost', 0)
+        })
     return monthly_data
 
-@app.get("/api/dashboard-stats")
-async def get_dashboard_stats():
-    """Get dashboard statistics"""
+def sqlite_dashboard_stats(current_month: str, device_id: str = None, user_id: str = None) -> dict:
+    """All-time and current-month totals computed directly on SQLite"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    conditions, params = log_filters.owner_filters(device_id, user_id)
+    where = log_filters.where_clause(conditions)
     
-    # Total CO2 emissions
-    cursor.execute("SELECT SUM(co2_emissions_kg) FROM commute_logs")
-    total_commute_co2 = cursor.fetchone()[0] or 0
-    
-    cursor.execute("SELECT SUM(co2_emissions_kg) FROM energy_consumption")
-    total_energy_co2 = cursor.fetchone()[0] or 0
-    
-    # Total energy cost
-    cursor.execute("SELECT SUM(cost_rupees) FROM energy_consumption")
-    total_energy_cost = cursor.fetchone()[0] or 0
-    
-    # This month's data
-    current_month = datetime.now().strftime('%Y-%m')
-    cursor.execute("""
-        SELECT SUM(co2_emissions_kg) FROM commute_logs 
-        WHERE strftime('%Y-%m', date) = ?
-    """, (current_month,))
-    month_commute_co2 = cursor.fetchone()[0] or 0
-    
-    cursor.execute("""
-        SELECT SUM(co2_emissions_kg) FROM energy_consumption 
-        WHERE strftime('%Y-%m', date) = ?
-    """, (current_month,))
-    month_energy_co2 = cursor.fetchone()[0] or 0
-    
-    cursor.execute("""
-        SELECT SUM(cost_rupees) FROM energy_consumption 
-        WHERE strftime('%Y-%m', date) = ?
-    """, (current_month,))
-    month_energy_cost = cursor.fetchone()[0] or 0
+    cursor.execute(f"""
+        SELECT
+            COALESCE(SUM(co2_emissions_kg), 0),
+            COALESCE(SUM(CASE WHEN strftime('%Y-%m', date) = ? THEN co2_emissions_kg END), 0)
+        FROM commute_logs
+        {where}
+    """, [current_month] + params)
+    total_commute_co2, month_commute_co2 = cursor.fetchone()
+    
+    cursor.execute(f"""
+        SELECT
+            COALESCE(SUM(co2_emissions_kg), 0),
+            COALESCE(SUM(cost_rupees), 0),
+            COALESCE(SUM(CASE WHEN strftime('%Y-%m', date) = ? THEN co2_emissions_kg END), 0),
+            COALESCE(SUM(CASE WHEN strftime('%Y-%m', date) = ? THEN cost_rupees END), 0)
+        FROM energy_consumption
+        {where}
+    """, [current_month, current_month] + params)
+    total_energy_co2, total_energy_cost, month_energy_co2, month_energy_cost = cursor.fetchone()
     
     conn.close()
-    
     return {
-        "total_co2_emissions": total_commute_co2 + total_energy_co2,
         "total_commute_co2": total_commute_co2,
+        "month_commute_co2": month_commute_co2,
         "total_energy_co2": total_energy_co2,
         "total_energy_cost": total_energy_cost,
-        "this_month_co2": month_commute_co2 + month_energy_co2,
-        "this_month_commute_co2": month_commute_co2,
-        "this_month_energy_co2": month_energy_co2,
-        "this_month_energy_cost": month_energy_cost
+        "month_energy_co2": month_energy_co2,
+        "month_energy_cost": month_energy_cost
+    }
+
+def analytics_or_sqlite(query, fallback, *args):
+    """Answer from the analytics snapshots when they are current, else (or if DuckDB fails) from SQLite"""
+    if analytics.is_fresh():
+        try:
+            return query(*args)
+        except Exception as e:
+            print(f"Analytics query failed, using SQLite: {e}")
+    return fallback(*args)
+
+@app.get("/api/monthly-data", response_model=List[MonthlyData])
+async def get_monthly_data(device_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Get monthly aggregated data, optionally for one device or user"""
+    rows = await run_in_threadpool(analytics_or_sqlite, analytics.monthly_data, sqlite_monthly_data, device_id, user_id)
+    
+    return [
+        MonthlyData(
+            year=row["year"],
+            month=row["month"],
+            total_commute_co2=row["total_commute_co2"],
+            total_energy_co2=row["total_energy_co2"],
+            total_co2=row["total_commute_co2"] + row["total_energy_co2"],
+            commute_distance_km=row["commute_distance_km"],
+            energy_consumption_kwh=row["energy_consumption_kwh"],
+            total_energy_cost=row["total_energy_cost"]
+        )
+        for row in rows
+    ]
+
+@app.get("/api/dashboard-stats")
+async def get_dashboard_stats(device_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Get dashboard statistics, optionally for one device or user"""
+    current_month = datetime.now().strftime('%Y-%m')
+    stats = await run_in_threadpool(analytics_or_sqlite, analytics.dashboard_stats, sqlite_dashboard_stats,
+                                    current_month, device_id, user_id)
+    
+    return {
+        "total_co2_emissions": stats["total_commute_co2"] + stats["total_energy_co2"],
+        "total_commute_co2": stats["total_commute_co2"],
+        "total_energy_co2": stats["total_energy_co2"],
+        "total_energy_cost": stats["total_energy_cost"],
+        "this_month_co2": stats["month_commute_co2"] + stats["month_energy_co2"],
+        "this_month_commute_co2": stats["month_commute_co2"],
+        "this_month_energy_co2": stats["month_energy_co2"],
+        "this_month_energy_cost": stats["month_energy_cost"]
     }
 
 @app.get("/api/electricity-boards", response_model=List[ElectricityBoard])
 async def get_electricity_boards():
     """Get all available electricity boards"""
     boards = []
-    for board_id, board_data in INDIAN_ELECTRICITY_BOARDS.items():
+    for board_id, board_data in tariffs.current().boards.items():
         boards.append(ElectricityBoard(
             id=board_id,
             name=board_data["name"],
@@ -1199,8 +1459,8 @@ async def get_electricity_boards():
 @app.post("/api/location-to-board")
 async def get_board_from_location(location: LocationData):
     """Get electricity board based on GPS coordinates"""
-    board_id = get_electricity_board_from_location(location.latitude, location.longitude)
-    board_data = INDIAN_ELECTRICITY_BOARDS[board_id]
+    board_id = await run_in_threadpool(get_electricity_board_from_location, location.latitude, location.longitude)
+    board_data = tariffs.current().boards[board_id]
     
     return {
         "board_id": board_id,
@@ -1214,7 +1474,132 @@ async def get_board_from_location(location: LocationData):
 @app.get("/api/kseb-slabs")
 async def get_kseb_slabs():
     """Get KSEB tiered pricing slabs"""
-    return {"slabs": KSEB_SLABS}
+    return {"slabs": tariffs.current().slabs["kseb"]}
+
+@app.get("/api/sensor-samples")
+async def get_sensor_samples(device_id: str, resolution: str = "minute", start_ms: Optional[int] = None,
+                             end_ms: Optional[int] = None, limit: int = 10000):
+    """Get one device's raw samples or minute/hour/day rollups (default: the last 24 hours)"""
+    if resolution != "raw" and resolution not in sample_store.ROLLUP_TABLES:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of: raw, {', '.join(sample_store.ROLLUP_TABLES)}")
+    end_ms = end_ms if end_ms is not None else int(datetime.now().timestamp() * 1000)
+    start_ms = start_ms if start_ms is not None else end_ms - sample_store.DAY_MS
+    rows = await run_in_threadpool(sample_store.query_samples, DB_PATH, device_id, start_ms, end_ms, resolution, limit)
+    return {"device_id": device_id, "resolution": resolution, "start_ms": start_ms, "end_ms": end_ms, "rows": rows}
+
+@app.get("/api/sensor-samples/energy")
+async def get_sensor_sample_energy(device_id: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                                   max_gap_ms: int = energy_integrator.ENERGY_MAX_GAP_MS):
+    """Re-integrate one device's stored raw samples (trapezoidal, gaps capped) over a range (default: the last 24 hours)"""
+    if max_gap_ms <= 0:
+        raise HTTPException(status_code=400, detail="max_gap_ms must be positive")
+    end_ms = end_ms if end_ms is not None else int(datetime.now().timestamp() * 1000)
+    start_ms = start_ms if start_ms is not None else end_ms - sample_store.DAY_MS
+    return await run_in_threadpool(energy_integrator.reintegrate_samples, DB_PATH, device_id, start_ms, end_ms, max_gap_ms)
+
+@app.get("/api/ingest/udp")
+async def get_udp_ingest_status():
+    """Get counters for the in-process UDP ingest"""
+    return iot_ingest.stats()
+
+@app.websocket("/ws/live")
+async def live_websocket(websocket: WebSocket, device_id: Optional[str] = None):
+    """Push new readings and rolling aggregates, optionally for comma-separated device ids"""
+    await websocket.accept()
+    subscription = live.subscribe(live_hub.parse_devices(device_id))
+
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        while not subscription.closed:
+            pending = asyncio.ensure_future(subscription.next_events(live_hub.LIVE_KEEPALIVE_SECONDS))
+            await asyncio.wait({pending, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                pending.cancel()
+                return
+            await websocket.send_json({"events": pending.result(), "dropped": subscription.take_dropped()})
+        await websocket.close()
+    finally:
+        disconnected.cancel()
+        live.unsubscribe(subscription)
+
+@app.get("/api/live/stream")
+async def live_stream(request: Request, device_id: Optional[str] = None):
+    """Server-sent events: new readings and rolling aggregates, optionally for comma-separated device ids"""
+    subscription = live.subscribe(live_hub.parse_devices(device_id))
+
+    async def events():
+        try:
+            while not subscription.closed:
+                batch = await subscription.next_events(live_hub.LIVE_KEEPALIVE_SECONDS)
+                if await request.is_disconnected():
+                    return
+                dropped = subscription.take_dropped()
+                if dropped:
+                    yield f"event: dropped\ndata: {json.dumps({'dropped': dropped})}\n\n"
+                if not batch:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "".join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in batch)
+        finally:
+            live.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/live/stats")
+async def get_live_stats():
+    """Get live push subscriber and event counts"""
+    return live.stats()
+
+@app.get("/api/ingest/metrics")
+async def get_ingest_metrics():
+    """Get ingest health: packets/s, decode errors, per-device sequence gaps/duplicates/reordering, queue depth and write latency"""
+    return iot_ingest.metrics_snapshot()
+
+@app.get("/api/anomalies")
+async def get_anomalies(device_id: Optional[str] = None, kind: Optional[str] = None, start_ms: Optional[int] = None,
+                        end_ms: Optional[int] = None, limit: int = 100):
+    """Get spike, flatline and dropout events flagged during UDP ingest, newest first"""
+    if kind is not None and kind not in anomaly_detector.ANOMALY_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(anomaly_detector.ANOMALY_KINDS)}")
+    return await run_in_threadpool(anomaly_detector.query_anomalies, DB_PATH, device_id, kind, start_ms, end_ms, limit)
+
+@app.get("/api/ingest/device-configs")
+async def get_device_configs(device_id: Optional[str] = None):
+    """Get the adaptive reporting configs sent to devices over the UDP downlink"""
+    controller = iot_ingest.controller
+    if controller is None:
+        raise HTTPException(status_code=404, detail="Device control is disabled (DEVICE_CONTROL_ENABLED=0)")
+    if device_id is None:
+        return controller.snapshot()
+    device = controller.device(device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Device not seen by UDP ingest")
+    return device
+
+@app.get("/api/tariffs/version")
+async def get_tariff_version():
+    """Get the tariff version currently used to price new logs"""
+    snapshot = tariffs.current()
+    return {
+        "version": snapshot.version,
+        "loaded_at": datetime.fromtimestamp(snapshot.loaded_at).isoformat(),
+        "boards": len(snapshot.boards),
+        "slab_tables": sorted(snapshot.slabs),
+        "last_reload_error": tariffs.last_error
+    }
+
+@app.post("/api/tariffs/reload")
+async def reload_tariffs():
+    """Reload tariff files now instead of waiting for the file watcher"""
+    updated = await run_in_threadpool(tariffs.reload)
+    if tariffs.last_error:
+        raise HTTPException(status_code=400, detail=f"Tariff files rejected, still using {tariffs.current().version}: {tariffs.last_error}")
+    return {"updated": updated, "version": tariffs.current().version}
 
 @app.get("/api/calculate-tiered-cost")
 async def calculate_cost_preview(energy_kwh: float, electricity_board: str, monthly_consumption: float = 0):
@@ -1228,6 +1613,83 @@ async def calculate_cost_preview(energy_kwh: float, electricity_board: str, mont
         "effective_rate": cost / energy_kwh if energy_kwh > 0 else 0
     }
 
+@app.post("/api/calculate-tiered-cost/batch")
+async def calculate_cost_preview_batch(batch: CostPreviewBatch):
+    """Calculate cost previews for many scenarios in one vectorized pass"""
+    count = len(batch.energy_kwh)
+    if count > COST_PREVIEW_MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {COST_PREVIEW_MAX_SCENARIOS} scenarios per request")
+    boards = [batch.electricity_board] * count if isinstance(batch.electricity_board, str) else batch.electricity_board
+    monthly = [batch.monthly_consumption] * count if isinstance(batch.monthly_consumption, (int, float)) else batch.monthly_consumption
+    if len(boards) != count or len(monthly) != count:
+        raise HTTPException(status_code=400, detail="electricity_board and monthly_consumption must match the length of energy_kwh")
+    
+    snapshot = tariffs.current()
+    energy = np.asarray(batch.energy_kwh, dtype=float)
+    cost = tariff_engine.price_by_board(snapshot.tariffs, boards, energy, monthly)
+    effective_rate = np.divide(cost, energy, out=np.zeros_like(cost), where=energy > 0)
+    return {
+        "count": count,
+        "tariff_version": snapshot.version,
+        "energy_kwh": batch.energy_kwh,
+        "electricity_board": boards,
+        "monthly_consumption": monthly,
+        "cost_rupees": cost.tolist(),
+        "effective_rate": effective_rate.tolist()
+    }
+
+@app.post("/api/interval-cost")
+async def calculate_interval_cost(readings: IntervalReadings):
+    """Cost and CO2 for interval power readings using time-of-day rates and hourly emission factors"""
+    snapshot = tariffs.current()
+    if readings.electricity_board not in snapshot.boards:
+        raise HTTPException(status_code=400, detail=f"Unknown electricity board '{readings.electricity_board}'")
+    if len(readings.timestamps) != len(readings.power_watts):
+        raise HTTPException(status_code=400, detail="timestamps and power_watts must have the same length")
+    
+    schedule = snapshot.tod_schedule(readings.electricity_board)
+    
+    def evaluate():
+        result = tod_engine.evaluate_intervals(
+            snapshot.tariff(readings.electricity_board), schedule, readings.timestamps, readings.power_watts,
+            emission_series=snapshot.emission_series.get(readings.electricity_board),
+            flat_emission_factor=snapshot.emission_factor(readings.electricity_board),
+            month_to_date=readings.monthly_consumption, sample_seconds=readings.sample_seconds
+        )
+        return tod_engine.summarize_intervals(result, schedule)
+    
+    summary = await run_in_threadpool(evaluate)
+    return {"electricity_board": readings.electricity_board, "tariff_version": snapshot.version, **summary}
+
+@app.post("/api/recompute-jobs")
+async def create_recompute_job(request: RecomputeJobRequest):
+    """Start a background job that reprices stored energy rows for a board and date range"""
+    if request.electricity_board not in tariffs.current().boards:
+        raise HTTPException(status_code=400, detail=f"Unknown electricity board '{request.electricity_board}'")
+    for value in (request.start_date, request.end_date):
+        try:
+            date.fromisoformat(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+    
+    job_id = await run_in_threadpool(
+        recompute_jobs.create_job, request.electricity_board, request.start_date, request.end_date
+    )
+    return recompute_jobs.get_job(job_id)
+
+@app.get("/api/recompute-jobs")
+async def list_recompute_jobs():
+    """List recompute jobs with their progress"""
+    return {"jobs": recompute_jobs.list_jobs()}
+
+@app.get("/api/recompute-jobs/{job_id}")
+async def get_recompute_job(job_id: int):
+    """Get the status and progress of a recompute job"""
+    job = recompute_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Recompute job not found")
+    return job
+
 @app.post("/api/analyze-polygon", response_model=StructuredAnalysisResponse)
 async def analyze_polygon_data(polygon_data: PolygonData):
     """Receive polygon data from frontend and process environmental data for each grid point"""
@@ -0,0 +1,196 @@
+import json
+import os
+import struct
+import time
+from itertools import accumulate
+
+# Binary sample packet, all fields little-endian:
+#
+#   header   2s magic (CF B1), B version, B device id length, I sequence number,
+#            Q timestamp of the first reading (epoch ms), H nominal sample period (ms),
+#            H reading count
+#   device   UTF-8 device id
+#   first    i power (0.1 W), i current (mA)
+#   rest     count - 1 deltas from the previous reading: H ms, h power (0.1 W), h current (mA)
+#
+# A 1 Hz reading costs 6 bytes instead of ~120 bytes of JSON.
+PACKET_MAGIC = b"\xcf\xb1"
+PACKET_VERSION = 1
+HEADER = struct.Struct("<2sBBIQHH")
+FIRST_READING = struct.Struct("<ii")
+DELTA_READING = struct.Struct("<Hhh")
+
+# Keep encoded packets within one ESP32/UDP receive buffer
+MAX_PACKET_SIZE = 1024
+MAX_DEVICE_ID_BYTES = 64
+
+# The CSV feed ("Current,Power,Energy,Cost") carries no timing; each line is treated as one sample of this period
+CSV_SAMPLE_PERIOD_MS = int(os.getenv("CSV_SAMPLE_PERIOD_MS", "1000"))
+
+_INT16 = (-32768, 32767)
+
+
+class PacketError(ValueError):
+    """A datagram that cannot be decoded; every decoder raises this for bad input"""
+
+
+def decode_json(data: bytes) -> dict:
+    """The ESP32 sketch's ArduinoJson messages"""
+    try:
+        message = json.loads(data.decode("utf-8"))
+    except ValueError as e:
+        # JSONDecodeError and UnicodeDecodeError
+        raise PacketError(f"Invalid JSON message: {e}") from None
+    if not isinstance(message, dict):
+        raise PacketError("JSON message must be an object")
+    return message
+
+
+def decode_csv(data: bytes, device_id: str = "unknown", received_ms: int = None) -> dict:
+    """The "Current,Power,Energy,Cost" line read by udp.py, as a one-sample packet"""
+    try:
+        values = data.decode("utf-8").strip().split(",")
+    except UnicodeDecodeError as e:
+        raise PacketError(f"CSV line is not UTF-8: {e}") from None
+    if len(values) != 4:
+        raise PacketError(f"Expected 4 comma-separated values, got {len(values)}")
+    try:
+        current, power, energy_wh, cost = (float(value) for value in values)
+    except ValueError as e:
+        raise PacketError(f"Bad CSV value: {e}") from None
+    return {
+        "type": "samples",
+        "device_id": device_id,
+        "seq": None,
+        "period_ms": CSV_SAMPLE_PERIOD_MS,
+        "samples": [(received_ms or int(time.time() * 1000), power, current)],
+        "energy_wh": energy_wh,
+        "cost": cost,
+    }
+
+
+def decode_binary(data: bytes) -> dict:
+    """Decode a binary sample packet into (ts_ms, power_watts, current_amps) samples"""
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise PacketError("Packet shorter than its header")
+    magic, version, id_length, seq, base_ts_ms, period_ms, count = HEADER.unpack_from(view, 0)
+    if magic != PACKET_MAGIC:
+        raise PacketError("Bad packet magic")
+    if version != PACKET_VERSION:
+        raise PacketError(f"Unsupported packet version {version}")
+    if count == 0:
+        raise PacketError("Packet has no readings")
+
+    offset = HEADER.size
+    expected = offset + id_length + FIRST_READING.size + (count - 1) * DELTA_READING.size
+    if len(view) != expected:
+        raise PacketError(f"Packet is {len(view)} bytes, header implies {expected}")
+    try:
+        device_id = bytes(view[offset:offset + id_length]).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise PacketError(f"Device id is not UTF-8: {e}") from None
+    offset += id_length
+
+    power, current = FIRST_READING.unpack_from(view, offset)
+    offset += FIRST_READING.size
+    deltas = list(DELTA_READING.iter_unpack(view[offset:]))
+    timestamps = accumulate((delta[0] for delta in deltas), initial=base_ts_ms)
+    powers = accumulate((delta[1] for delta in deltas), initial=power)
+    currents = accumulate((delta[2] for delta in deltas), initial=current)
+    return {
+        "type": "samples",
+        "device_id": device_id,
+        "seq": seq,
+        "period_ms": period_ms,
+        "samples": [(ts, p / 10, c / 1000) for ts, p, c in zip(timestamps, powers, currents)],
+    }
+
+
+def decode_datagram(data: bytes, addr=None) -> list:
+    """Decode a datagram in any supported format into a list of messages.
+
+    Binary packets are recognised by their magic, JSON by a leading '{'; anything
+    else is read as a CSV line attributed to the sender's address.
+    """
+    if data[:2] == PACKET_MAGIC:
+        return [decode_binary(data)]
+    if data[:1] == b"{":
+        return [decode_json(data)]
+    return [decode_csv(data, device_id=addr[0] if addr else "unknown")]
+
+
+def parse_json(data: bytes, addr=None) -> list:
+    return [decode_json(data)]
+
+
+def parse_csv(data: bytes, addr=None) -> list:
+    return [decode_csv(data, device_id=addr[0] if addr else "unknown")]
+
+
+def parse_binary(data: bytes, addr=None) -> list:
+    return [decode_binary(data)]
+
+
+# Parser name -> parse(data, addr) returning a list of messages; ingest bindings choose one by name
+PARSERS = {
+    "auto": decode_datagram,
+    "json": parse_json,
+    "csv": parse_csv,
+    "binary": parse_binary,
+}
+
+
+def register_parser(name: str, parser):
+    """Make a datagram parser available to ingest bindings under name"""
+    PARSERS[name] = parser
+
+
+def get_parser(name: str):
+    try:
+        return PARSERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown parser {name!r}; expected one of {', '.join(PARSERS)}") from None
+
+
+def _packet(device_id: bytes, seq: int, period_ms: int, readings: list) -> bytes:
+    base_ts, base_power, base_current = readings[0]
+    parts = [
+        HEADER.pack(PACKET_MAGIC, PACKET_VERSION, len(device_id), seq & 0xFFFFFFFF, base_ts, period_ms, len(readings)),
+        device_id,
+        FIRST_READING.pack(base_power, base_current),
+    ]
+    for previous, reading in zip(readings, readings[1:]):
+        parts.append(DELTA_READING.pack(reading[0] - previous[0], reading[1] - previous[1], reading[2] - previous[2]))
+    return b"".join(parts)
+
+
+def encode_samples(device_id: str, samples: list, seq: int = 0, period_ms: int = 1000,
+                   max_packet_size: int = MAX_PACKET_SIZE) -> list:
+    """Encode (ts_ms, power_watts, current_amps) samples as binary packets with consecutive sequence numbers.
+
+    A new packet starts when one is full or a delta does not fit its 16-bit field.
+    """
+    encoded_id = device_id.encode("utf-8")
+    if len(encoded_id) > MAX_DEVICE_ID_BYTES:
+        raise ValueError(f"device_id is longer than {MAX_DEVICE_ID_BYTES} bytes")
+    capacity = 1 + (max_packet_size - HEADER.size - len(encoded_id) - FIRST_READING.size) // DELTA_READING.size
+    if capacity < 1:
+        raise ValueError("max_packet_size is too small for one reading")
+
+    packets = []
+    readings = []
+    for ts, power, current in sorted(samples):
+        reading = (int(ts), round(power * 10), round(current * 1000))
+        if readings:
+            previous = readings[-1]
+            fits = (0 <= reading[0] - previous[0] <= 0xFFFF
+                    and _INT16[0] <= reading[1] - previous[1] <= _INT16[1]
+                    and _INT16[0] <= reading[2] - previous[2] <= _INT16[1])
+            if not fits or len(readings) == capacity:
+                packets.append(_packet(encoded_id, seq + len(packets), period_ms, readings))
+                readings = []
+        readings.append(reading)
+    if readings:
+        packets.append(_packet(encoded_id, seq + len(packets), period_ms, readings))
+    return packets
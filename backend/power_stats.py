@@ -0,0 +1,40 @@
+import math
+
+# Weight of each new reading in a device's running power mean and variance
+EWMA_ALPHA = 0.05
+# Readings needed before the variance is trusted
+WARMUP_READINGS = 20
+
+
+class PowerStats:
+    """Exponentially weighted mean and variance of one device's power, O(1) per reading.
+
+    The anomaly detector and the device controller each keep one per device
+    with the same smoothing: the detector scores a reading against the stats
+    before adding it and skips replayed readings, while the controller folds
+    in everything a device sends.
+    """
+
+    __slots__ = ("readings", "mean", "variance")
+
+    def __init__(self):
+        self.readings = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def add(self, power_watts: float, alpha: float = EWMA_ALPHA):
+        self.readings += 1
+        if self.readings == 1:
+            self.mean = power_watts
+            return
+        delta = power_watts - self.mean
+        self.mean += alpha * delta
+        self.variance = (1 - alpha) * (self.variance + alpha * delta * delta)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def warmed_up(self) -> bool:
+        return self.readings >= WARMUP_READINGS
@@ -0,0 +1,216 @@
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from batch_writer import is_stall
+
+# Rows repriced and written back per transaction
+RECOMPUTE_CHUNK_SIZE = 2000
+# Backoff while the batch writer or the API holds the database; doubles per attempt up to the max
+RECOMPUTE_RETRY_SECONDS = 0.5
+RECOMPUTE_MAX_RETRY_SECONDS = 30
+
+
+def ensure_job_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS recompute_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            electricity_board TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total_rows INTEGER DEFAULT 0,
+            processed_rows INTEGER DEFAULT 0,
+            last_date TEXT,
+            last_id INTEGER,
+            running_totals TEXT DEFAULT '{}',
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+class RecomputeJobRunner:
+    """Background repricing of stored energy rows after a tariff or emission factor change.
+
+    Rows are streamed in (date, id) order with keyset pagination. Each chunk's
+    new cost/CO2 values and the job's cursor position are committed together,
+    so an interrupted job resumes exactly where it stopped.
+    """
+
+    def __init__(self, db_path: str, tariff_source, chunk_size: int = RECOMPUTE_CHUNK_SIZE,
+                 retry_seconds: float = RECOMPUTE_RETRY_SECONDS):
+        # tariff_source() -> TariffSnapshot, read per chunk so reloaded tariffs are picked up
+        self.db_path = db_path
+        self.tariff_source = tariff_source
+        self.chunk_size = chunk_size
+        self.retry_seconds = retry_seconds
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def create_job(self, electricity_board: str, start_date: str, end_date: str) -> int:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM energy_consumption
+            WHERE electricity_board = ? AND date >= ? AND date < date(?, '+1 day')
+        """, (electricity_board, start_date, end_date))
+        total_rows = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO recompute_jobs (electricity_board, start_date, end_date, total_rows)
+            VALUES (?, ?, ?, ?)
+        """, (electricity_board, start_date, end_date, total_rows))
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+
+        self.start(job_id)
+        return job_id
+
+    def get_job(self, job_id: int) -> dict:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM recompute_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        del job["running_totals"]
+        job["progress"] = job["processed_rows"] / job["total_rows"] if job["total_rows"] else 1.0
+        return job
+
+    def list_jobs(self) -> list:
+        conn = sqlite3.connect(self.db_path)
+        job_ids = [row[0] for row in conn.execute("SELECT id FROM recompute_jobs ORDER BY id DESC")]
+        conn.close()
+        return [self.get_job(job_id) for job_id in job_ids]
+
+    def resume_incomplete(self):
+        """Restart jobs that were pending or running when the process last stopped"""
+        conn = sqlite3.connect(self.db_path)
+        job_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM recompute_jobs WHERE status IN ('pending', 'running')"
+        )]
+        conn.close()
+        for job_id in job_ids:
+            self.start(job_id)
+
+    def start(self, job_id: int):
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._run, args=(job_id,), daemon=True)
+            self._threads[job_id] = thread
+            thread.start()
+
+    def _run(self, job_id: int):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self._retry_locked(conn, job_id, lambda: self._set_status(conn, job_id, "running"))
+            while self._retry_locked(conn, job_id, lambda: self._process_chunk(conn, job_id)):
+                pass
+            self._retry_locked(conn, job_id, lambda: self._set_status(conn, job_id, "completed"))
+        except Exception as e:
+            conn.rollback()
+            conn.execute("""
+                UPDATE recompute_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            """, (str(e), job_id))
+            conn.commit()
+            print(f"Recompute job {job_id} failed: {e}")
+        finally:
+            conn.close()
+
+    def _set_status(self, conn: sqlite3.Connection, job_id: int, status: str):
+        with conn:
+            conn.execute("UPDATE recompute_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (status, job_id))
+
+    def _retry_locked(self, conn: sqlite3.Connection, job_id: int, step):
+        """Run one step of a job, backing off and retrying it while the database is locked"""
+        delay = self.retry_seconds
+        while True:
+            try:
+                return step()
+            except sqlite3.OperationalError as e:
+                if not is_stall(e):
+                    raise
+                # Nothing of the step was committed, and the job's cursor only moves on commit
+                conn.rollback()
+                print(f"Recompute job {job_id} waiting {delay:.1f} s for the database: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, RECOMPUTE_MAX_RETRY_SECONDS)
+
+    def _month_baseline(self, cursor, board: str, consumer: str, month: str, start_date: str) -> float:
+        """Consumption in the same month that falls before the job's range"""
+        cursor.execute("""
+            SELECT COALESCE(SUM(energy_kwh), 0) FROM energy_consumption
+            WHERE electricity_board = ? AND COALESCE(user_id, device_id, '') = ?
+              AND date >= ? AND date < ?
+        """, (board, consumer, f"{month}-01", start_date))
+        return cursor.fetchone()[0]
+
+    def _process_chunk(self, conn: sqlite3.Connection, job_id: int) -> bool:
+        """Reprice and write back one chunk; returns False once the range is exhausted"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT electricity_board, start_date, end_date, last_date, last_id, running_totals, processed_rows
+            FROM recompute_jobs WHERE id = ?
+        """, (job_id,))
+        board, start_date, end_date, last_date, last_id, running_totals, processed_rows = cursor.fetchone()
+        running_totals = json.loads(running_totals or "{}")
+
+        cursor.execute("""
+            SELECT id, date, energy_kwh, COALESCE(user_id, device_id, '') AS consumer_id
+            FROM energy_consumption
+            WHERE electricity_board = ? AND date >= ? AND date < date(?, '+1 day')
+              AND (? IS NULL OR date > ? OR (date = ? AND id > ?))
+            ORDER BY date, id
+            LIMIT ?
+        """, (board, start_date, end_date, last_date, last_date, last_date, last_id, self.chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return False
+
+        snapshot = self.tariff_source()
+        tariff = snapshot.tariff(board)
+        emission_factor = snapshot.emission_factor(board, 0.5)
+
+        chunk = pd.DataFrame(rows, columns=["id", "date", "energy_kwh", "consumer_id"])
+        chunk["month"] = chunk["date"].str[:7]
+        chunk["key"] = chunk["consumer_id"] + "|" + chunk["month"]
+        for key in chunk["key"].unique():
+            if key not in running_totals:
+                consumer, month = key.rsplit("|", 1)
+                running_totals[key] = self._month_baseline(cursor, board, consumer, month, start_date)
+
+        # Month-to-date before each row: carried total plus earlier rows in this chunk
+        running = chunk.groupby("key")["energy_kwh"].cumsum()
+        month_to_date = chunk["key"].map(running_totals) + running - chunk["energy_kwh"]
+        energy = chunk["energy_kwh"].to_numpy(dtype=float)
+        cost = tariff.price_many(energy, month_to_date.to_numpy(dtype=float))
+        # Same rate create_energy_log stores for a zero-energy reading
+        fallback_rate = snapshot.board(board)["price_per_kwh"]
+        price = np.where(energy > 0, cost / np.where(energy > 0, energy, 1), fallback_rate)
+        co2 = energy * emission_factor
+
+        for key, total in chunk.groupby("key")["energy_kwh"].sum().items():
+            running_totals[key] += total
+
+        last = rows[-1]
+        with conn:
+            conn.executemany("""
+                UPDATE energy_consumption SET cost_rupees = ?, price_per_kwh = ?, co2_emissions_kg = ?, tariff_version = ?
+                WHERE id = ?
+            """, [(float(c), float(p), float(e), snapshot.version, int(row_id))
+                  for c, p, e, row_id in zip(cost, price, co2, chunk["id"])])
+            conn.execute("""
+                UPDATE recompute_jobs
+                SET last_date = ?, last_id = ?, running_totals = ?, processed_rows = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (last[1], last[0], json.dumps(running_totals), processed_rows + len(rows), job_id))
+        return True
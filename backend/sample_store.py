@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import threading
+import time
+
+from tod_engine import TOD_UTC_OFFSET_SECONDS
+
+# How long each resolution is kept, in days (0 keeps it forever)
+SAMPLE_RETENTION_DAYS = float(os.getenv("SAMPLE_RETENTION_DAYS", "7"))
+ROLLUP_RETENTION_DAYS = {
+    "minute": float(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "90")),
+    "hour": float(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "730")),
+    "day": float(os.getenv("ROLLUP_DAY_RETENTION_DAYS", "0")),
+}
+# How often the rollup job runs, and how far back it re-aggregates to pick up late samples
+SAMPLE_ROLLUP_INTERVAL_SECONDS = float(os.getenv("SAMPLE_ROLLUP_INTERVAL_SECONDS", "60"))
+SAMPLE_ROLLUP_LATENESS_SECONDS = float(os.getenv("SAMPLE_ROLLUP_LATENESS_SECONDS", "300"))
+# Longest a sample's power is assumed to hold when the next sample is late
+SAMPLE_MAX_GAP_MS = 60_000
+
+MINUTE_MS = 60_000
+HOUR_MS = 3_600_000
+DAY_MS = 86_400_000
+# Hour and day buckets follow IST clock hours and calendar days (UTC+05:30)
+LOCAL_OFFSET_MS = TOD_UTC_OFFSET_SECONDS * 1000
+
+ROLLUP_TABLES = {
+    "minute": "sensor_samples_minute",
+    "hour": "sensor_samples_hour",
+    "day": "sensor_samples_day",
+}
+
+SAMPLE_INSERT_SQL = """
+    INSERT OR IGNORE INTO sensor_samples (device_id, ts_ms, power_watts, current_amps)
+    VALUES (?, ?, ?, ?)
+"""
+
+
+def ensure_sample_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_samples (
+            device_id TEXT NOT NULL,
+            ts_ms INTEGER NOT NULL,
+            power_watts REAL NOT NULL,
+            current_amps REAL,
+            PRIMARY KEY (device_id, ts_ms)
+        ) WITHOUT ROWID
+    """)
+    for table in ROLLUP_TABLES.values():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                device_id TEXT NOT NULL,
+                bucket_ms INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                energy_wh REAL NOT NULL,
+                avg_power_watts REAL,
+                min_power_watts REAL,
+                max_power_watts REAL,
+                avg_current_amps REAL,
+                PRIMARY KEY (device_id, bucket_ms)
+            ) WITHOUT ROWID
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_rollup_state (
+            resolution TEXT PRIMARY KEY,
+            watermark_ms INTEGER NOT NULL
+        )
+    """)
+
+
+def sample_rows(message: dict) -> list:
+    """sensor_samples rows (SAMPLE_INSERT_SQL order) for a decoded samples packet"""
+    device_id = message.get("device_id", "unknown")
+    return [(device_id, int(ts_ms), power, current) for ts_ms, power, current in message["samples"]]
+
+
+def device_ids(cursor, table: str = "sensor_samples") -> list:
+    """Distinct devices via repeated index seeks, without scanning every sample"""
+    cursor.execute(f"""
+        WITH RECURSIVE devices(device_id) AS (
+            SELECT MIN(device_id) FROM {table}
+            UNION ALL
+            SELECT (SELECT MIN(device_id) FROM {table} WHERE device_id > devices.device_id)
+            FROM devices WHERE devices.device_id IS NOT NULL
+        )
+        SELECT device_id FROM devices WHERE device_id IS NOT NULL
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def floor_bucket(ts_ms: int, bucket_ms: int, offset_ms: int = 0) -> int:
+    return (ts_ms + offset_ms) // bucket_ms * bucket_ms - offset_ms
+
+
+def rollup_minutes(cursor, device_id: str, start_ms: int, end_ms: int):
+    """Re-aggregate one device's raw samples in [start_ms, end_ms) into minute buckets.
+
+    Each sample's power holds until the next sample (at most SAMPLE_MAX_GAP_MS),
+    so samples just past end_ms are read to size the last interval. The newest
+    sample of a device contributes no energy until its successor arrives; the
+    lateness window re-aggregates it on a later run.
+    """
+    cursor.execute("DELETE FROM sensor_samples_minute WHERE device_id = ? AND bucket_ms >= ? AND bucket_ms < ?",
+                   (device_id, start_ms, end_ms))
+    cursor.execute("""
+        INSERT INTO sensor_samples_minute
+        (device_id, bucket_ms, samples, energy_wh, avg_power_watts, min_power_watts, max_power_watts, avg_current_amps)
+        SELECT device_id, ts_ms / :minute * :minute, COUNT(*), SUM(power_watts * held_ms) / 3600000.0,
+               AVG(power_watts), MIN(power_watts), MAX(power_watts), AVG(current_amps)
+        FROM (
+            SELECT device_id, ts_ms, power_watts, current_amps,
+                   MIN(COALESCE(LEAD(ts_ms) OVER (ORDER BY ts_ms) - ts_ms, 0), :max_gap) AS held_ms
+            FROM sensor_samples
+            WHERE device_id = :device AND ts_ms >= :start AND ts_ms < :end + :max_gap
+        )
+        WHERE ts_ms < :end
+        GROUP BY 1, 2
+    """, {"minute": MINUTE_MS, "max_gap": SAMPLE_MAX_GAP_MS, "device": device_id, "start": start_ms, "end": end_ms})
+
+
+def rollup_from(cursor, source: str, target: str, device_id: str, start_ms: int, end_ms: int,
+                bucket_ms: int, offset_ms: int = 0):
+    """Re-aggregate one device's finer rollup rows in [start_ms, end_ms) into coarser buckets"""
+    cursor.execute(f"DELETE FROM {target} WHERE device_id = ? AND bucket_ms >= ? AND bucket_ms < ?",
+                   (device_id, start_ms, end_ms))
+    cursor.execute(f"""
+        INSERT INTO {target}
+        (device_id, bucket_ms, samples, energy_wh, avg_power_watts, min_power_watts, max_power_watts, avg_current_amps)
+        SELECT device_id, (bucket_ms + :offset) / :bucket * :bucket - :offset, SUM(samples), SUM(energy_wh),
+               SUM(avg_power_watts * samples) / SUM(samples), MIN(min_power_watts), MAX(max_power_watts),
+               SUM(avg_current_amps * samples) / SUM(samples)
+        FROM {source}
+        WHERE device_id = :device AND bucket_ms >= :start AND bucket_ms < :end
+        GROUP BY 1, 2
+    """, {"offset": offset_ms, "bucket": bucket_ms, "device": device_id, "start": start_ms, "end": end_ms})
+
+
+class SampleRollupJob:
+    """Background rollup of raw samples into minute/hour/day tables, plus retention.
+
+    Each run re-aggregates every complete bucket since the last run (minus a
+    lateness allowance for delayed packets), then deletes rows older than each
+    resolution's retention. Raw samples are only deleted once rolled up.
+    """
+
+    def __init__(self, db_path: str, interval_seconds: float = SAMPLE_ROLLUP_INTERVAL_SECONDS,
+                 lateness_seconds: float = SAMPLE_ROLLUP_LATENESS_SECONDS):
+        self.db_path = db_path
+        self.interval_seconds = interval_seconds
+        self.lateness_ms = int(lateness_seconds * 1000)
+        self.last_run = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now_ms: int = None):
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        with self._run_lock:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                with conn:
+                    self._rollup(conn.cursor(), now_ms)
+                with conn:
+                    self._apply_retention(conn.cursor(), now_ms)
+            finally:
+                conn.close()
+            self.last_run = now_ms
+
+    def _rollup(self, cursor, now_ms: int):
+        cursor.execute("SELECT watermark_ms FROM sensor_rollup_state WHERE resolution = 'minute'")
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("SELECT MIN(ts_ms) FROM sensor_samples")
+            first = cursor.fetchone()[0]
+            if first is None:
+                return
+            watermark = floor_bucket(first, MINUTE_MS)
+        else:
+            watermark = row[0]
+
+        # Only complete buckets; the current minute/hour/day is picked up by a later run
+        start = floor_bucket(max(watermark - self.lateness_ms, 0), MINUTE_MS)
+        end = floor_bucket(now_ms, MINUTE_MS)
+        if end <= start:
+            return
+        hour_start = floor_bucket(start, HOUR_MS, LOCAL_OFFSET_MS)
+        hour_end = floor_bucket(end, HOUR_MS, LOCAL_OFFSET_MS)
+        day_start = floor_bucket(start, DAY_MS, LOCAL_OFFSET_MS)
+        day_end = floor_bucket(end, DAY_MS, LOCAL_OFFSET_MS)
+
+        for device_id in device_ids(cursor):
+            rollup_minutes(cursor, device_id, start, end)
+            if hour_end > hour_start:
+                rollup_from(cursor, ROLLUP_TABLES["minute"], ROLLUP_TABLES["hour"], device_id, hour_start, hour_end,
+                            HOUR_MS, LOCAL_OFFSET_MS)
+            if day_end > day_start:
+                rollup_from(cursor, ROLLUP_TABLES["hour"], ROLLUP_TABLES["day"], device_id, day_start, day_end,
+                            DAY_MS, LOCAL_OFFSET_MS)
+
+        cursor.execute("""
+            INSERT INTO sensor_rollup_state (resolution, watermark_ms) VALUES ('minute', ?)
+            ON CONFLICT (resolution) DO UPDATE SET watermark_ms = excluded.watermark_ms
+        """, (end,))
+
+    def _apply_retention(self, cursor, now_ms: int):
+        cursor.execute("SELECT watermark_ms FROM sensor_rollup_state WHERE resolution = 'minute'")
+        row = cursor.fetchone()
+        if row is not None and SAMPLE_RETENTION_DAYS > 0:
+            # Never drop raw samples that have not been rolled up yet
+            cutoff = min(now_ms - int(SAMPLE_RETENTION_DAYS * DAY_MS), row[0] - self.lateness_ms)
+            for device_id in device_ids(cursor):
+                cursor.execute("DELETE FROM sensor_samples WHERE device_id = ? AND ts_ms < ?", (device_id, cutoff))
+        for resolution, table in ROLLUP_TABLES.items():
+            days = ROLLUP_RETENTION_DAYS[resolution]
+            if days > 0:
+                cutoff = now_ms - int(days * DAY_MS)
+                for device_id in device_ids(cursor, table):
+                    cursor.execute(f"DELETE FROM {table} WHERE device_id = ? AND bucket_ms < ?", (device_id, cutoff))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Sample rollup failed: {e}")
+
+
+def query_samples(db_path: str, device_id: str, start_ms: int, end_ms: int, resolution: str = "minute",
+                  limit: int = 10000) -> list:
+    """Raw samples or rollup rows for one device in [start_ms, end_ms), oldest first"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        if resolution == "raw":
+            rows = conn.execute("""
+                SELECT ts_ms, power_watts, current_amps FROM sensor_samples
+                WHERE device_id = ? AND ts_ms >= ? AND ts_ms < ?
+                ORDER BY ts_ms LIMIT ?
+            """, (device_id, start_ms, end_ms, limit)).fetchall()
+        else:
+            rows = conn.execute(f"""
+                SELECT bucket_ms, samples, energy_wh, avg_power_watts, min_power_watts, max_power_watts, avg_current_amps
+                FROM {ROLLUP_TABLES[resolution]}
+                WHERE device_id = ? AND bucket_ms >= ? AND bucket_ms < ?
+                ORDER BY bucket_ms LIMIT ?
+            """, (device_id, start_ms, end_ms, limit)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
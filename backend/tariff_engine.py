@@ -0,0 +1,150 @@
+import bisect
+import csv
+import glob
+import os
+import numpy as np
+
+
+def load_slab_csv(path: str) -> list:
+    """Load one board's slab table from a CSV in the kseb_slabs.csv format"""
+    slabs = []
+    with open(path, 'r') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            slabs.append({
+                'units_min': int(row['units_min']),
+                'units_max': int(row['units_max']),
+                'rate_per_kwh': float(row['rate_per_kwh']),
+                'slab_description': row['slab_description']
+            })
+    return slabs
+
+
+def load_board_slabs(directory: str = ".") -> dict:
+    """Load every <board>_slabs.csv in a directory, keyed by board id"""
+    tables = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*_slabs.csv"))):
+        board_id = os.path.basename(path)[:-len("_slabs.csv")]
+        tables[board_id] = load_slab_csv(path)
+    return tables
+
+
+class CompiledTariff:
+    """A board's slab table compiled into sorted boundary arrays.
+
+    Band i covers consumption in (upper_bounds[i-1], upper_bounds[i]] at rates[i];
+    anything above the last bound is billed at the last rate. Non-telescopic
+    tariffs bill every unit of the reading at the rate of the band the month
+    total falls in; telescopic tariffs bill each unit at the rate of its own band.
+    """
+
+    def __init__(self, board_id: str, upper_bounds: list, rates: list, telescopic: bool = False,
+                 fixed_charge: float = 0.0):
+        self.board_id = board_id
+        self.upper_bounds = list(upper_bounds)
+        self.rates = list(rates)
+        self.telescopic = telescopic
+        self.fixed_charge = fixed_charge
+
+        # Extra open-ended band past the last bound, billed at the last rate
+        self._bounds = np.array(self.upper_bounds, dtype=float)
+        self._rates = np.array(self.rates + [self.rates[-1]], dtype=float)
+        lower_bounds = [0.0] + self.upper_bounds
+        self._lower = np.array(lower_bounds, dtype=float)
+        # Telescopic cost of consuming everything below each band
+        band_costs = [(upper - lower) * rate if rate else 0.0
+                      for lower, upper, rate in zip(lower_bounds, self.upper_bounds, self.rates)]
+        self._cost_below = np.concatenate(([0.0], np.cumsum(band_costs)))
+
+    @property
+    def is_tiered(self) -> bool:
+        """Whether pricing depends on month-to-date consumption"""
+        return len(set(self.rates)) > 1
+
+    def band_index(self, total_kwh: float) -> int:
+        return bisect.bisect_left(self.upper_bounds, total_kwh)
+
+    def rate_for(self, total_kwh: float) -> float:
+        """Rate of the band a month total falls in"""
+        return self._rates[self.band_index(total_kwh)]
+
+    def _cumulative_cost(self, total_kwh: float) -> float:
+        index = self.band_index(total_kwh)
+        return self._cost_below[index] + (total_kwh - self._lower[index]) * self._rates[index]
+
+    def price(self, energy_kwh: float, month_to_date: float = 0) -> float:
+        """Energy charge for one reading given the month's consumption before it"""
+        total = month_to_date + energy_kwh
+        if self.telescopic:
+            return float(self._cumulative_cost(total) - self._cumulative_cost(month_to_date))
+        return float(energy_kwh * self.rate_for(total))
+
+    def price_many(self, energy_kwh, month_to_date=0) -> np.ndarray:
+        """Vectorized price() over arrays of readings"""
+        energy = np.asarray(energy_kwh, dtype=float)
+        before = np.broadcast_to(np.asarray(month_to_date, dtype=float), energy.shape)
+        total = before + energy
+        if self.telescopic:
+            return self._cumulative_cost_many(total) - self._cumulative_cost_many(before)
+        return energy * self._rates[np.searchsorted(self._bounds, total, side="left")]
+
+    def _cumulative_cost_many(self, totals: np.ndarray) -> np.ndarray:
+        index = np.searchsorted(self._bounds, totals, side="left")
+        return self._cost_below[index] + (totals - self._lower[index]) * self._rates[index]
+
+    def monthly_bill(self, total_kwh: float) -> float:
+        """Full bill for a month's consumption, including the fixed charge"""
+        return self.price(total_kwh, 0) + self.fixed_charge
+
+
+def compile_slabs(board_id: str, slabs: list, telescopic: bool = False, fixed_charge: float = 0.0) -> CompiledTariff:
+    """Compile a slab list into a CompiledTariff.
+
+    Slab files may list overlapping cumulative ranges (0-250, 0-300, ...); each
+    slab's units_max is taken as its band's upper bound, which selects the
+    tightest slab covering a total regardless of the order rows are listed in.
+    """
+    if not slabs:
+        raise ValueError(f"Tariff for '{board_id}' has no slabs")
+    upper_bounds = []
+    rates = []
+    for slab in sorted(slabs, key=lambda slab: (slab['units_max'], slab['units_min'])):
+        if slab['rate_per_kwh'] < 0:
+            raise ValueError(f"Tariff for '{board_id}' has a negative rate")
+        if upper_bounds and slab['units_max'] == upper_bounds[-1]:
+            continue
+        upper_bounds.append(float(slab['units_max']))
+        rates.append(float(slab['rate_per_kwh']))
+    return CompiledTariff(board_id, upper_bounds, rates, telescopic, fixed_charge)
+
+
+def compile_tariffs(boards: dict, slab_tables: dict) -> dict:
+    """Compile a tariff for every board: its slab table if it has one, otherwise its flat price_per_kwh"""
+    tariffs = {}
+    for board_id, board in boards.items():
+        telescopic = board.get("telescopic", False)
+        fixed_charge = board.get("fixed_charge_rupees", 0.0)
+        if board_id in slab_tables:
+            tariffs[board_id] = compile_slabs(board_id, slab_tables[board_id], telescopic, fixed_charge)
+        else:
+            tariffs[board_id] = CompiledTariff(board_id, [float("inf")], [board["price_per_kwh"]],
+                                               telescopic, fixed_charge)
+    return tariffs
+
+
+def price_by_board(tariffs: dict, boards, energy_kwh, month_to_date=0, default_board: str = "mseb") -> np.ndarray:
+    """Price readings for mixed boards: one price_many call per distinct board.
+
+    Unknown boards are priced with the default board's tariff, like a single
+    calculate_tiered_cost call.
+    """
+    board_ids = np.asarray(boards, dtype=object)
+    energy = np.asarray(energy_kwh, dtype=float)
+    before = np.broadcast_to(np.asarray(month_to_date, dtype=float), energy.shape)
+    cost = np.empty(energy.shape, dtype=float)
+    unique_boards, inverse = np.unique(board_ids.astype(str), return_inverse=True)
+    for index, board_id in enumerate(unique_boards):
+        mask = inverse == index
+        tariff = tariffs.get(board_id, tariffs[default_board])
+        cost[mask] = tariff.price_many(energy[mask], before[mask])
+    return cost
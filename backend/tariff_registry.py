@@ -0,0 +1,194 @@
+import copy
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import tariff_engine
+import tod_engine
+
+# How often (seconds) the registry checks its source files for changes
+TARIFF_POLL_SECONDS = float(os.getenv("TARIFF_POLL_SECONDS", "5"))
+
+REQUIRED_BOARD_FIELDS = ("name", "state", "price_per_kwh", "emission_factor", "grid_mix")
+
+UNKNOWN_BOARD_ERROR = "unknown electricity_board"
+
+
+class TariffSnapshot:
+    """One validated version of the tariff tables; never modified after it is published"""
+
+    def __init__(self, version: str, boards: dict, slabs: dict, tariffs: dict,
+                 tod_schedules: dict = None, emission_series: dict = None):
+        self.version = version
+        self.boards = boards
+        self.slabs = slabs
+        self.tariffs = tariffs
+        self.tod_schedules = tod_schedules or {}
+        self.emission_series = emission_series or {}
+        self.loaded_at = time.time()
+
+    def board(self, board_id: str) -> dict:
+        return self.boards.get(board_id, self.boards["mseb"])
+
+    def tariff(self, board_id: str) -> tariff_engine.CompiledTariff:
+        return self.tariffs.get(board_id, self.tariffs["mseb"])
+
+    def emission_factor(self, board_id: str, default: float = 0.5) -> float:
+        board = self.boards.get(board_id)
+        return board["emission_factor"] if board else default
+
+    def tod_schedule(self, board_id: str) -> tod_engine.TodSchedule:
+        return self.tod_schedules.get(board_id, self.tod_schedules["mseb"])
+
+
+def known_board(boards: dict, board_id) -> bool:
+    """Whether rows may be stored under board_id.
+
+    Every insert path checks boards with this: the API and bulk uploads reject
+    other boards with UNKNOWN_BOARD_ERROR instead of quietly pricing them as mseb.
+    """
+    return board_id in boards
+
+
+def validate_boards(boards: dict):
+    if "mseb" not in boards:
+        raise ValueError("Tariff tables must keep the default 'mseb' board")
+    for board_id, board in boards.items():
+        missing = [field for field in REQUIRED_BOARD_FIELDS if field not in board]
+        if missing:
+            raise ValueError(f"Board '{board_id}' is missing {', '.join(missing)}")
+        if board["price_per_kwh"] < 0 or board["emission_factor"] < 0:
+            raise ValueError(f"Board '{board_id}' has a negative price or emission factor")
+
+
+class TariffRegistry:
+    """Tariff tables loaded from files and swapped in atomically when the files change.
+
+    Sources are the built-in board defaults, an optional electricity_boards.json
+    whose entries are merged over them, and every <board>_slabs.csv and
+    <board>_emission_factors.csv in the directory. A new version is built and validated off to the side; readers
+    keep using the snapshot they already hold, and only a fully compiled
+    snapshot replaces the current one (a single reference assignment).
+    """
+
+    def __init__(self, default_boards: dict, default_slabs: dict, directory: str = ".",
+                 boards_file: str = "electricity_boards.json", db_path: str = None,
+                 poll_seconds: float = TARIFF_POLL_SECONDS):
+        self.default_boards = copy.deepcopy(default_boards)
+        self.default_slabs = copy.deepcopy(default_slabs)
+        self.directory = directory
+        self.boards_file = os.path.join(directory, boards_file)
+        self.db_path = db_path
+        self.poll_seconds = poll_seconds
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._signature = self._source_signature()
+        self._snapshot = self._build()
+
+    def current(self) -> TariffSnapshot:
+        return self._snapshot
+
+    def _source_files(self) -> list:
+        files = sorted(glob.glob(os.path.join(self.directory, "*_slabs.csv")) +
+                       glob.glob(os.path.join(self.directory, "*_emission_factors.csv")))
+        if os.path.exists(self.boards_file):
+            files.append(self.boards_file)
+        return files
+
+    def _source_signature(self) -> tuple:
+        signature = []
+        for path in self._source_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _build(self) -> TariffSnapshot:
+        """Load, validate and compile a new snapshot from the source files"""
+        boards = copy.deepcopy(self.default_boards)
+        if os.path.exists(self.boards_file):
+            with open(self.boards_file, "r") as f:
+                overrides = json.load(f)
+            for board_id, fields in overrides.items():
+                boards[board_id] = {**boards.get(board_id, {}), **fields}
+        validate_boards(boards)
+
+        slabs = {**copy.deepcopy(self.default_slabs), **tariff_engine.load_board_slabs(self.directory)}
+        tariffs = tariff_engine.compile_tariffs(boards, slabs)
+        tod_schedules = {board_id: tod_engine.compile_schedule(board) for board_id, board in boards.items()}
+        emission_series = tod_engine.load_emission_series(self.directory)
+
+        digest = hashlib.sha256(json.dumps({"boards": boards, "slabs": slabs}, sort_keys=True).encode("utf-8"))
+        for board_id, (hour_starts, factors) in sorted(emission_series.items()):
+            digest.update(board_id.encode("utf-8") + hour_starts.tobytes() + factors.tobytes())
+        version = digest.hexdigest()[:12]
+        return TariffSnapshot(version, boards, slabs, tariffs, tod_schedules, emission_series)
+
+    def reload(self) -> bool:
+        """Rebuild from the source files; returns True if a new version was published"""
+        with self._reload_lock:
+            self._signature = self._source_signature()
+            try:
+                snapshot = self._build()
+            except Exception as e:
+                # Keep serving the last good version
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Tariff reload rejected: {self.last_error}")
+                return False
+            self.last_error = None
+            if snapshot.version == self._snapshot.version:
+                return False
+            self._record_version(snapshot)
+            self._snapshot = snapshot
+            print(f"Tariff tables updated to version {snapshot.version}")
+            return True
+
+    def ensure_version_table(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tariff_versions (
+                version TEXT PRIMARY KEY,
+                boards TEXT NOT NULL,
+                slabs TEXT NOT NULL,
+                loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    def _record_version(self, snapshot: TariffSnapshot):
+        """Keep every published version so stored rows can be traced to the tables that priced them"""
+        if not self.db_path:
+            return
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            self.ensure_version_table(conn.cursor())
+            conn.execute("""
+                INSERT OR IGNORE INTO tariff_versions (version, boards, slabs) VALUES (?, ?, ?)
+            """, (snapshot.version, json.dumps(snapshot.boards), json.dumps(snapshot.slabs)))
+        conn.close()
+
+    def start(self):
+        """Record the current version and watch the source files in a background thread"""
+        self._record_version(self._snapshot)
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            if self._source_signature() != self._signature:
+                self.reload()
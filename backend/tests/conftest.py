@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Backend modules are imported flat, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest_schema  # noqa: E402  (needs the path above)
+
+
+@pytest.fixture
+def ingest_db(tmp_path):
+    """A database with the tables device ingest and the log APIs use"""
+    path = str(tmp_path / "carbon_footprint.db")
+    ingest_schema.init_ingest_db(path)
+    return path
+
+
+def insert_energy_logs(db_path: str, rows: list):
+    """Insert (date, energy_kwh, device_id, user_id) energy rows"""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("""
+            INSERT INTO energy_consumption (date, power_consumption_watts, duration_hours, energy_kwh,
+                                            co2_emissions_kg, electricity_board, device_id, user_id)
+            VALUES (?, 1000 * ?, 1, ?, 0.5 * ?, 'mseb', ?, ?)
+        """, [(date, kwh, kwh, kwh, device_id, user_id) for date, kwh, device_id, user_id in rows])
+    conn.close()
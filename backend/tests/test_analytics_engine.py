@@ -0,0 +1,92 @@
+import sqlite3
+import time
+
+import pytest
+
+from analytics_engine import AnalyticsEngine
+from conftest import insert_energy_logs
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def engine(ingest_db, tmp_path):
+    insert_energy_logs(ingest_db, [
+        ("2025-01-05", 10.0, "esp32_001", "alice"),
+        ("2025-01-20", 5.0, "esp32_002", "bob"),
+        ("2025-02-01", 2.0, "esp32_001", "alice"),
+    ])
+    conn = sqlite3.connect(ingest_db)
+    with conn:
+        conn.execute("""
+            INSERT INTO commute_logs (date, transport_mode, distance_km, co2_emissions_kg, device_id, user_id)
+            VALUES ('2025-02-03', 'car', 20, 4.0, 'esp32_001', 'alice')
+        """)
+        conn.execute("UPDATE energy_consumption SET cost_rupees = energy_kwh * 6")
+    conn.close()
+    engine = AnalyticsEngine(ingest_db, snapshot_dir=str(tmp_path / "snapshots"))
+    engine.refresh()
+    return engine
+
+
+def test_monthly_data_joins_commute_and_energy_months(engine):
+    months = engine.monthly_data()
+    assert [(m["year"], m["month"]) for m in months] == [(2025, 2), (2025, 1)]
+    assert months[0]["total_commute_co2"] == 4.0
+    assert months[0]["energy_consumption_kwh"] == 2.0
+    assert months[1]["total_commute_co2"] == 0
+    assert months[1]["energy_consumption_kwh"] == 15.0
+    assert months[1]["total_energy_cost"] == 90.0
+
+
+def test_owner_filters_apply_to_both_tables(engine):
+    months = engine.monthly_data(user_id="bob")
+    assert [(m["month"], m["energy_consumption_kwh"], m["total_commute_co2"]) for m in months] == [(1, 5.0, 0)]
+
+
+def test_dashboard_stats_split_all_time_and_current_month(engine):
+    stats = engine.dashboard_stats("2025-02", device_id="esp32_001")
+    assert stats == {
+        "total_commute_co2": 4.0,
+        "month_commute_co2": 4.0,
+        "total_energy_co2": 6.0,
+        "total_energy_cost": 72.0,
+        "month_energy_co2": 1.0,
+        "month_energy_cost": 12.0,
+    }
+
+
+def test_queries_never_refresh_inline(engine, ingest_db):
+    insert_energy_logs(ingest_db, [("2025-02-02", 1.0, "esp32_001", "alice")])
+    assert engine.monthly_data()[0]["energy_consumption_kwh"] == 2.0
+    engine.refresh()
+    assert engine.monthly_data()[0]["energy_consumption_kwh"] == 3.0
+
+
+def test_writes_and_lag_make_snapshots_stale(engine):
+    assert engine.is_fresh()
+    engine.mark_dirty()
+    assert not engine.is_fresh()
+    engine.refresh()
+    assert engine.is_fresh()
+    engine.last_refresh -= engine.max_lag_seconds + 1
+    assert not engine.is_fresh()
+
+
+def test_never_fresh_before_the_first_export(ingest_db, tmp_path):
+    assert not AnalyticsEngine(ingest_db, snapshot_dir=str(tmp_path / "snapshots")).is_fresh()
+
+
+def test_background_refresh_follows_writes(engine):
+    engine.debounce_seconds = 0
+    engine.max_lag_seconds = 3600
+    engine.start()
+    try:
+        engine.mark_dirty()
+        deadline = time.monotonic() + 10
+        while not engine.is_fresh() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert engine.is_fresh()
+    finally:
+        engine.stop()
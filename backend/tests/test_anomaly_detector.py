@@ -0,0 +1,91 @@
+import sqlite3
+
+import pytest
+
+import anomaly_detector
+from anomaly_detector import AnomalyDetector, message_readings
+from power_stats import WARMUP_READINGS, PowerStats
+
+DEVICE = "esp32_001"
+
+
+def samples(start_ms, powers, step_ms=1000):
+    return {"type": "samples", "device_id": DEVICE,
+            "samples": [(start_ms + i * step_ms, power, 0.0) for i, power in enumerate(powers)]}
+
+
+def kinds(events):
+    return [event["kind"] for event in events]
+
+
+def test_power_stats_track_mean_and_spread():
+    stats = PowerStats()
+    assert (stats.readings, stats.std, stats.warmed_up) == (0, 0.0, False)
+    stats.add(100.0)
+    assert (stats.mean, stats.variance) == (100.0, 0.0)
+    stats.add(110.0, alpha=0.5)
+    assert stats.mean == 105.0
+    assert stats.variance == pytest.approx(0.5 * (0 + 0.5 * 100))
+    for _ in range(WARMUP_READINGS):
+        stats.add(105.0)
+    assert stats.warmed_up
+
+
+def test_message_readings():
+    assert message_readings({"type": "energy", "power_watts": 40}, 5000) == [(5000, 40)]
+    assert message_readings(samples(0, [1, 2]), 9) == [(0, 1), (1000, 2)]
+    assert message_readings({"type": "commute"}, 9) == []
+
+
+def test_spike_reported_once_per_run_and_only_after_warmup():
+    detector = AnomalyDetector(flatline_readings=1000)
+    noisy = [100 + (i % 5) for i in range(WARMUP_READINGS)]
+    # A jump before the device has enough history is not scored
+    assert detector.check(samples(0, noisy[:5] + [500] + noisy[5:]), received_ms=1) == []
+    assert detector.check(samples(30_000, noisy), received_ms=2) == []
+    events = detector.check(samples(60_000, [500, 520, 102, 900]), received_ms=3)
+    assert kinds(events) == ["spike", "spike"]
+    assert events[0]["power_watts"] == 500
+    assert events[0]["expected_watts"] == pytest.approx(102, abs=10)
+
+
+def test_flatline_needs_a_non_idle_signal():
+    detector = AnomalyDetector(flatline_readings=5)
+    assert kinds(detector.check(samples(0, [230.0] * 8))) == ["flatline"]
+    idle = AnomalyDetector(flatline_readings=5)
+    assert idle.check(samples(0, [0.0] * 8)) == []
+
+
+def test_dropout_from_a_gap_and_from_silence():
+    events_seen = []
+    detector = AnomalyDetector(dropout_seconds=60, flatline_readings=1000, on_event=events_seen.append)
+    detector.check(samples(0, [10, 11]), received_ms=1000)
+    assert kinds(detector.check(samples(200_000, [12]), received_ms=200_000)) == ["dropout"]
+    # Duplicates are ignored rather than scored again
+    assert detector.check(samples(200_000, [5000]), received_ms=200_001) == []
+    assert detector.sweep(now_ms=230_000) == []
+    assert kinds(detector.sweep(now_ms=300_000)) == ["dropout"]
+    # Already reported as silent
+    assert detector.sweep(now_ms=400_000) == []
+    assert kinds(events_seen) == ["dropout", "dropout"]
+    assert detector.stats()["events"] == {"spike": 0, "flatline": 0, "dropout": 2}
+
+
+def test_query_anomalies_filters_by_device_kind_and_half_open_time_range(ingest_db):
+    conn = sqlite3.connect(ingest_db)
+    with conn:
+        conn.executemany(anomaly_detector.ANOMALY_INSERT_SQL, [
+            ("esp32_001", "spike", 0, 900.0, 100.0, 8.0, None),
+            ("esp32_001", "spike", 1000, 900.0, 100.0, 8.0, None),
+            ("esp32_001", "flatline", 1500, 50.0, None, None, None),
+            ("esp32_002", "spike", 1500, 900.0, 100.0, 8.0, None),
+            ("esp32_001", "spike", 2000, 900.0, 100.0, 8.0, None),
+        ])
+    conn.close()
+
+    def stamps(**filters):
+        return [(row["device_id"], row["ts_ms"]) for row in anomaly_detector.query_anomalies(ingest_db, **filters)]
+
+    assert stamps(device_id="esp32_001", kind="spike", start_ms=0, end_ms=2000) == [("esp32_001", 1000), ("esp32_001", 0)]
+    assert sorted(stamps(start_ms=1500)) == [("esp32_001", 1500), ("esp32_001", 2000), ("esp32_002", 1500)]
+    assert len(stamps(limit=2)) == 2
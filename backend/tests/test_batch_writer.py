@@ -0,0 +1,199 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import ingest_schema
+from batch_writer import BatchWriter, is_stall
+
+ENERGY_SQL = "INSERT INTO energy_consumption (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg) VALUES (?, ?, ?, ?, ?)"
+MISSING_SQL = "INSERT INTO no_such_table (value) VALUES (?)"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "ingest.db")
+    ingest_schema.init_ingest_db(path)
+    return path
+
+
+def energy_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT date, energy_kwh FROM energy_consumption ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_is_stall_only_for_locked_or_busy():
+    assert is_stall(sqlite3.OperationalError("database is locked"))
+    assert is_stall(sqlite3.OperationalError("database is busy"))
+    assert not is_stall(sqlite3.OperationalError("no such table: sensor_samples"))
+    assert not is_stall(sqlite3.OperationalError("table energy_consumption has no column named tariff"))
+    assert not is_stall(sqlite3.IntegrityError("database is locked"))
+
+
+def test_bad_row_kind_does_not_roll_back_the_rest(db_path, tmp_path):
+    spill_dir = tmp_path / "spill"
+    writer = BatchWriter(db_path, spill_dir=str(spill_dir), max_delay_ms=10)
+    commits = []
+    writer.on_commit = commits.append
+    writer.start()
+    writer.submit(ENERGY_SQL, ("2025-01-01", 100, 1, 0.1, 0.08))
+    writer.submit(MISSING_SQL, (1,))
+    writer.submit(ENERGY_SQL, ("2025-01-02", 100, 1, 0.1, 0.08))
+    writer.stop()
+
+    assert energy_rows(db_path) == [("2025-01-01", 0.1), ("2025-01-02", 0.1)]
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"], stats["spilled"]) == (2, 1, 0)
+    assert not stats["stalled"]
+    assert list(commits[0]) == [ENERGY_SQL]
+    # Rejected rows are not spilled, so they are never replayed
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_locked_database_spills_and_replays(db_path, tmp_path):
+    spill_dir = tmp_path / "spill"
+    writer = BatchWriter(db_path, spill_dir=str(spill_dir), max_delay_ms=10, busy_timeout_ms=10,
+                         retry_seconds=0.05)
+    locker = sqlite3.connect(db_path)
+    locker.execute("BEGIN EXCLUSIVE")
+    writer.start()
+    writer.submit(ENERGY_SQL, ("2025-01-01", 100, 1, 0.1, 0.08))
+    deadline = time.monotonic() + 5
+    while writer.spilled == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.spilled == 1
+    locker.rollback()
+    locker.close()
+    while writer.replayed == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.stop()
+
+    assert energy_rows(db_path) == [("2025-01-01", 0.1)]
+    assert (writer.written, writer.replayed, writer.failed) == (1, 1, 0)
+
+
+def test_ingest_schema_migrates_an_old_energy_table(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE energy_consumption (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, power_consumption_watts REAL NOT NULL,
+            duration_hours REAL NOT NULL, energy_kwh REAL NOT NULL, co2_emissions_kg REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    conn.close()
+    ingest_schema.init_ingest_db(path)
+    conn = sqlite3.connect(path)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(energy_consumption)")}
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert {"device_id", "user_id", "cost_rupees", "tariff_version"} <= columns
+    assert {"commute_logs", "sensor_samples", "anomalies"} <= tables
+
+
+def test_rows_from_many_threads_are_group_committed(db_path):
+    writer = BatchWriter(db_path, max_rows=100, max_delay_ms=50)
+    committed = []
+    writer.on_commit = lambda statements: committed.append(sum(len(rows) for rows in statements.values()))
+    writer.start()
+    threads = [
+        threading.Thread(target=lambda day=day: [writer.submit(ENERGY_SQL, (f"2025-01-{day:02d}", 1, 1, 0.001, 0))
+                                                 for _ in range(100)])
+        for day in range(1, 6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.stop()
+
+    assert len(energy_rows(db_path)) == 500
+    assert sum(committed) == writer.written == 500
+    # One transaction per batch, not per row
+    assert writer.batches == len(committed) <= 10
+    assert writer.stats()["write_latency_ms"]["max"] > 0
+
+
+def test_block_policy_refuses_rows_when_full(db_path):
+    writer = BatchWriter(db_path, queue_size=2, policy="block")
+    assert writer.submit(ENERGY_SQL, ("2025-01-01", 1, 1, 1, 1), block=False)
+    assert writer.submit(ENERGY_SQL, ("2025-01-02", 1, 1, 1, 1), block=False)
+    assert not writer.submit(ENERGY_SQL, ("2025-01-03", 1, 1, 1, 1), block=False)
+    assert writer.dropped == 1
+    writer.start()
+    writer.stop()
+    assert [date for date, _ in energy_rows(db_path)] == ["2025-01-01", "2025-01-02"]
+
+
+def test_drop_oldest_policy_evicts_the_head(db_path):
+    writer = BatchWriter(db_path, queue_size=2, policy="drop_oldest")
+    for day in (1, 2, 3):
+        assert writer.submit(ENERGY_SQL, (f"2025-01-0{day}", 1, 1, 1, 1))
+    assert writer.evicted == 1
+    writer.start()
+    writer.stop()
+    assert [date for date, _ in energy_rows(db_path)] == ["2025-01-02", "2025-01-03"]
+
+
+def test_coalesce_policy_merges_rows_with_the_same_key(db_path):
+    writer = BatchWriter(db_path, queue_size=2, policy="coalesce")
+
+    def merge(old, new):
+        return (old[0], old[1], old[2] + new[2], old[3] + new[3], old[4] + new[4])
+
+    writer.submit(ENERGY_SQL, ("2025-01-01", 1, 1, 1.0, 1), key="a", merge=merge)
+    writer.submit(ENERGY_SQL, ("2025-01-01", 1, 1, 2.0, 1), key="b", merge=merge)
+    # Queue is full: same key folds in, a new key evicts the oldest
+    writer.submit(ENERGY_SQL, ("2025-01-01", 1, 1, 4.0, 1), key="b", merge=merge)
+    writer.submit(ENERGY_SQL, ("2025-01-02", 1, 1, 8.0, 1), key="c", merge=merge)
+    assert (writer.coalesced, writer.evicted) == (1, 1)
+    writer.start()
+    writer.stop()
+    assert energy_rows(db_path) == [("2025-01-01", 6.0), ("2025-01-02", 8.0)]
+
+
+def test_unknown_policy_is_rejected(db_path):
+    with pytest.raises(ValueError):
+        BatchWriter(db_path, policy="random")
+
+
+def test_prepare_rewrites_rows_inside_the_transaction(db_path):
+    writer = BatchWriter(db_path, max_delay_ms=10)
+    seen = []
+
+    def prepare(cursor, sql, rows):
+        seen.append(cursor.connection.in_transaction)
+        return [(date, power, duration, kwh * 2, co2) for date, power, duration, kwh, co2 in rows]
+
+    writer.prepare = prepare
+    commits = []
+    writer.on_commit = commits.append
+    writer.start()
+    writer.submit(ENERGY_SQL, ("2025-01-01", 1, 1, 1.5, 1))
+    writer.stop()
+    assert seen == [True]
+    assert energy_rows(db_path) == [("2025-01-01", 3.0)]
+    assert commits == [{ENERGY_SQL: [("2025-01-01", 1, 1, 3.0, 1)]}]
+
+
+def test_a_failing_prepare_only_loses_its_rows(db_path):
+    writer = BatchWriter(db_path, max_delay_ms=10)
+
+    def prepare(cursor, sql, rows):
+        if sql == ENERGY_SQL:
+            raise KeyError("no tariff")
+        return rows
+
+    writer.prepare = prepare
+    writer.start()
+    writer.submit(ENERGY_SQL, ("2025-01-01", 1, 1, 1, 1))
+    writer.submit("INSERT INTO commute_logs (date, transport_mode, distance_km, co2_emissions_kg) VALUES (?, ?, ?, ?)",
+                  ("2025-01-01", "bus", 3.0, 0.3))
+    writer.stop()
+    assert (writer.failed, writer.written) == (1, 1)
+    assert energy_rows(db_path) == []
@@ -0,0 +1,148 @@
+import sqlite3
+
+import pytest
+
+import bulk_ingest
+import consumption_counters
+import ingest_schema
+import tariff_engine
+
+GRID_MIX = {"coal": 1.0}
+BOARDS = {
+    "mseb": {"name": "MSEB", "state": "Maharashtra", "price_per_kwh": 6.5, "emission_factor": 0.8, "grid_mix": GRID_MIX},
+    "kseb": {"name": "KSEB", "state": "Kerala", "price_per_kwh": 7.0, "emission_factor": 0.5, "grid_mix": GRID_MIX},
+}
+KSEB_SLABS = [
+    {"units_min": 0, "units_max": 100, "rate_per_kwh": 4.0, "slab_description": "0-100 units"},
+    {"units_min": 100, "units_max": 999999, "rate_per_kwh": 8.0, "slab_description": "above 100 units"},
+]
+TARIFFS = tariff_engine.compile_tariffs(BOARDS, {"kseb": KSEB_SLABS})
+ENERGY_COLUMNS = ["date", "power_consumption_watts", "duration_hours", "energy_kwh", "co2_emissions_kg",
+                  "electricity_board", "price_per_kwh", "cost_rupees", "device_id", "user_id"]
+ENERGY_SQL = f"INSERT INTO energy_consumption ({', '.join(ENERGY_COLUMNS)}) VALUES ({', '.join('?' * len(ENERGY_COLUMNS))})"
+
+
+def records(*rows):
+    return list(enumerate(rows))
+
+
+def test_parse_records_formats():
+    assert bulk_ingest.parse_records(b'{"a": 1}\nnot json\n[1]\n', "ndjson")[0] == [(0, {"a": 1})]
+    _, errors = bulk_ingest.parse_records(b'{"a": 1}\nnot json\n[1]\n', "ndjson")
+    assert [error["row"] for error in errors] == [1, 2]
+    assert bulk_ingest.parse_records(b"date,distance_km\n2025-01-01,\n", "csv")[0] == [(0, {"date": "2025-01-01"})]
+    assert bulk_ingest.parse_records(b'{"records": [{"a": 1}, 2]}', "json") == ([(0, {"a": 1})], [
+        {"row": 1, "error": "Each record must be a JSON object"}])
+    with pytest.raises(ValueError):
+        bulk_ingest.parse_records(b'"text"', "json")
+
+
+def test_detect_format():
+    assert bulk_ingest.detect_format("application/x-ndjson") == "ndjson"
+    assert bulk_ingest.detect_format("", "upload.CSV") == "csv"
+    assert bulk_ingest.detect_format("application/json", "") == "json"
+
+
+def test_energy_validation_reports_the_first_problem_per_row():
+    frame, errors = bulk_ingest.prepare_energy_logs(records(
+        {"date": "2025-01-02", "power_consumption_watts": 1000, "duration_hours": 2, "device_id": 7},
+        {"power_consumption_watts": 10, "duration_hours": 1},
+        {"date": "yesterday", "power_consumption_watts": "x", "duration_hours": 1},
+        {"date": "2025-01-01", "power_consumption_watts": -5, "duration_hours": 1},
+        {"date": "2025-01-01", "power_consumption_watts": 5, "duration_hours": 1, "electricity_board": "nope"},
+        {"date": "2025-01-01", "power_consumption_watts": 500, "duration_hours": 1, "electricity_board": "kseb"},
+    ), BOARDS)
+    assert errors == [
+        {"row": 1, "error": "date is required"},
+        {"row": 2, "error": "date must be an ISO date (YYYY-MM-DD)"},
+        {"row": 3, "error": "power_consumption_watts must not be negative"},
+        {"row": 4, "error": "unknown electricity_board"},
+    ]
+    # Valid rows come back in date order for pricing
+    assert list(frame["row"]) == [5, 0]
+    assert list(frame["energy_kwh"]) == [0.5, 2.0]
+    assert list(frame["co2_emissions_kg"]) == [0.25, 1.6]
+    assert list(frame["consumer_id"]) == ["", "7"]
+    assert list(frame["electricity_board"]) == ["kseb", "mseb"]
+
+
+def test_commute_validation():
+    frame, errors = bulk_ingest.prepare_commute_logs(records(
+        {"date": "2025-01-01", "transport_mode": "Car", "distance_km": 10},
+        {"date": "2025-01-01", "distance_km": 10},
+        {"date": "2025-01-01", "transport_mode": "bus", "distance_km": -1},
+    ), {"car": 0.2})
+    assert [error["row"] for error in errors] == [1, 2]
+    assert list(frame["co2_emissions_kg"]) == [2.0]
+
+
+def test_pricing_bills_slabs_on_top_of_stored_consumption():
+    frame, _ = bulk_ingest.prepare_energy_logs(records(
+        {"date": "2025-01-01", "power_consumption_watts": 40000, "duration_hours": 1, "electricity_board": "kseb", "user_id": "u"},
+        {"date": "2025-01-02", "power_consumption_watts": 40000, "duration_hours": 1, "electricity_board": "kseb", "user_id": "u"},
+        {"date": "2025-01-02", "power_consumption_watts": 0, "duration_hours": 1, "electricity_board": "kseb", "user_id": "u"},
+    ), BOARDS)
+    priced = bulk_ingest.price_energy_logs(frame, BOARDS, TARIFFS, {("kseb", "u", "2025-01"): 30.0})
+    assert list(priced["month_to_date"]) == [30.0, 70.0, 110.0]
+    assert list(priced["cost_rupees"]) == [160.0, 320.0, 0.0]
+    # Zero-energy rows take the board's flat price
+    assert list(priced["price_per_kwh"]) == [4.0, 8.0, 7.0]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "bulk.db"))
+    ingest_schema.ensure_ingest_tables(conn.cursor())
+    consumption_counters.ensure_counter_table(conn.cursor())
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_failed_chunk_kwh_is_not_carried_forward(conn):
+    frame, _ = bulk_ingest.prepare_energy_logs(records(*[
+        {"date": f"2025-01-0{day}", "power_consumption_watts": 60000, "duration_hours": 1,
+         "electricity_board": "kseb", "user_id": "u"}
+        for day in (1, 2, 3)
+    ]), BOARDS)
+
+    def price_chunk(cursor, chunk):
+        keys = list(zip(chunk["electricity_board"], chunk["consumer_id"], chunk["month"]))
+        return bulk_ingest.price_energy_logs(chunk, BOARDS, TARIFFS, consumption_counters.read_many(cursor, keys))
+
+    def update_counters(cursor, chunk):
+        if chunk["row"].iloc[0] == 1:
+            raise sqlite3.IntegrityError("rejected")
+        consumption_counters.add_consumption_many(
+            cursor, [(board, consumer, month, kwh) for (board, consumer, month), kwh
+                     in chunk.groupby(["electricity_board", "consumer_id", "month"])["energy_kwh"].sum().items()])
+
+    committed = []
+    inserted, errors = bulk_ingest.insert_in_chunks(conn, ENERGY_SQL, frame, ENERGY_COLUMNS, chunk_size=1,
+                                                    before_chunk=price_chunk, after_chunk=update_counters,
+                                                    after_commit=lambda chunk: committed.extend(chunk["cost_rupees"]))
+    assert (inserted, [error["row"] for error in errors]) == (2, [1])
+    # Only committed chunks are published, with the prices they were stored at
+    assert committed == [240.0, 480.0]
+    # The third reading is billed on top of the first one only: 120 kWh crosses into the upper slab
+    assert conn.execute("SELECT date, cost_rupees FROM energy_consumption ORDER BY date").fetchall() == [
+        ("2025-01-01", 240.0), ("2025-01-03", 480.0)]
+    assert consumption_counters.read_month_to_date(conn.cursor(), "kseb", "u", "2025-01") == 120.0
+
+
+def test_chunks_read_counters_under_the_write_lock(conn, tmp_path):
+    frame, _ = bulk_ingest.prepare_energy_logs(records(
+        {"date": "2025-01-01", "power_consumption_watts": 1000, "duration_hours": 1}), BOARDS)
+    seen = []
+
+    def price_chunk(cursor, chunk):
+        # Another connection can't write while the chunk holds the lock
+        other = sqlite3.connect(str(tmp_path / "bulk.db"), timeout=0)
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            other.execute("INSERT INTO month_to_date_consumption VALUES ('mseb', '', '2025-01', 1)")
+        other.close()
+        seen.append(conn.in_transaction)
+        return bulk_ingest.price_energy_logs(chunk, BOARDS, TARIFFS, {})
+
+    inserted, errors = bulk_ingest.insert_in_chunks(conn, ENERGY_SQL, frame, ENERGY_COLUMNS, before_chunk=price_chunk)
+    assert (inserted, errors, seen) == (1, [], [True])
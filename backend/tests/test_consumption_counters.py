@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+import consumption_counters
+from conftest import insert_energy_logs
+
+
+@pytest.fixture
+def cursor(ingest_db):
+    conn = sqlite3.connect(ingest_db)
+    yield conn.cursor()
+    conn.close()
+
+
+def test_consumer_key_prefers_user_then_device():
+    assert consumption_counters.consumer_key("alice", "esp32_001") == "alice"
+    assert consumption_counters.consumer_key(None, "esp32_001") == "esp32_001"
+    assert consumption_counters.consumer_key() == ""
+
+
+def test_counter_table_is_backfilled_once(ingest_db, cursor):
+    insert_energy_logs(ingest_db, [
+        ("2025-01-01", 10.0, "esp32_001", None),
+        ("2025-01-20T08:00:00", 5.0, "esp32_001", None),
+        ("2025-02-01", 2.0, "esp32_001", "alice"),
+    ])
+    consumption_counters.ensure_counter_table(cursor)
+    assert consumption_counters.read_many(cursor, [("mseb", "esp32_001", "2025-01"), ("mseb", "alice", "2025-02")]) == {
+        ("mseb", "esp32_001", "2025-01"): 15.0,
+        ("mseb", "alice", "2025-02"): 2.0,
+    }
+    # A second call must not count the same rows again
+    consumption_counters.ensure_counter_table(cursor)
+    assert consumption_counters.read_month_to_date(cursor, "mseb", "esp32_001", "2025-01") == 15.0
+
+
+def test_backfill_keys_empty_ids_like_consumer_key(ingest_db, cursor):
+    insert_energy_logs(ingest_db, [
+        ("2025-01-01", 1.0, "esp32_001", ""),
+        ("2025-01-02", 2.0, "esp32_001", None),
+        ("2025-01-03", 4.0, "", ""),
+        ("2025-01-04", 8.0, None, None),
+    ])
+    consumption_counters.ensure_counter_table(cursor)
+    assert consumption_counters.consumer_key("", "esp32_001") == "esp32_001"
+    assert consumption_counters.consumer_key("", "") == ""
+    assert cursor.execute("SELECT consumer_id, energy_kwh FROM month_to_date_consumption ORDER BY 1").fetchall() == [
+        ("", 12.0), ("esp32_001", 3.0)]
+
+
+def test_add_consumption_accumulates_per_board_consumer_and_month(cursor):
+    consumption_counters.ensure_counter_table(cursor)
+    consumption_counters.add_consumption(cursor, "kseb", "alice", "2025-03", 1.5)
+    consumption_counters.add_consumption_many(cursor, [("kseb", "alice", "2025-03", 2.5), ("kseb", "bob", "2025-03", 1.0)])
+    assert consumption_counters.read_month_to_date(cursor, "kseb", "alice", "2025-03") == 4.0
+    assert consumption_counters.read_month_to_date(cursor, "kseb", "alice", "2025-04") == 0
@@ -0,0 +1,29 @@
+import numpy as np
+
+import tariff_engine
+
+SLABS = [
+    {"units_min": 0, "units_max": 100, "rate_per_kwh": 3.0, "slab_description": "0-100"},
+    {"units_min": 100, "units_max": 999999, "rate_per_kwh": 6.0, "slab_description": "above 100"},
+]
+BOARDS = {
+    "mseb": {"price_per_kwh": 6.5},
+    "kseb": {"price_per_kwh": 7.0},
+    "tneb": {"price_per_kwh": 5.8, "telescopic": True},
+}
+TARIFFS = tariff_engine.compile_tariffs(BOARDS, {"kseb": SLABS, "tneb": SLABS})
+
+
+def test_mixed_board_batch_matches_one_call_per_scenario():
+    rng = np.random.default_rng(3)
+    boards = rng.choice(["mseb", "kseb", "tneb", "not-a-board"], 1000)
+    energy = rng.uniform(0, 50, 1000)
+    monthly = rng.uniform(0, 200, 1000)
+    expected = [TARIFFS.get(board, TARIFFS["mseb"]).price(e, m) for board, e, m in zip(boards, energy, monthly)]
+    np.testing.assert_allclose(tariff_engine.price_by_board(TARIFFS, boards, energy, monthly), expected)
+
+
+def test_a_single_monthly_consumption_applies_to_every_scenario():
+    cost = tariff_engine.price_by_board(TARIFFS, ["kseb", "kseb", "tneb"], [10, 200, 20], 90)
+    # 90 + 10 kWh still falls in the first band (upper bounds are inclusive)
+    np.testing.assert_allclose(cost, [30.0, 1200.0, 10 * 3 + 10 * 6])
@@ -0,0 +1,104 @@
+import json
+
+import device_control
+from device_control import MAX_RETRIES, RESEND_SECONDS, DeviceController
+
+ADDR = ("10.0.0.9", 4210)
+NOW = 1_700_000_000.0
+
+
+def controller_with(devices: dict, ack: bool = True) -> DeviceController:
+    """A controller that has seen 25 energy readings from each device, power(i) for reading i"""
+    controller = DeviceController(min_interval_ms=1000, max_interval_ms=30000,
+                                  min_deadband_watts=0.5, max_deadband_watts=16)
+    for device_id, power in devices.items():
+        if ack:
+            controller.observe({"type": "config_ack", "device_id": device_id, "version": 0}, ADDR, "sock", NOW)
+        for i in range(25):
+            controller.observe({"type": "energy", "device_id": device_id, "power_watts": power(i)}, ADDR, "sock", NOW)
+    return controller
+
+
+def configs(downlinks: list) -> dict:
+    assert all((via, addr) == ("sock", ADDR) for via, addr, _ in downlinks)
+    return {message.pop("device_id"): message for message in (json.loads(payload) for _, _, payload in downlinks)}
+
+
+def steady(i):
+    return 100.0
+
+
+def noisy(i):
+    return 100.0 + (40 if i % 2 else -40)
+
+
+def test_devices_that_never_opted_in_are_left_alone():
+    controller = controller_with({"plug": steady}, ack=False)
+    assert controller.plan(1.0, now=NOW) == []
+    assert controller.stats()["controllable"] == 0
+
+
+def test_steady_devices_report_rarely_and_noisy_ones_often():
+    planned = configs(controller_with({"steady": steady, "noisy": noisy}).plan(1.0, now=NOW))
+    assert planned["steady"] == {"type": "config", "version": 1, "interval_ms": 30000, "deadband_watts": 0.5}
+    assert planned["noisy"] == {"type": "config", "version": 1, "interval_ms": 1000, "deadband_watts": 0.5}
+
+
+def test_ingest_pressure_widens_deadbands_and_intervals():
+    controller = controller_with({"steady": steady, "noisy": noisy})
+    controller.plan(1.0, now=NOW)
+    planned = configs(controller.plan(8.0, now=NOW + 1))
+    assert planned["steady"]["deadband_watts"] == 4.0
+    # Over capacity, a noisy device's dead-band also widens to its spread (capped)
+    assert (planned["noisy"]["interval_ms"], planned["noisy"]["deadband_watts"]) == (8000, 16.0)
+
+
+def test_unacked_configs_are_resent_a_few_times_then_stop_after_an_ack():
+    controller = controller_with({"steady": steady})
+    assert len(controller.plan(1.0, now=NOW)) == 1
+    assert controller.plan(1.0, now=NOW + 1) == []
+    resends = [len(controller.plan(1.0, now=NOW + RESEND_SECONDS * n)) for n in range(1, MAX_RETRIES + 2)]
+    assert resends == [1] * MAX_RETRIES + [0]
+    assert controller.stats()["resent"] == MAX_RETRIES
+
+    controller.observe({"type": "config_ack", "device_id": "steady", "version": 1}, ADDR, "sock", NOW)
+    assert controller.device("steady")["acked"]
+    assert controller.stats()["pending"] == 0
+
+
+def test_a_device_acking_its_defaults_again_is_resent_its_config():
+    controller = controller_with({"steady": steady})
+    controller.plan(1.0, now=NOW)
+    controller.observe({"type": "config_ack", "device_id": "steady", "version": 1}, ADDR, "sock", NOW)
+    assert controller.plan(1.0, now=NOW + 1) == []
+    # Rebooted onto its built-in defaults
+    controller.observe({"type": "config_ack", "device_id": "steady", "version": 0}, ADDR, "sock", NOW + 2)
+    assert configs(controller.plan(1.0, now=NOW + 3))["steady"]["version"] == 1
+
+
+def test_levels_only_move_past_the_hysteresis_band():
+    assert device_control._settle(None, 2.4, 5) == 2
+    assert device_control._settle(2, 2.7, 5) == 2
+    assert device_control._settle(2, 2.8, 5) == 3
+    assert device_control._settle(2, 9.0, 5) == 5
+
+
+class FakeMetrics:
+    def __init__(self, rate):
+        self.rate = rate
+
+    def packets_per_second(self):
+        return self.rate
+
+
+class FakeWriter:
+    def __init__(self, queued, capacity):
+        self.queued, self.capacity = queued, capacity
+
+    def stats(self):
+        return {"queued": self.queued, "queue_capacity": self.capacity}
+
+
+def test_pressure_is_the_worse_of_rate_and_queue_fill():
+    assert device_control.ingest_pressure(FakeMetrics(1000), FakeWriter(0, 100), target_pps=2000) == 0.5
+    assert device_control.ingest_pressure(FakeMetrics(1000), FakeWriter(50, 100), target_pps=2000) == 1.0
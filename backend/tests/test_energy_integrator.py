@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import energy_integrator
+from energy_integrator import EnergyIntegrator
+
+T0 = 1_700_000_000_000
+
+
+def test_trapezoid_between_close_readings():
+    integrator = EnergyIntegrator(max_gap_ms=60_000)
+    assert integrator.add("a", T0, 100.0) == (0.0, 0, True)
+    energy_wh, duration_ms, started = integrator.add("a", T0 + 36_000, 300.0)
+    # (100 + 300) / 2 W for 36 s
+    assert (energy_wh, duration_ms, started) == (pytest.approx(2.0), 36_000, False)
+
+
+def test_gap_holds_the_previous_power_for_the_cap_only():
+    integrator = EnergyIntegrator(max_gap_ms=60_000)
+    integrator.add("a", T0, 3600.0)
+    energy_wh, duration_ms, _ = integrator.add("a", T0 + 10 * 60_000, 0.0)
+    assert (energy_wh, duration_ms) == (pytest.approx(60.0), 60_000)
+    assert integrator.device("a")["gaps"] == 1
+
+
+def test_duplicate_and_late_readings_add_nothing():
+    integrator = EnergyIntegrator(drift_tolerance_ms=5000)
+    integrator.add("a", T0, 100.0)
+    integrator.add("a", T0 + 2000, 100.0)
+    assert integrator.add("a", T0 + 2000, 100.0) == (0.0, 0, False)
+    assert integrator.add("a", T0 + 1000, 100.0) == (0.0, 0, False)
+    device = integrator.device("a")
+    assert (device["duplicates"], device["late"], device["clock_resets"]) == (1, 1, 0)
+
+
+def test_clock_steps_reanchor_instead_of_integrating():
+    integrator = EnergyIntegrator(drift_tolerance_ms=5000)
+    integrator.add("a", T0, 100.0, received_ms=T0)
+    # Stepped back an hour
+    assert integrator.add("a", T0 - 3_600_000, 100.0, received_ms=T0 + 1000) == (0.0, 0, True)
+    # Now jumps a day ahead of our receive clock
+    assert integrator.add("a", T0 + 86_400_000, 100.0, received_ms=T0 + 2000) == (0.0, 0, True)
+    assert integrator.device("a")["clock_resets"] == 2
+    assert integrator.device("a")["energy_wh"] == 0.0
+
+
+def test_add_many_totals_a_packet():
+    integrator = EnergyIntegrator(max_gap_ms=60_000)
+    samples = [(T0 + i * 1000, 3600.0, 15.0) for i in range(4)]
+    assert integrator.add_many("a", samples) == (pytest.approx(3.0), 3000)
+    assert integrator.stats()["readings"] == 4
+
+
+def test_vectorized_series_matches_the_streaming_integrator():
+    rng = np.random.default_rng(7)
+    timestamps = T0 + np.cumsum(rng.choice([0, 500, 1000, 90_000], size=200))
+    power = rng.uniform(0, 2000, size=200)
+    devices = rng.choice(["a", "b"], size=200)
+
+    result = energy_integrator.integrate_series(timestamps, power, devices, max_gap_ms=60_000)
+    streaming = EnergyIntegrator(max_gap_ms=60_000)
+    for ts, watts, device in zip(timestamps, power, devices):
+        streaming.add(device, int(ts), float(watts))
+    for index, device in enumerate(result["devices"]):
+        state = streaming.device(device)
+        assert result["device_energy_wh"][index] == pytest.approx(state["energy_wh"])
+        assert result["gaps"][index] == state["gaps"]
+        assert result["duplicates"][index] == state["duplicates"]
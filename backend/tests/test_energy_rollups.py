@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+import energy_rollups
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "rollups.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE energy_consumption (
+            date TEXT, power_consumption_watts REAL, energy_kwh REAL, co2_emissions_kg REAL,
+            cost_rupees REAL, device_id TEXT, user_id TEXT
+        )
+    """)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def insert(db_path, *rows):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO energy_consumption VALUES (?, ?, ?, ?, ?, 'esp32_001', NULL)",
+        [(date, power, energy_kwh, energy_kwh * 0.5, energy_kwh * 5) for date, power, energy_kwh in rows],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_date_only_rows_stay_on_their_calendar_day_behind_utc(db_path):
+    insert(db_path, ("2025-01-01", 100, 1.0), ("2025-01-31", 100, 2.0), ("2025-02-01", 100, 4.0))
+    buckets = energy_rollups.rollup_energy(db_path, "day", "America/New_York", "2025-01-01", "2025-01-31")
+    assert [(b["bucket_start"][:10], b["energy_kwh"]) for b in buckets] == [("2025-01-01", 1.0), ("2025-01-31", 2.0)]
+
+
+def test_date_only_rows_ahead_of_utc_and_monthly(db_path):
+    insert(db_path, ("2025-01-01", 100, 1.0), ("2025-01-31", 100, 2.0), ("2025-02-01", 100, 4.0))
+    buckets = energy_rollups.rollup_energy(db_path, "month", "Asia/Kolkata")
+    assert [(b["bucket_start"], b["energy_kwh"], b["readings"]) for b in buckets] == [
+        ("2025-01-01T00:00:00+05:30", 3.0, 2),
+        ("2025-02-01T00:00:00+05:30", 4.0, 1),
+    ]
+
+
+def test_timestamps_are_utc_and_shifted_into_the_zone(db_path):
+    # 02:00 UTC is still the previous evening in New York, and 07:30 in Kolkata
+    insert(db_path, ("2025-01-02T02:00:00", 50, 1.0), ("2025-01-02T12:00:00", 150, 3.0))
+    new_york = energy_rollups.rollup_energy(db_path, "day", "America/New_York")
+    assert [(b["bucket_start"][:10], b["energy_kwh"]) for b in new_york] == [("2025-01-01", 1.0), ("2025-01-02", 3.0)]
+    kolkata = energy_rollups.rollup_energy(db_path, "hour", "Asia/Kolkata")
+    assert [b["bucket_start"] for b in kolkata] == ["2025-01-02T07:00:00+05:30", "2025-01-02T17:00:00+05:30"]
+    assert kolkata[0]["min_power_watts"] == 50
+
+
+def test_mixed_rows_share_a_bucket_with_power_stats(db_path):
+    insert(db_path, ("2025-03-10", 20, 1.0), ("2025-03-10T06:00:00", 80, 1.0))
+    [bucket] = energy_rollups.rollup_energy(db_path, "week", "UTC")
+    assert bucket["bucket_start"] == "2025-03-10T00:00:00+00:00"
+    assert (bucket["readings"], bucket["min_power_watts"], bucket["max_power_watts"], bucket["avg_power_watts"]) == (2, 20, 80, 50)
@@ -0,0 +1,57 @@
+from ingest_metrics import SEQUENCE_WINDOW, IngestMetrics
+
+NOW = 1_700_000_000.0
+
+
+def sequence(seqs: list) -> dict:
+    metrics = IngestMetrics()
+    for seq in seqs:
+        metrics.record_sequence("dev", seq, NOW)
+    return metrics.devices["dev"].to_dict()
+
+
+def test_gaps_count_as_missing_until_the_packet_arrives():
+    device = sequence([1, 2, 5])
+    assert (device["missing"], device["last_seq"]) == (2, 5)
+    device = sequence([1, 2, 5, 3])
+    assert (device["missing"], device["out_of_order"]) == (1, 1)
+    assert device["loss_ratio"] == 1 / 5
+
+
+def test_repeated_sequence_numbers_are_duplicates():
+    device = sequence([1, 2, 2, 1])
+    assert (device["duplicates"], device["missing"], device["packets"]) == (2, 0, 4)
+
+
+def test_sequence_wraps_at_32_bits():
+    device = sequence([2 ** 32 - 2, 2 ** 32 - 1, 0, 1])
+    assert (device["missing"], device["resets"], device["last_seq"]) == (0, 0, 1)
+
+
+def test_far_jump_backwards_is_a_counter_reset():
+    device = sequence([5000, 5001, 3])
+    assert (device["resets"], device["last_seq"], device["out_of_order"]) == (1, 3, 0)
+    # Up to SEQUENCE_WINDOW behind is still a late packet
+    assert sequence([SEQUENCE_WINDOW + 10, 10])["out_of_order"] == 1
+    assert sequence([SEQUENCE_WINDOW + 10, 9])["resets"] == 1
+
+
+def test_rate_averages_over_elapsed_time_and_forgets_old_seconds():
+    metrics = IngestMetrics()
+    metrics.started = NOW - 100
+    metrics.record_datagram(30, now=NOW - 90)
+    metrics.record_datagram(60, now=NOW - 1)
+    assert metrics.datagrams == 90
+    assert metrics.packets_per_second(now=NOW) == 1.0
+
+
+def test_snapshot_totals_every_device():
+    metrics = IngestMetrics()
+    for device_id, seqs in {"a": [1, 3], "b": [7, 7]}.items():
+        for seq in seqs:
+            metrics.record_sequence(device_id, seq, NOW)
+    metrics.observe_message({"device_id": "c", "seq": None})
+    metrics.record_decode_error(2)
+    snapshot = metrics.snapshot()
+    assert (snapshot["sequenced_devices"], snapshot["missing"], snapshot["duplicates"]) == (2, 1, 1)
+    assert snapshot["decode_errors"] == 2
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+import live_hub
+from live_hub import LiveHub
+
+
+def test_parse_devices_splits_and_trims():
+    assert live_hub.parse_devices(None) is None
+    assert live_hub.parse_devices(" a, b ,,a") == {"a", "b"}
+
+
+def test_subscribers_only_get_their_devices_and_lose_the_oldest_when_full():
+    hub = LiveHub(buffer_size=2)
+    follower = hub.subscribe({"a"})
+    everything = hub.subscribe()
+    for power in (1, 2, 3):
+        hub.publish_reading("a", power, 0.001, "udp")
+    hub.publish_event({"type": "anomaly", "device_id": "b"})
+    assert [event["power_watts"] for event in follower.buffer] == [2, 3]
+    assert follower.take_dropped() == 1
+    assert follower.take_dropped() == 0
+    assert [event["type"] for event in everything.buffer] == ["reading", "anomaly"]
+    assert hub.published == 4
+
+
+def test_aggregates_cover_the_window_and_quiet_devices_are_forgotten():
+    hub = LiveHub(window_seconds=60)
+    hub.publish_reading("a", 100.0, 0.5, "api")
+    hub.publish_reading("a", 300.0, 0.25, "api")
+    subscription = hub.subscribe({"a"})
+    [initial] = subscription.buffer
+    assert (initial["readings"], initial["avg_power_watts"], initial["energy_kwh"]) == (2, 200.0, 0.75)
+
+    subscription.buffer.clear()
+    hub.push_aggregates(now=time.time() + 61)
+    [expired] = subscription.buffer
+    assert (expired["readings"], expired["energy_kwh"], expired["last_power_watts"]) == (0, 0.0, 300.0)
+
+    hub.push_aggregates(now=time.time() + 200)
+    assert hub.stats()["devices"] == 0
+
+
+def test_reading_from_another_thread_wakes_the_subscriber():
+    async def scenario():
+        hub = LiveHub(aggregate_interval=3600)
+        await hub.start()
+        subscription = hub.subscribe()
+        publisher = threading.Thread(target=hub.publish_reading, args=("a", 42.0, 0.01, "udp"))
+        publisher.start()
+        events = await subscription.next_events(timeout=5)
+        publisher.join()
+        await hub.stop()
+        return events
+
+    [event] = asyncio.run(scenario())
+    assert (event["device_id"], event["power_watts"]) == ("a", 42.0)
+
+
+def test_stop_releases_waiting_subscribers():
+    async def scenario():
+        hub = LiveHub(aggregate_interval=3600)
+        await hub.start()
+        subscription = hub.subscribe()
+        waiter = asyncio.create_task(subscription.next_events(timeout=5))
+        await asyncio.sleep(0)
+        await hub.stop()
+        return await waiter, subscription.closed
+
+    assert asyncio.run(scenario()) == ([], True)
@@ -0,0 +1,73 @@
+import base64
+import json
+import random
+import struct
+from collections import deque
+
+import pytest
+
+import load_generator
+from load_generator import LatencyTracker, SimulatedDevice
+
+
+@pytest.mark.parametrize("fmt, key", [("json", "sim_00003"), ("csv", "127.0.0.1"), ("binary", "sim_00003")])
+def test_every_simulated_format_maps_to_one_energy_row(fmt, key):
+    device = SimulatedDevice(3, fmt, 1.0, 5, random.Random(1))
+    payloads = device.payloads(1_700_000_000.0)
+    assert [load_generator.expected_key(payload) for payload in payloads] == [key]
+
+
+def test_undecodable_payload_expects_no_row():
+    assert load_generator.expected_key(b"{bad") is None
+
+
+def test_binary_sequence_numbers_advance_and_wrap():
+    device = SimulatedDevice(0, "binary", 1.0, 4, random.Random(2))
+    device.seq = 2 ** 32 - 1
+    device.payloads(1_700_000_000.0)
+    assert device.seq == 0
+
+
+def test_spikes_are_injected_at_the_configured_rate():
+    device = SimulatedDevice(0, "json", 1.0, 1, random.Random(3), spike_rate=1.0)
+    message = json.loads(device.payloads(1_700_000_000.0)[0])
+    assert device.spikes == 1
+    assert message["power_watts"] == pytest.approx(device.power * 3 + 50, abs=0.001)
+
+
+def test_latency_tracker_matches_each_device_in_send_order():
+    tracker = LatencyTracker()
+    tracker.sent("a", 10.0)
+    tracker.sent("a", 11.0)
+    tracker.sent("b", 10.5)
+    tracker.sent(None, 12.0)
+    tracker.commit(12.0, ["a", "b", "c"])
+    assert tracker.latencies == [2.0, 1.5]
+    assert (tracker.committed, tracker.unmatched) == (3, 1)
+    assert tracker.pending == {"a": deque([11.0])}
+
+
+def test_ndjson_capture_is_read_back(tmp_path):
+    path = tmp_path / "capture.ndjson"
+    path.write_text("\n".join(json.dumps({"t": t, "data": base64.b64encode(data).decode("ascii")})
+                              for t, data in [(0.0, b"hello"), (0.25, b"world")]) + "\n", encoding="utf-8")
+    assert load_generator.read_capture(str(path)) == [(0.0, b"hello"), (0.25, b"world")]
+
+
+def ethernet_udp_frame(port: int, payload: bytes) -> bytes:
+    udp = struct.pack("!HHHH", 50000, port, 8 + len(payload), 0) + payload
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0, b"\x7f\x00\x00\x01", b"\x7f\x00\x00\x01")
+    return b"\x00" * 12 + b"\x08\x00" + ip + udp
+
+
+def test_pcap_capture_keeps_udp_payloads_for_the_chosen_port(tmp_path):
+    frames = [(100.0, ethernet_udp_frame(8888, b"one")), (100.5, ethernet_udp_frame(9999, b"other")),
+              (101.0, ethernet_udp_frame(8888, b"two"))]
+    data = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+    for timestamp, frame in frames:
+        seconds = int(timestamp)
+        data += struct.pack("<IIII", seconds, int((timestamp - seconds) * 1e6), len(frame), len(frame)) + frame
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(data)
+    assert load_generator.read_capture(str(path), port=8888) == [(0.0, b"one"), (1.0, b"two")]
+    assert len(load_generator.read_capture(str(path))) == 3
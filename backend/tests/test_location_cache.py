@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+
+import location_cache
+from location_cache import LocationCache, geohash
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    location_cache.ensure_cache_table(conn.cursor())
+    conn.close()
+    return path
+
+
+def test_geohash_matches_reference_values():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash(-90, -180, 3) == "000"
+
+
+def test_nearby_coordinates_share_a_cell_and_resolve_once(db_path):
+    calls = []
+
+    def resolve(latitude, longitude):
+        calls.append((latitude, longitude))
+        return "Maharashtra"
+
+    cache = LocationCache(db_path)
+    assert cache.lookup(19.0760, 72.8777, resolve) == "Maharashtra"
+    assert cache.lookup(19.0761, 72.8779, resolve) == "Maharashtra"
+    assert len(calls) == 1
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+    # A fresh process reads the persisted entry instead of calling the geocoder
+    restarted = LocationCache(db_path)
+    assert restarted.lookup(19.0760, 72.8777, resolve) == "Maharashtra"
+    assert len(calls) == 1
+
+
+def test_failed_lookups_expire_sooner(db_path):
+    cache = LocationCache(db_path, negative_ttl_seconds=-1)
+    assert cache.lookup(10.0, 76.0, lambda lat, lon: location_cache.UNKNOWN_STATE) == "Unknown"
+    assert cache.cached_state(10.0, 76.0) is None
+    assert cache.lookup(10.0, 76.0, lambda lat, lon: "Kerala") == "Kerala"
+    assert cache.cached_state(10.0, 76.0) == "Kerala"
+
+
+def test_memory_entries_are_bounded(db_path):
+    cache = LocationCache(db_path, max_size=2)
+    for longitude in (70.0, 72.0, 74.0):
+        cache.lookup(20.0, longitude, lambda lat, lon: "Somewhere")
+    assert cache.stats()["entries"] == 2
+
+
+def test_missing_table_is_a_miss_not_an_error(tmp_path):
+    cache = LocationCache(str(tmp_path / "empty.db"))
+    assert cache.cached_state(19.0, 72.0) is None
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import pytest
+
+import log_export
+from conftest import insert_energy_logs
+
+COLUMNS = log_export.EXPORT_TABLES["energy-logs"]["columns"]
+
+
+@pytest.fixture
+def db_path(ingest_db):
+    insert_energy_logs(ingest_db, [
+        ("2025-01-01", 1.5, "esp32_001", "alice"),
+        ("2025-01-02", 2.0, "esp32_002", "bob"),
+        ("2025-01-03", 0.5, "esp32_001", "alice"),
+    ])
+    return ingest_db
+
+
+def export(db_path, fmt, **filters) -> bytes:
+    parts = log_export.stream_export(db_path, "energy-logs", fmt, **filters)
+    return b"".join(part.encode("utf-8") if isinstance(part, str) else part for part in parts)
+
+
+def test_csv_export_streams_header_and_rows_in_chunks(db_path):
+    chunks = list(log_export.iter_row_chunks(db_path, "energy-logs", chunk_size=2))
+    assert [len(rows) for rows in chunks] == [2, 1]
+    rows = list(csv.reader(io.StringIO(export(db_path, "csv").decode("utf-8"))))
+    assert rows[0] == COLUMNS
+    assert [row[1] for row in rows[1:]] == ["2025-01-01", "2025-01-02", "2025-01-03"]
+
+
+def test_ndjson_export_applies_owner_and_date_filters(db_path):
+    lines = export(db_path, "ndjson", device_id="esp32_001", start_date="2025-01-02").decode("utf-8").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [(record["date"], record["energy_kwh"], record["user_id"]) for record in records] == [
+        ("2025-01-03", 0.5, "alice")]
+
+
+def test_parquet_export_round_trips_types(db_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(export(db_path, "parquet", end_date="2025-01-02")))
+    assert table.column_names == COLUMNS
+    assert table.column("energy_kwh").to_pylist() == [1.5, 2.0]
+    assert str(table.schema.field("id").type) == "int64"
+
+
+def test_empty_export_still_has_a_header(ingest_db):
+    assert export(ingest_db, "csv").decode("utf-8").strip() == ",".join(COLUMNS)
+    pq = pytest.importorskip("pyarrow.parquet")
+    assert pq.read_table(io.BytesIO(export(ingest_db, "parquet"))).num_rows == 0
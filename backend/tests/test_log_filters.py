@@ -0,0 +1,31 @@
+import sqlite3
+
+import log_filters
+from conftest import insert_energy_logs
+
+
+def test_owner_and_date_conditions():
+    assert log_filters.log_filters() == ([], [])
+    assert log_filters.where_clause([]) == ""
+    conditions, params = log_filters.log_filters("esp32_001", "alice", "2025-01-01", "2025-01-31")
+    assert conditions == ["device_id = ?", "user_id = ?", "date >= ?", "date < date(?, '+1 day')"]
+    assert params == ["esp32_001", "alice", "2025-01-01", "2025-01-31"]
+    assert log_filters.where_clause(conditions[:2]) == "WHERE device_id = ? AND user_id = ?"
+    # 0 is a valid epoch start, so time bounds are checked against None
+    assert log_filters.time_range_filters(0, 2000) == (["ts_ms >= ?", "ts_ms < ?"], [0, 2000])
+
+
+def test_filters_select_one_household_and_an_inclusive_range(ingest_db):
+    insert_energy_logs(ingest_db, [
+        ("2025-01-01", 1.0, "esp32_001", "alice"),
+        ("2025-01-31T23:30:00", 2.0, "esp32_001", "alice"),
+        ("2025-02-01", 4.0, "esp32_001", "alice"),
+        ("2025-01-15", 8.0, "esp32_002", "bob"),
+    ])
+    conditions, params = log_filters.log_filters(user_id="alice", start_date="2025-01-01", end_date="2025-01-31")
+    conn = sqlite3.connect(ingest_db)
+    query = f"SELECT energy_kwh FROM energy_consumption {log_filters.where_clause(conditions)} ORDER BY date"
+    assert [row[0] for row in conn.execute(query, params)] == [1.0, 2.0]
+    plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+    conn.close()
+    assert "idx_energy_consumption_user_date" in plan
@@ -0,0 +1,50 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from udp_server import MultiProcessUDPServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="needs SO_REUSEPORT")
+
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_workers_share_the_port_and_the_parent_writes_every_row(ingest_db):
+    port = free_udp_port()
+    server = MultiProcessUDPServer("127.0.0.1", port, ingest_db, workers=2)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while len(server.processes) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Give the workers time to bind before sending
+    time.sleep(0.5)
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for device in range(20):
+        message = {"type": "energy", "device_id": f"esp32_{device:03d}", "power_watts": 50, "duration_hours": 1}
+        # Different source ports let the kernel spread datagrams over both workers
+        sender.sendto(json.dumps(message).encode("utf-8"), ("127.0.0.1", port))
+    sender.close()
+
+    conn = sqlite3.connect(ingest_db)
+    count = 0
+    while count < 20 and time.monotonic() < deadline:
+        time.sleep(0.05)
+        count = conn.execute("SELECT COUNT(*) FROM energy_consumption").fetchone()[0]
+    server.stop()
+    thread.join(timeout=10)
+    devices = conn.execute("SELECT COUNT(DISTINCT device_id) FROM energy_consumption").fetchone()[0]
+    conn.close()
+
+    assert not thread.is_alive()
+    assert (count, devices) == (20, 20)
+    assert server.metrics.datagrams == 20
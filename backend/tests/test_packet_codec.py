@@ -0,0 +1,136 @@
+import json
+import sqlite3
+
+import pytest
+
+import packet_codec
+from energy_integrator import EnergyIntegrator
+from packet_codec import PacketError
+from udp_server import UDPServer
+
+ADDR = ("10.0.0.7", 4210)
+
+
+@pytest.mark.parametrize("data", [
+    b"0.5,abc,1,2",
+    b"0.5,100\xff,1,2",
+    b"1,2,3",
+    b"{not json",
+    b'{"type": "energy"\xff}',
+])
+def test_malformed_datagrams_raise_packet_error(data):
+    with pytest.raises(PacketError):
+        packet_codec.decode_datagram(data, ADDR)
+
+
+def test_json_must_be_an_object():
+    with pytest.raises(PacketError):
+        packet_codec.parse_json(b"[1, 2]")
+
+
+def test_binary_device_id_must_be_utf8():
+    packet = bytearray(packet_codec.encode_samples("dev", [(1000, 1.0, 0.1)])[0])
+    packet[packet_codec.HEADER.size] = 0xFF
+    with pytest.raises(PacketError):
+        packet_codec.decode_datagram(bytes(packet))
+
+
+@pytest.mark.parametrize("data", [b"0.5,abc,1,2", b"\xff\xfe,1,2,3", b"{oops", b"\xcf\xb1\x01"])
+def test_udp_server_counts_every_malformed_datagram(tmp_path, data):
+    server = UDPServer(db_path=str(tmp_path / "udp.db"))
+    server.handle_data(data, ADDR)
+    assert server.metrics.decode_errors == 1
+    assert server.writer.queue.qsize() == 0
+
+
+def test_udp_server_queues_a_good_csv_line(tmp_path):
+    server = UDPServer(db_path=str(tmp_path / "udp.db"))
+    server.handle_data(b"0.5,120.0,3.2,0.02", ADDR)
+    assert server.metrics.decode_errors == 0
+    assert server.writer.queue.qsize() > 0
+
+
+def test_udp_server_is_quiet_per_message_unless_verbose(tmp_path, capsys):
+    quiet = UDPServer(db_path=str(tmp_path / "quiet.db"))
+    quiet.handle_data(b"0.5,120.0,3.2,0.02", ADDR)
+    assert capsys.readouterr().out == ""
+    verbose = UDPServer(db_path=str(tmp_path / "verbose.db"), verbose=True)
+    verbose.handle_data(b"0.5,120.0,3.2,0.02", ADDR)
+    assert "Received samples message" in capsys.readouterr().out
+
+
+def decode_all(packets):
+    return [packet_codec.decode_binary(packet) for packet in packets]
+
+
+def test_binary_round_trip_restores_samples_from_deltas():
+    samples = [(1_700_000_000_000 + i * 1000, 100.0 + i * 2.5, 0.45 + i * 0.01) for i in range(10)]
+    packets = packet_codec.encode_samples("esp32_001", samples, seq=41, period_ms=1000)
+    assert len(packets) == 1
+    [message] = decode_all(packets)
+    assert (message["device_id"], message["seq"], message["period_ms"]) == ("esp32_001", 41, 1000)
+    assert [ts for ts, _, _ in message["samples"]] == [ts for ts, _, _ in samples]
+    for (_, power, current), (_, expected_power, expected_current) in zip(message["samples"], samples):
+        assert power == pytest.approx(expected_power, abs=0.05)
+        assert current == pytest.approx(expected_current, abs=0.0005)
+
+
+def test_full_packets_split_with_consecutive_sequence_numbers():
+    samples = [(i * 1000, 50.0, 0.2) for i in range(100)]
+    max_size = 128
+    packets = packet_codec.encode_samples("dev", samples, seq=7, max_packet_size=max_size)
+    assert len(packets) > 1
+    assert all(len(packet) <= max_size for packet in packets)
+    messages = decode_all(packets)
+    assert [message["seq"] for message in messages] == list(range(7, 7 + len(packets)))
+    assert [sample[0] for message in messages for sample in message["samples"]] == [ts for ts, _, _ in samples]
+
+
+def test_delta_too_large_for_16_bits_starts_a_new_packet():
+    samples = [(0, 10.0, 0.1), (1000, 10.0, 0.1), (1000 + 0x10000, 10.0, 0.1), (2000 + 0x10000, 5000.0, 0.1)]
+    packets = packet_codec.encode_samples("dev", samples)
+    # The 65.5 s gap and the 4990 W jump (49900 tenths > int16) each force a split
+    assert [len(message["samples"]) for message in decode_all(packets)] == [2, 1, 1]
+    assert [message["samples"][0][0] for message in decode_all(packets)] == [0, 1000 + 0x10000, 2000 + 0x10000]
+
+
+def test_truncated_binary_packet_is_rejected():
+    packet = packet_codec.encode_samples("dev", [(0, 1.0, 0.1), (1000, 2.0, 0.2)])[0]
+    with pytest.raises(PacketError):
+        packet_codec.decode_binary(packet[:-1])
+
+
+def test_encode_rejects_an_overlong_device_id():
+    with pytest.raises(ValueError):
+        packet_codec.encode_samples("x" * (packet_codec.MAX_DEVICE_ID_BYTES + 1), [(0, 1.0, 0.1)])
+
+
+def test_udp_server_queues_what_decode_rows_builds(tmp_path):
+    server = UDPServer(db_path=str(tmp_path / "udp.db"))
+    packet = packet_codec.encode_samples("dev", [(1000, 10.0, 0.1), (2000, 12.0, 0.1), (3000, 11.0, 0.1)])[0]
+    server.handle_data(packet, ADDR)
+    assert server.writer.queue.qsize() == 1 + 3
+    server.handle_data(b'{"type": "config_ack", "device_id": "dev", "version": 0}', ADDR)
+    assert server.writer.queue.qsize() == 4
+    if server.controller is not None:
+        assert server.controller.device("dev")["controllable"]
+    assert server.metrics.devices["dev"].packets == 1
+
+
+def test_queued_datagrams_integrate_at_their_receive_time(ingest_db):
+    server = UDPServer(db_path=ingest_db)
+    server.integrator = EnergyIntegrator(max_gap_ms=60_000)
+    received_ms = 1_700_000_000_000
+    # A backlog decoded long after both datagrams arrived, 36 s apart
+    for offset_ms, power in ((0, 100), (36_000, 300)):
+        message = {"type": "energy", "device_id": "esp32_001", "power_watts": power, "duration_hours": 0.01}
+        server.datagrams.put((json.dumps(message).encode("utf-8"), ADDR, received_ms + offset_ms))
+    server.writer.start()
+    server._decode_loop()
+    server.writer.stop()
+
+    conn = sqlite3.connect(ingest_db)
+    rows = conn.execute("SELECT duration_hours, energy_kwh FROM energy_consumption ORDER BY id").fetchall()
+    conn.close()
+    assert rows[1] == (pytest.approx(0.01), pytest.approx(0.002))
+    assert server.integrator.device("esp32_001")["last_ts_ms"] == received_ms + 36_000
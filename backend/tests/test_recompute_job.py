@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+import ingest_schema
+import recompute_job
+from recompute_job import RecomputeJobRunner
+from tariff_registry import TariffRegistry
+
+GRID_MIX = {"coal": 1.0}
+BOARDS = {
+    "mseb": {"name": "MSEB", "state": "Maharashtra", "price_per_kwh": 6.5, "emission_factor": 0.8, "grid_mix": GRID_MIX},
+    "kseb": {"name": "KSEB", "state": "Kerala", "price_per_kwh": 7.0, "emission_factor": 0.5, "grid_mix": GRID_MIX},
+}
+KSEB_SLABS = [
+    {"units_min": 0, "units_max": 100, "rate_per_kwh": 4.0, "slab_description": "0-100 units"},
+    {"units_min": 100, "units_max": 999999, "rate_per_kwh": 8.0, "slab_description": "above 100 units"},
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "recompute.db")
+    conn = sqlite3.connect(path)
+    ingest_schema.ensure_ingest_tables(conn.cursor())
+    recompute_job.ensure_job_table(conn.cursor())
+    conn.executemany("""
+        INSERT INTO energy_consumption (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg,
+                                        electricity_board, device_id)
+        VALUES (?, 0, 1, ?, 0, 'kseb', 'esp32_001')
+    """, [("2025-01-01", 60.0), ("2025-01-02", 0.0), ("2025-01-03", 60.0)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TariffRegistry(BOARDS, {"kseb": KSEB_SLABS}, directory=str(tmp_path))
+
+
+def run_job(runner: RecomputeJobRunner) -> dict:
+    job_id = runner.create_job("kseb", "2025-01-01", "2025-01-31")
+    runner._threads[job_id].join(timeout=10)
+    return runner.get_job(job_id)
+
+
+def stored_prices(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT energy_kwh, cost_rupees, price_per_kwh, co2_emissions_kg FROM energy_consumption ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_recompute_prices_slabs_across_chunks(db_path, registry):
+    job = run_job(RecomputeJobRunner(db_path, registry.current, chunk_size=1))
+    assert (job["status"], job["processed_rows"], job["progress"]) == ("completed", 3, 1.0)
+    # The third row takes the month past 100 kWh, so all of it is billed at the upper rate
+    assert stored_prices(db_path) == [(60.0, 240.0, 4.0, 30.0), (0.0, 0.0, 7.0, 0.0), (60.0, 480.0, 8.0, 30.0)]
+
+
+def test_zero_energy_rows_use_the_board_price_like_create_energy_log(db_path, registry):
+    run_job(RecomputeJobRunner(db_path, registry.current))
+    assert stored_prices(db_path)[1][2] == registry.current().board("kseb")["price_per_kwh"]
+
+
+def test_locked_steps_are_retried_not_failed(db_path, registry, monkeypatch):
+    runner = RecomputeJobRunner(db_path, registry.current, retry_seconds=0.001)
+    process_chunk = runner._process_chunk
+    attempts = []
+
+    def flaky(conn, job_id):
+        attempts.append(job_id)
+        if len(attempts) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        return process_chunk(conn, job_id)
+
+    monkeypatch.setattr(runner, "_process_chunk", flaky)
+    job = run_job(runner)
+    assert job["status"] == "completed"
+    assert job["processed_rows"] == 3
+    assert len(attempts) == 4
+
+
+def test_other_database_errors_still_fail_the_job(db_path, registry, monkeypatch):
+    runner = RecomputeJobRunner(db_path, registry.current)
+
+    def broken(conn, job_id):
+        raise sqlite3.OperationalError("no such column: cost_rupees")
+
+    monkeypatch.setattr(runner, "_process_chunk", broken)
+    job = run_job(runner)
+    assert job["status"] == "failed"
+    assert "no such column" in job["error"]
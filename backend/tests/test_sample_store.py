@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+import sample_store
+from sample_store import DAY_MS, HOUR_MS, LOCAL_OFFSET_MS, MINUTE_MS, SampleRollupJob
+
+# Midnight IST, so minute, hour and day buckets all start here
+T0 = sample_store.floor_bucket(1_700_000_000_000, DAY_MS, LOCAL_OFFSET_MS) + DAY_MS
+
+
+def insert_samples(db_path: str, rows: list):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(sample_store.SAMPLE_INSERT_SQL, rows)
+    conn.close()
+
+
+def count(db_path: str, table: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_sample_rows_follow_the_insert_column_order():
+    message = {"device_id": "esp32_001", "samples": [(1000.0, 120.5, 0.52), (2000, 121.0, None)]}
+    assert sample_store.sample_rows(message) == [("esp32_001", 1000, 120.5, 0.52), ("esp32_001", 2000, 121.0, None)]
+
+
+def test_floor_bucket_respects_the_local_offset():
+    assert sample_store.floor_bucket(T0 + DAY_MS - 1, DAY_MS, LOCAL_OFFSET_MS) == T0
+    assert sample_store.floor_bucket(T0 + 90_500, MINUTE_MS) == T0 + MINUTE_MS
+
+
+def test_rollup_integrates_held_power_into_minute_and_hour_buckets(ingest_db):
+    # 3600 W for one second is 1 Wh; the newest sample adds nothing until its successor arrives
+    insert_samples(ingest_db, [("dev", T0 + i * 1000, 3600.0, 15.0) for i in range(180)])
+    SampleRollupJob(ingest_db).run_once(now_ms=T0 + HOUR_MS + MINUTE_MS)
+
+    minutes = sample_store.query_samples(ingest_db, "dev", T0, T0 + HOUR_MS, "minute")
+    assert [(row["bucket_ms"] - T0, row["samples"]) for row in minutes] == [(0, 60), (MINUTE_MS, 60), (2 * MINUTE_MS, 60)]
+    assert [row["energy_wh"] for row in minutes] == pytest.approx([60, 60, 59])
+    [hour] = sample_store.query_samples(ingest_db, "dev", T0, T0 + DAY_MS, "hour")
+    assert (hour["bucket_ms"], hour["samples"], hour["energy_wh"]) == (T0, 180, pytest.approx(179))
+    assert hour["avg_power_watts"] == pytest.approx(3600)
+    # The day is not complete yet
+    assert sample_store.query_samples(ingest_db, "dev", T0, T0 + DAY_MS, "day") == []
+
+
+def test_late_sample_is_held_for_at_most_the_max_gap(ingest_db):
+    insert_samples(ingest_db, [("dev", T0, 3600.0, None), ("dev", T0 + 10 * MINUTE_MS, 0.0, None)])
+    SampleRollupJob(ingest_db).run_once(now_ms=T0 + HOUR_MS)
+    first, last = sample_store.query_samples(ingest_db, "dev", T0, T0 + HOUR_MS, "minute")
+    assert (first["bucket_ms"], last["bucket_ms"]) == (T0, T0 + 10 * MINUTE_MS)
+    assert first["energy_wh"] == pytest.approx(3600 * sample_store.SAMPLE_MAX_GAP_MS / 3_600_000)
+
+
+def test_retention_only_drops_rolled_up_samples(ingest_db, monkeypatch):
+    monkeypatch.setattr(sample_store, "SAMPLE_RETENTION_DAYS", 1)
+    monkeypatch.setitem(sample_store.ROLLUP_RETENTION_DAYS, "minute", 2)
+    insert_samples(ingest_db, [("dev", T0 + i * 1000, 100.0, None) for i in range(120)])
+    job = SampleRollupJob(ingest_db)
+
+    job.run_once(now_ms=T0 + DAY_MS + HOUR_MS)
+    assert count(ingest_db, "sensor_samples") == 0
+    assert count(ingest_db, "sensor_samples_minute") == 2
+
+    job.run_once(now_ms=T0 + 3 * DAY_MS)
+    assert count(ingest_db, "sensor_samples_minute") == 0
+    assert count(ingest_db, "sensor_samples_hour") == 1
+    assert count(ingest_db, "sensor_samples_day") == 1
+
+
+def test_recent_samples_survive_retention(ingest_db, monkeypatch):
+    monkeypatch.setattr(sample_store, "SAMPLE_RETENTION_DAYS", 1)
+    insert_samples(ingest_db, [("dev", T0 + i * 1000, 100.0, None) for i in range(120)])
+    SampleRollupJob(ingest_db).run_once(now_ms=T0 + 10 * MINUTE_MS)
+    assert count(ingest_db, "sensor_samples") == 120
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import tariff_engine
+
+SLABS = [
+    {"units_min": 0, "units_max": 100, "rate_per_kwh": 3.0, "slab_description": "0-100"},
+    {"units_min": 0, "units_max": 200, "rate_per_kwh": 5.0, "slab_description": "0-200"},
+    {"units_min": 200, "units_max": 999999, "rate_per_kwh": 8.0, "slab_description": "above 200"},
+]
+
+
+def test_overlapping_cumulative_slabs_compile_to_sorted_bands():
+    tariff = tariff_engine.compile_slabs("kseb", list(reversed(SLABS)))
+    assert tariff.upper_bounds == [100.0, 200.0, 999999.0]
+    assert tariff.rates == [3.0, 5.0, 8.0]
+    assert tariff.is_tiered
+    assert [tariff.rate_for(total) for total in (0, 100, 100.5, 200, 5000, 2_000_000)] == [3, 3, 5, 5, 8, 8]
+
+
+def test_non_telescopic_bills_the_whole_reading_at_the_month_band():
+    tariff = tariff_engine.compile_slabs("kseb", SLABS)
+    assert tariff.price(50, 0) == 150.0
+    # Crossing into the second band bills every unit of the reading at its rate
+    assert tariff.price(20, 90) == 100.0
+
+
+def test_telescopic_bills_each_unit_in_its_own_band():
+    tariff = tariff_engine.compile_slabs("kseb", SLABS, telescopic=True, fixed_charge=40)
+    assert tariff.price(20, 90) == pytest.approx(10 * 3 + 10 * 5)
+    assert tariff.price(250, 0) == pytest.approx(100 * 3 + 100 * 5 + 50 * 8)
+    assert tariff.monthly_bill(250) == pytest.approx(1200 + 40)
+
+
+@pytest.mark.parametrize("telescopic", [False, True])
+def test_price_many_matches_price(telescopic):
+    tariff = tariff_engine.compile_slabs("kseb", SLABS, telescopic=telescopic)
+    rng = np.random.default_rng(7)
+    energy = rng.uniform(0, 80, 500)
+    before = rng.uniform(0, 400, 500)
+    expected = [tariff.price(e, b) for e, b in zip(energy, before)]
+    np.testing.assert_allclose(tariff.price_many(energy, before), expected)
+
+
+def test_flat_boards_and_price_by_board_fallback():
+    boards = {"mseb": {"price_per_kwh": 6.5}, "kseb": {"price_per_kwh": 7.0, "telescopic": True}}
+    tariffs = tariff_engine.compile_tariffs(boards, {"kseb": SLABS})
+    assert not tariffs["mseb"].is_tiered
+    assert tariffs["mseb"].price(10, 1e6) == 65.0
+    prices = tariff_engine.price_by_board(tariffs, ["kseb", "mseb", "unknown"], [10, 10, 10], [0, 0, 0])
+    np.testing.assert_allclose(prices, [30.0, 65.0, 65.0])
+
+
+def test_bad_slab_tables_are_rejected():
+    with pytest.raises(ValueError):
+        tariff_engine.compile_slabs("kseb", [])
+    with pytest.raises(ValueError):
+        tariff_engine.compile_slabs("kseb", [{**SLABS[0], "rate_per_kwh": -1}])
+
+
+def test_load_board_slabs_reads_every_csv(tmp_path):
+    (tmp_path / "tneb_slabs.csv").write_text(
+        "units_min,units_max,rate_per_kwh,slab_description\n0,100,2.5,first\n100,999999,4.5,rest\n")
+    tables = tariff_engine.load_board_slabs(str(tmp_path))
+    assert list(tables) == ["tneb"]
+    assert tables["tneb"][1] == {"units_min": 100, "units_max": 999999, "rate_per_kwh": 4.5, "slab_description": "rest"}
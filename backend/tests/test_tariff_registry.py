@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+import pytest
+
+from tariff_registry import TariffRegistry, known_board, validate_boards
+
+GRID_MIX = {"coal": 1.0}
+BOARDS = {
+    "mseb": {"name": "MSEB", "state": "Maharashtra", "price_per_kwh": 6.5, "emission_factor": 0.8, "grid_mix": GRID_MIX},
+    "kseb": {"name": "KSEB", "state": "Kerala", "price_per_kwh": 7.0, "emission_factor": 0.5, "grid_mix": GRID_MIX},
+}
+SLABS_CSV = "units_min,units_max,rate_per_kwh,slab_description\n0,100,{low},low\n100,999999,9.0,high\n"
+
+
+@pytest.fixture
+def registry(tmp_path):
+    (tmp_path / "kseb_slabs.csv").write_text(SLABS_CSV.format(low=4.0))
+    return TariffRegistry(BOARDS, {}, directory=str(tmp_path), db_path=str(tmp_path / "tariffs.db"))
+
+
+def test_snapshot_compiles_files_over_defaults(registry):
+    snapshot = registry.current()
+    assert snapshot.tariff("kseb").rates == [4.0, 9.0]
+    assert snapshot.tariff("unknown") is snapshot.tariff("mseb")
+    assert snapshot.board("unknown")["name"] == "MSEB"
+    assert snapshot.emission_factor("kseb") == 0.5
+    assert snapshot.emission_factor("unknown", 0.3) == 0.3
+    # Lookups fall back to mseb, but inserts check the board first
+    assert known_board(snapshot.boards, "kseb")
+    assert not known_board(snapshot.boards, "unknown")
+
+
+def test_reload_publishes_a_new_version_only_on_change(registry, tmp_path):
+    first = registry.current()
+    assert not registry.reload()
+    (tmp_path / "kseb_slabs.csv").write_text(SLABS_CSV.format(low=5.0))
+    assert registry.reload()
+    second = registry.current()
+    assert second.version != first.version
+    # Readers holding the old snapshot keep pricing with it
+    assert first.tariff("kseb").rates[0] == 4.0
+    assert second.tariff("kseb").rates[0] == 5.0
+    conn = sqlite3.connect(str(tmp_path / "tariffs.db"))
+    versions = [row[0] for row in conn.execute("SELECT version FROM tariff_versions")]
+    conn.close()
+    assert versions == [second.version]
+
+
+def test_boards_file_overrides_and_bad_reloads_keep_the_last_good_version(registry, tmp_path):
+    boards_file = tmp_path / "electricity_boards.json"
+    boards_file.write_text(json.dumps({"kseb": {"price_per_kwh": 7.5}}))
+    assert registry.reload()
+    good = registry.current()
+    assert good.board("kseb")["price_per_kwh"] == 7.5
+    assert good.board("kseb")["name"] == "KSEB"
+
+    boards_file.write_text(json.dumps({"kseb": {"price_per_kwh": -1}}))
+    assert not registry.reload()
+    assert registry.current() is good
+    assert "negative" in registry.last_error
+
+
+def test_validate_boards_requires_fields_and_the_default_board():
+    with pytest.raises(ValueError):
+        validate_boards({"kseb": BOARDS["kseb"]})
+    with pytest.raises(ValueError):
+        validate_boards({"mseb": {"name": "MSEB"}})
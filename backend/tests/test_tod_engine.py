@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import tariff_engine
+import tod_engine
+from tod_engine import TodSchedule
+
+HOUR = 3600
+# 2025-01-01 00:00 IST
+IST_MIDNIGHT = 1735669800
+FLAT = tariff_engine.CompiledTariff("flat", [float("inf")], [10.0])
+
+
+def ist(hour: float) -> float:
+    return IST_MIDNIGHT + hour * HOUR
+
+
+def test_ist_midnight_constant():
+    assert (IST_MIDNIGHT + tod_engine.TOD_UTC_OFFSET_SECONDS) % tod_engine.DAY_SECONDS == 0
+
+
+def test_default_schedule_lookup():
+    schedule = tod_engine.compile_schedule({})
+    assert schedule.names == ["normal", "solar", "peak"]
+    windows, multipliers = schedule.lookup(np.array([8, 9, 16.99, 17, 18, 21.99, 22]) * HOUR)
+    assert [schedule.names[w] for w in windows] == ["normal", "solar", "solar", "normal", "peak", "peak", "normal"]
+    assert list(multipliers) == [1.0, 0.8, 0.8, 1.0, 1.2, 1.2, 1.0]
+
+
+def test_windows_wrapping_midnight_and_overlaps():
+    schedule = TodSchedule([{"name": "night", "start": "22:00", "end": "06:00", "multiplier": 0.5}])
+    windows, multipliers = schedule.lookup(np.array([23, 0, 5.5, 6, 12]) * HOUR)
+    assert list(multipliers) == [0.5, 0.5, 0.5, 1.0, 1.0]
+    with pytest.raises(ValueError):
+        TodSchedule([{"name": "a", "start": "08:00", "end": "12:00", "multiplier": 1},
+                     {"name": "b", "start": "11:00", "end": "13:00", "multiplier": 1}])
+    with pytest.raises(ValueError):
+        tod_engine.parse_time_of_day("25:00")
+
+
+def test_interval_energy_sorts_and_caps_gaps():
+    timestamps, power, energy = tod_engine.interval_energy([120, 0, 60, 3000], [1000, 1000, 2000, 500],
+                                                           max_gap_seconds=300)
+    assert list(timestamps) == [0, 60, 120, 3000]
+    assert list(power) == [1000, 2000, 1000, 500]
+    # The 2880 s hole is capped at 300 s; the last sample lasts the median spacing (60 s)
+    np.testing.assert_allclose(energy, np.array([1000 * 60, 2000 * 60, 1000 * 300, 500 * 60]) / 3_600_000)
+
+
+def test_evaluate_intervals_applies_tod_multipliers_and_hourly_factors():
+    schedule = tod_engine.compile_schedule({})
+    series = (np.array([ist(18)]), np.array([0.9]))
+    result = tod_engine.evaluate_intervals(FLAT, schedule, [ist(16), ist(18)], [1000, 1000], emission_series=series,
+                                           flat_emission_factor=0.5, sample_seconds=HOUR, max_gap_seconds=HOUR)
+    np.testing.assert_allclose(result["energy_kwh"], [1.0, 1.0])
+    np.testing.assert_allclose(result["cost_rupees"], [8.0, 12.0])
+    np.testing.assert_allclose(result["co2_emissions_kg"], [0.5, 0.9])
+    summary = tod_engine.summarize_intervals(result, schedule)
+    assert summary["total_cost_rupees"] == pytest.approx(20.0)
+    assert [w["energy_kwh"] for w in summary["by_window"]] == [0.0, 1.0, 1.0]
+    assert summary["by_hour"][16]["cost_rupees"] == pytest.approx(8.0)
+
+
+def test_month_to_date_restarts_at_each_local_billing_month():
+    tiered = tariff_engine.CompiledTariff("tiered", [1.5], [2.0, 4.0])
+    # 31 Jan 23:00 IST and 1 Feb 00:00 IST: the second interval starts a new billing month
+    timestamps = [ist(30 * 24 + 23), ist(31 * 24)]
+    result = tod_engine.evaluate_intervals(tiered, TodSchedule([]), timestamps, [1000, 1000], month_to_date=1.0,
+                                           sample_seconds=HOUR, max_gap_seconds=HOUR)
+    np.testing.assert_allclose(result["cost_rupees"], [4.0, 2.0])
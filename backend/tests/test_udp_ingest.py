@@ -0,0 +1,127 @@
+import asyncio
+import json
+import socket
+import sqlite3
+
+import pytest
+
+import packet_codec
+import udp_ingest
+from udp_ingest import Binding, UDPIngest, parse_bindings
+
+
+def test_parse_bindings_accepts_port_and_host_forms():
+    assert parse_bindings("auto:8888, csv@127.0.0.1:4210,", "0.0.0.0") == [
+        Binding("auto", "0.0.0.0", 8888),
+        Binding("csv", "127.0.0.1", 4210),
+    ]
+    assert parse_bindings("", "0.0.0.0") == []
+
+
+@pytest.mark.parametrize("spec", ["auto", "auto:http", "csv@:4210", "nope:8888", "auto:8888,csv:8888"])
+def test_parse_bindings_rejects_bad_entries(spec):
+    with pytest.raises(ValueError):
+        parse_bindings(spec, "0.0.0.0")
+
+
+def test_bad_bindings_only_fail_when_started(tmp_path, monkeypatch):
+    monkeypatch.setattr(udp_ingest, "UDP_INGEST_BINDINGS", "auto:not-a-port")
+    ingest = UDPIngest(str(tmp_path / "ingest.db"))
+    assert not ingest.running
+    with pytest.raises(ValueError):
+        asyncio.run(ingest.start())
+    assert not ingest.running
+
+
+def test_repeat_keeps_running_after_an_error(capsys):
+    calls = []
+
+    def action():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+
+    async def run():
+        task = asyncio.create_task(UDPIngest._repeat(0.001, action))
+        while len(calls) < 3:
+            await asyncio.sleep(0.001)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(calls) >= 3
+    assert "RuntimeError: boom" in capsys.readouterr().out
+
+
+class RecordingHub:
+    def __init__(self):
+        self.readings = []
+
+    def publish_reading(self, device_id, power_watts, energy_kwh, source, **extra):
+        self.readings.append((device_id, power_watts, energy_kwh, source))
+
+    def publish_event(self, event):
+        pass
+
+
+def test_datagrams_are_decoded_on_the_loop_and_written_in_batches(ingest_db):
+    hub = RecordingHub()
+
+    async def run():
+        ingest = UDPIngest(ingest_db, hub=hub, bindings=[Binding("auto", "127.0.0.1", 0)])
+        await ingest.start()
+        port = ingest._endpoints[0][0].get_extra_info("sockname")[1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for power in (100, 200):
+            message = {"type": "energy", "device_id": "esp32_001", "power_watts": power, "duration_hours": 0.5}
+            sock.sendto(json.dumps(message).encode("utf-8"), ("127.0.0.1", port))
+        sock.sendto(b"{broken", ("127.0.0.1", port))
+        sock.close()
+        while ingest.metrics.datagrams < 3:
+            await asyncio.sleep(0.01)
+        await ingest.stop()
+        return ingest.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["received"], stats["decode_errors"], stats["written"]) == (3, 1, 2)
+    conn = sqlite3.connect(ingest_db)
+    rows = conn.execute("SELECT device_id, power_consumption_watts FROM energy_consumption ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [("esp32_001", 100), ("esp32_001", 200)]
+    assert [reading[:2] for reading in hub.readings] == [("esp32_001", 100), ("esp32_001", 200)]
+
+
+
+def parse_key_values(data: bytes, addr=None) -> list:
+    fields = dict(part.split("=", 1) for part in data.decode("utf-8").split(";"))
+    return [{"type": "energy", "device_id": fields["id"], "power_watts": float(fields["w"]), "duration_hours": 1}]
+
+
+def test_each_binding_decodes_with_its_own_parser(ingest_db, monkeypatch):
+    monkeypatch.setitem(packet_codec.PARSERS, "kv", None)
+    packet_codec.register_parser("kv", parse_key_values)
+    assert packet_codec.get_parser("kv") is parse_key_values
+    assert parse_bindings("kv:9000", "127.0.0.1") == [Binding("kv", "127.0.0.1", 9000)]
+
+    async def run():
+        ingest = UDPIngest(ingest_db, bindings=[Binding("kv", "127.0.0.1", 0), Binding("csv", "127.0.0.1", 0)])
+        await ingest.start()
+        kv_port, csv_port = (transport.get_extra_info("sockname")[1] for transport, _ in ingest._endpoints)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(b"id=plug_7;w=60", ("127.0.0.1", kv_port))
+        sock.sendto(b"0.5,120.0,3.2,0.02", ("127.0.0.1", csv_port))
+        # The CSV binding does not sniff formats, so this is an error there
+        sock.sendto(b"id=plug_7;w=60", ("127.0.0.1", csv_port))
+        sock.close()
+        while ingest.metrics.datagrams < 3:
+            await asyncio.sleep(0.01)
+        bindings = ingest.stats()["bindings"]
+        await ingest.stop()
+        return bindings, ingest.stats()
+
+    bindings, stats = asyncio.run(run())
+    assert [(binding["parser"], binding["received"]) for binding in bindings] == [("kv", 1), ("csv", 2)]
+    assert stats["decode_errors"] == 1
+    conn = sqlite3.connect(ingest_db)
+    devices = [row[0] for row in conn.execute("SELECT device_id FROM energy_consumption ORDER BY id")]
+    conn.close()
+    assert sorted(devices) == ["127.0.0.1", "plug_7"]
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+import consumption_counters
+import udp_server
+from batch_writer import BatchWriter
+from tariff_registry import TariffRegistry
+
+GRID_MIX = {"coal": 1.0}
+BOARDS = {
+    "mseb": {"name": "MSEB", "state": "Maharashtra", "price_per_kwh": 6.5, "emission_factor": 0.8, "grid_mix": GRID_MIX},
+    "kseb": {"name": "KSEB", "state": "Kerala", "price_per_kwh": 7.0, "emission_factor": 0.5, "grid_mix": GRID_MIX},
+}
+KSEB_SLABS = [
+    {"units_min": 0, "units_max": 100, "rate_per_kwh": 4.0, "slab_description": "low"},
+    {"units_min": 100, "units_max": 999999, "rate_per_kwh": 9.0, "slab_description": "high"},
+]
+
+
+@pytest.fixture
+def priced_db(ingest_db):
+    conn = sqlite3.connect(ingest_db)
+    with conn:
+        consumption_counters.ensure_counter_table(conn.cursor())
+        consumption_counters.add_consumption(conn.cursor(), "kseb", "alice", "2025-03", 90.0)
+    conn.close()
+    return ingest_db
+
+
+def energy_message(kwh: float, board: str = "kseb", user_id: str = "alice") -> dict:
+    return {"type": "energy", "device_id": "esp32_001", "user_id": user_id, "electricity_board": board,
+            "power_watts": kwh * 1000, "duration_hours": 1, "timestamp": "2025-03-10T08:00:00"}
+
+
+def test_ingest_rows_are_priced_from_the_counters_in_the_write_transaction(priced_db, tmp_path):
+    registry = TariffRegistry(BOARDS, {"kseb": KSEB_SLABS}, directory=str(tmp_path), db_path=str(tmp_path / "t.db"))
+    writer = BatchWriter(priced_db, max_delay_ms=10)
+    writer.prepare = udp_server.energy_pricer(registry.current)
+    writer.start()
+    for message in (energy_message(20.0), energy_message(5.0, board=None, user_id="bob"),
+                    energy_message(1.0, board="nope", user_id="carol")):
+        udp_server.submit_row(writer, "energy", udp_server.energy_row(message))
+    writer.stop()
+
+    conn = sqlite3.connect(priced_db)
+    rows = conn.execute("""
+        SELECT user_id, electricity_board, cost_rupees, price_per_kwh, co2_emissions_kg, tariff_version
+        FROM energy_consumption ORDER BY id
+    """).fetchall()
+    counters = dict(conn.execute("SELECT consumer_id, energy_kwh FROM month_to_date_consumption").fetchall())
+    conn.close()
+    version = registry.current().version
+    # 90 kWh already this month, so the month ends above 100 and the whole reading is billed at 9.00
+    assert rows[0] == ("alice", "kseb", pytest.approx(180.0), pytest.approx(9.0), pytest.approx(10.0), version)
+    # No board from the device: priced at the default board's flat rate and emission factor
+    assert rows[1] == ("bob", "mseb", pytest.approx(32.5), pytest.approx(6.5), pytest.approx(4.0), version)
+    # A board the tariff tables don't know is stored (and counted) as the default board, not just priced as it
+    assert rows[2] == ("carol", "mseb", pytest.approx(6.5), pytest.approx(6.5), pytest.approx(0.8), version)
+    assert counters == {"alice": pytest.approx(110.0), "bob": pytest.approx(5.0), "carol": pytest.approx(1.0)}
+
+
+def test_rows_stay_unpriced_without_a_pricer(ingest_db):
+    writer = BatchWriter(ingest_db, max_delay_ms=10)
+    writer.start()
+    udp_server.submit_row(writer, "energy", udp_server.energy_row(energy_message(1.0)))
+    writer.stop()
+    conn = sqlite3.connect(ingest_db)
+    row = conn.execute("SELECT electricity_board, cost_rupees, tariff_version FROM energy_consumption").fetchone()
+    conn.close()
+    assert row == ("kseb", None, None)
+
+
+def test_coalesced_rows_keep_their_board():
+    first = udp_server.energy_row(energy_message(1.0))
+    merged = udp_server.merge_energy_rows(first, udp_server.energy_row(energy_message(2.0)))
+    assert merged[3] == pytest.approx(3.0)
+    assert merged[7:] == ("kseb", None, None, None)
@@ -0,0 +1,198 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+# All Indian boards bill in IST (UTC+05:30, no daylight saving)
+TOD_UTC_OFFSET_SECONDS = 5 * 3600 + 30 * 60
+TOD_TIMEZONE = "Asia/Kolkata"
+
+# Default time-of-day schedule (solar hours cheaper, evening peak dearer) applied as
+# multipliers on the slab rate. Boards override it with "tod_windows"; [] disables TOD.
+DEFAULT_TOD_WINDOWS = [
+    {"name": "solar", "start": "09:00", "end": "17:00", "multiplier": 0.8},
+    {"name": "peak", "start": "18:00", "end": "22:00", "multiplier": 1.2},
+]
+
+# Longest gap (seconds) a single sample's power is assumed to last when the next sample is late
+TOD_MAX_GAP_SECONDS = float(os.getenv("TOD_MAX_GAP_SECONDS", "300"))
+
+DAY_SECONDS = 24 * 3600
+
+
+def parse_time_of_day(value: str) -> int:
+    """'HH:MM' to seconds after midnight ('24:00' is allowed as an end time)"""
+    hours, minutes = value.split(":")
+    seconds = int(hours) * 3600 + int(minutes) * 60
+    if not 0 <= seconds <= DAY_SECONDS:
+        raise ValueError(f"Invalid time of day '{value}'")
+    return seconds
+
+
+class TodSchedule:
+    """A day split into sorted segments, each with a window name and rate multiplier"""
+
+    def __init__(self, windows: list):
+        spans = []
+        for window in windows:
+            start = parse_time_of_day(window["start"])
+            end = parse_time_of_day(window["end"])
+            multiplier = float(window["multiplier"])
+            if start == end or multiplier < 0:
+                raise ValueError(f"Invalid TOD window {window}")
+            # Windows that wrap past midnight are split in two
+            if end < start:
+                spans.append((start, DAY_SECONDS, window["name"], multiplier))
+                spans.append((0, end, window["name"], multiplier))
+            else:
+                spans.append((start, end, window["name"], multiplier))
+        spans.sort()
+
+        self.names = ["normal"]
+        boundaries = [0]
+        segment_names = []
+        multipliers = []
+        position = 0
+        for start, end, name, multiplier in spans:
+            if start < position:
+                raise ValueError(f"TOD window '{name}' overlaps another window")
+            if start > position:
+                segment_names.append("normal")
+                multipliers.append(1.0)
+                boundaries.append(start)
+            segment_names.append(name)
+            multipliers.append(multiplier)
+            boundaries.append(end)
+            position = end
+            if name not in self.names:
+                self.names.append(name)
+        if position < DAY_SECONDS:
+            segment_names.append("normal")
+            multipliers.append(1.0)
+            boundaries.append(DAY_SECONDS)
+
+        # Segment i covers [boundaries[i], boundaries[i + 1])
+        self._boundaries = np.array(boundaries, dtype=float)
+        self._multipliers = np.array(multipliers, dtype=float)
+        self._window_ids = np.array([self.names.index(name) for name in segment_names])
+
+    def lookup(self, seconds_of_day: np.ndarray) -> tuple:
+        """Window index (into self.names) and rate multiplier for each time of day"""
+        segment = np.searchsorted(self._boundaries, seconds_of_day, side="right") - 1
+        return self._window_ids[segment], self._multipliers[segment]
+
+
+def compile_schedule(board: dict) -> TodSchedule:
+    return TodSchedule(board.get("tod_windows", DEFAULT_TOD_WINDOWS))
+
+
+def load_emission_series(directory: str = ".") -> dict:
+    """Load every <board>_emission_factors.csv (hour_start, emission_factor) as sorted epoch-second arrays"""
+    series = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*_emission_factors.csv"))):
+        board_id = os.path.basename(path)[:-len("_emission_factors.csv")]
+        frame = pd.read_csv(path)
+        hour_start = pd.to_datetime(frame["hour_start"], format="ISO8601")
+        if hour_start.dt.tz is None:
+            hour_start = hour_start.dt.tz_localize(TOD_TIMEZONE)
+        factors = frame["emission_factor"].to_numpy(dtype=float)
+        if np.any(factors < 0):
+            raise ValueError(f"{path} has a negative emission factor")
+        epoch = ((hour_start - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy()
+        order = np.argsort(epoch, kind="stable")
+        series[board_id] = (epoch[order].astype(float), factors[order])
+    return series
+
+
+def hourly_emission_factors(timestamps: np.ndarray, series: tuple = None, flat_factor: float = 0.5) -> np.ndarray:
+    """Emission factor for the hour each timestamp falls in; the flat factor outside the series"""
+    if series is None or len(series[0]) == 0:
+        return np.full(timestamps.shape, flat_factor, dtype=float)
+    hour_starts, factors = series
+    index = np.searchsorted(hour_starts, timestamps, side="right") - 1
+    clipped = np.clip(index, 0, len(factors) - 1)
+    covered = (index >= 0) & (timestamps < hour_starts[clipped] + 3600)
+    return np.where(covered, factors[clipped], flat_factor)
+
+
+def interval_energy(timestamps, power_watts, sample_seconds: float = None,
+                    max_gap_seconds: float = TOD_MAX_GAP_SECONDS) -> tuple:
+    """Sort samples by time and turn them into per-interval kWh.
+
+    Each sample's power is held until the next sample, up to max_gap_seconds;
+    the last sample lasts sample_seconds (default: the median spacing).
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    power = np.asarray(power_watts, dtype=float)
+    if timestamps.shape != power.shape:
+        raise ValueError("timestamps and power_watts must have the same length")
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    power = power[order]
+
+    gaps = np.diff(timestamps)
+    if sample_seconds is None:
+        sample_seconds = float(np.median(gaps)) if len(gaps) else 1.0
+    durations = np.minimum(np.append(gaps, sample_seconds), max_gap_seconds)
+    return timestamps, power, power * durations / 3_600_000
+
+
+def evaluate_intervals(tariff, schedule: TodSchedule, timestamps, power_watts, emission_series: tuple = None,
+                       flat_emission_factor: float = 0.5, month_to_date: float = 0, sample_seconds: float = None,
+                       max_gap_seconds: float = TOD_MAX_GAP_SECONDS) -> dict:
+    """Cost and CO2 for interval readings in one vectorized pass.
+
+    Each interval is priced at its slab rate (given consumption earlier in the
+    same billing month) times the multiplier of the TOD window it starts in,
+    and its CO2 uses the emission factor of the hour it starts in.
+    month_to_date is the consumption already billed in the first sample's month.
+    """
+    timestamps, power, energy = interval_energy(timestamps, power_watts, sample_seconds, max_gap_seconds)
+    local = timestamps + TOD_UTC_OFFSET_SECONDS
+    seconds_of_day = np.mod(local, DAY_SECONDS)
+    window, multiplier = schedule.lookup(seconds_of_day)
+
+    # Month-to-date before each interval, restarting at each local billing month
+    months = local.astype("int64").astype("datetime64[s]").astype("datetime64[M]")
+    positions = np.arange(len(energy))
+    month_starts = np.ones(len(energy), dtype=bool)
+    month_starts[1:] = months[1:] != months[:-1]
+    first_in_month = np.maximum.accumulate(np.where(month_starts, positions, 0))
+    consumed = np.cumsum(energy) - energy
+    before = consumed - consumed[first_in_month]
+    if len(months):
+        before = before + np.where(months == months[0], month_to_date, 0.0)
+
+    cost = tariff.price_many(energy, before) * multiplier
+    co2 = energy * hourly_emission_factors(timestamps, emission_series, flat_emission_factor)
+    return {
+        "timestamps": timestamps,
+        "energy_kwh": energy,
+        "cost_rupees": cost,
+        "co2_emissions_kg": co2,
+        "window": window,
+        "hour": (seconds_of_day // 3600).astype(int),
+    }
+
+
+def summarize_intervals(result: dict, schedule: TodSchedule) -> dict:
+    """Totals plus per-TOD-window and per-local-hour breakdowns of evaluate_intervals output"""
+    columns = ("energy_kwh", "cost_rupees", "co2_emissions_kg")
+
+    def breakdown(keys, size):
+        return {column: np.bincount(keys, weights=result[column], minlength=size) for column in columns}
+
+    by_window = breakdown(result["window"], len(schedule.names))
+    by_hour = breakdown(result["hour"], 24)
+    return {
+        "samples": int(len(result["energy_kwh"])),
+        **{f"total_{column}": float(result[column].sum()) for column in columns},
+        "by_window": [
+            {"window": name, **{column: float(by_window[column][i]) for column in columns}}
+            for i, name in enumerate(schedule.names)
+        ],
+        "by_hour": [
+            {"hour": hour, **{column: float(by_hour[column][hour]) for column in columns}}
+            for hour in range(24)
+        ],
+    }
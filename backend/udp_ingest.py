@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import os
+import signal
+from typing import NamedTuple
+
+import anomaly_detector
+import device_control
+import ingest_schema
+import packet_codec
+import udp_server
+from batch_writer import BatchWriter
+from ingest_metrics import IngestMetrics
+
+# The in-process listener is opt-in so it never clashes with a standalone udp_server.py on the same port
+UDP_INGEST_ENABLED = os.getenv("UDP_INGEST_ENABLED", "0") == "1"
+UDP_INGEST_HOST = os.getenv("UDP_INGEST_HOST", "0.0.0.0")
+UDP_INGEST_PORT = int(os.getenv("UDP_INGEST_PORT", "8888"))
+# Kernel receive buffer in bytes; unset keeps the OS default
+UDP_INGEST_RCVBUF = int(os.getenv("UDP_INGEST_RCVBUF", "0")) or None
+# Comma-separated parser:port or parser@host:port bindings, e.g. "auto:8888,csv:4210";
+# unset listens on UDP_INGEST_HOST:UDP_INGEST_PORT with format detection
+UDP_INGEST_BINDINGS = os.getenv("UDP_INGEST_BINDINGS", "")
+
+# Row kinds pushed to the live hub, one reading per energy message or sample packet
+LIVE_ROW_KINDS = ("energy", "samples")
+
+
+class Binding(NamedTuple):
+    parser: str
+    host: str
+    port: int
+
+    def __str__(self) -> str:
+        return f"{self.parser}@{self.host}:{self.port}"
+
+
+def parse_bindings(spec: str, default_host: str = UDP_INGEST_HOST) -> list:
+    """Parse "parser:port" / "parser@host:port" entries; parsers must be registered in packet_codec.PARSERS"""
+    bindings = []
+    for entry in (part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        parser, sep, address = entry.partition("@")
+        if sep:
+            host, _, port = address.rpartition(":")
+        else:
+            parser, sep, port = entry.partition(":")
+            host = default_host
+        if not sep or not host or not port.isdigit():
+            raise ValueError(f"Bad ingest binding {entry!r}; expected parser:port or parser@host:port")
+        packet_codec.get_parser(parser)
+        bindings.append(Binding(parser, host, int(port)))
+    addresses = [(binding.host, binding.port) for binding in bindings]
+    if len(set(addresses)) != len(addresses):
+        raise ValueError("Each ingest binding needs its own host:port")
+    return bindings
+
+
+class UDPIngestProtocol(asyncio.DatagramProtocol):
+    """Decodes datagrams on the event loop and hands rows to the batch writer; never touches the database"""
+
+    def __init__(self, ingest: "UDPIngest", binding: Binding):
+        self.ingest = ingest
+        self.binding = binding
+        self.parse = packet_codec.get_parser(binding.parser)
+        self.received = 0
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.received += 1
+        metrics = self.ingest.metrics
+        metrics.record_datagram()
+        controller = self.ingest.controller
+        if controller is None:
+            observe = metrics.observe_message
+        else:
+            def observe(message):
+                metrics.observe_message(message)
+                # Configs go back out of the socket this device sends to
+                controller.observe(message, addr, self)
+        try:
+            rows = udp_server.decode_rows(data, addr, observe, self.ingest.integrator, self.parse, self.ingest.detector)
+        except Exception as e:
+            metrics.record_decode_error()
+            print(f"Dropped datagram from {addr} on {self.binding}: {type(e).__name__}: {e}")
+            return
+        # Never block the loop; on a full queue the writer's overflow policy decides (block = drop the new row)
+        hub = self.ingest.hub
+        for kind, row in rows:
+            udp_server.submit_row(self.ingest.writer, kind, row, block=False)
+            if hub is not None and kind in LIVE_ROW_KINDS:
+                # energy_consumption rows: (date, power, duration, energy, co2, device, user)
+                hub.publish_reading(row[5], row[1], row[3], "udp", co2_emissions_kg=row[4])
+
+    def error_received(self, exc):
+        print(f"UDP ingest socket error on {self.binding}: {exc}")
+
+
+class UDPIngest:
+    """ESP32 UDP ingest on one event loop, listening on any number of port/parser bindings.
+
+    Every binding decodes in its protocol callback and feeds the same metrics,
+    energy integrator and BatchWriter thread, so a slow write never blocks the
+    loop and every device generation shares one storage pipeline.
+    """
+
+    def __init__(self, db_path: str, host: str = UDP_INGEST_HOST, port: int = UDP_INGEST_PORT,
+                 rcvbuf: int = UDP_INGEST_RCVBUF, hub=None, bindings: list = None):
+        self.rcvbuf = rcvbuf
+        self.host = host
+        self.port = port
+        # None reads UDP_INGEST_BINDINGS in start(), so a bad value can't break importing the API
+        self.bindings = bindings
+        self.writer = BatchWriter(db_path)
+        self.metrics = IngestMetrics()
+        self.integrator = udp_server.new_integrator()
+        self.controller = device_control.DeviceController() if device_control.DEVICE_CONTROL_ENABLED else None
+        # Optional live_hub.LiveHub that new readings and anomalies are published to
+        self.hub = hub
+        self.detector = udp_server.new_detector(hub.publish_event if hub is not None else None)
+        self._endpoints = []
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._endpoints)
+
+    async def start(self):
+        if self.running:
+            return
+        if self.bindings is None:
+            self.bindings = parse_bindings(UDP_INGEST_BINDINGS, self.host) or [Binding("auto", self.host, self.port)]
+        loop = asyncio.get_running_loop()
+        self.writer.start()
+        try:
+            for binding in self.bindings:
+                sock = udp_server.make_udp_socket(binding.host, binding.port, self.rcvbuf)
+                endpoint = await loop.create_datagram_endpoint(
+                    lambda binding=binding: UDPIngestProtocol(self, binding), sock=sock
+                )
+                self._endpoints.append(endpoint)
+                print(f"UDP ingest listening on {binding.host}:{binding.port} ({binding.parser})")
+        except Exception:
+            await self.stop()
+            raise
+        if self.controller is not None:
+            self._tasks.append(asyncio.create_task(
+                self._repeat(device_control.DEVICE_CONTROL_INTERVAL_SECONDS, self.send_configs)))
+        if self.detector is not None:
+            self._tasks.append(asyncio.create_task(
+                self._repeat(anomaly_detector.ANOMALY_SWEEP_SECONDS, self.sweep_dropouts)))
+
+    async def stop(self):
+        """Stop receiving on every binding, then write everything already queued"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for transport, _ in self._endpoints:
+            transport.close()
+        self._endpoints = []
+        await asyncio.to_thread(self.writer.stop)
+
+    @staticmethod
+    async def _repeat(seconds: float, action):
+        while True:
+            await asyncio.sleep(seconds)
+            try:
+                action()
+            except Exception as e:
+                # One bad round must not end the background task for good
+                print(f"UDP ingest {action.__name__} failed: {type(e).__name__}: {e}")
+
+    def send_configs(self):
+        """Downlink reporting configs that changed for the current ingest load"""
+        pressure = device_control.ingest_pressure(self.metrics, self.writer)
+        for protocol, addr, payload in self.controller.plan(pressure):
+            if protocol.transport is not None and not protocol.transport.is_closing():
+                protocol.transport.sendto(payload, addr)
+
+    def sweep_dropouts(self):
+        """Record devices that went silent as dropout anomalies"""
+        for event in self.detector.sweep():
+            udp_server.submit_row(self.writer, 'anomaly', anomaly_detector.anomaly_row(event), block=False)
+
+    def stats(self) -> dict:
+        writer = self.writer.stats()
+        return {
+            "running": self.running,
+            "received": self.metrics.datagrams,
+            "decode_errors": self.metrics.decode_errors,
+            "queued": writer["queued"],
+            "written": writer["written"],
+            "failed": writer["failed"],
+            "dropped": writer["dropped"],
+            "bindings": [
+                {**protocol.binding._asdict(), "received": protocol.received} for _, protocol in self._endpoints
+            ],
+        }
+
+    def metrics_snapshot(self) -> dict:
+        """Datagram rate, per-device sequence health and writer queue/latency"""
+        return {
+            "running": self.running,
+            **self.metrics.snapshot(),
+            "writer": self.writer.stats(),
+            "integration": self.integrator.stats() if self.integrator is not None else None,
+            "control": self.controller.stats() if self.controller is not None else None,
+            "anomalies": self.detector.stats() if self.detector is not None else None,
+        }
+
+
+async def serve(db_path: str, bindings: list, rcvbuf: int = None):
+    """Run the ingest service on its own, without the API, until SIGINT/SIGTERM"""
+    # Running without the API, so nothing else has created the tables
+    ingest_schema.init_ingest_db(db_path)
+    ingest = UDPIngest(db_path, rcvbuf=rcvbuf, bindings=bindings)
+    await ingest.start()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    try:
+        while not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), udp_server.METRICS_LOG_SECONDS)
+            except asyncio.TimeoutError:
+                udp_server.log_metrics(ingest.metrics, ingest.writer)
+    finally:
+        print("Stopping UDP ingest...")
+        await ingest.stop()
+
+
+if __name__ == "__main__":
+    # One process for every device generation, e.g. --bind auto:8888 --bind csv:4210
+    parser = argparse.ArgumentParser(description="Receive ESP32 readings on several UDP ports in one event loop")
+    parser.add_argument("--bind", action="append", default=[],
+                        help=f"parser:port or parser@host:port with parser one of {', '.join(packet_codec.PARSERS)} "
+                             "(repeatable; default UDP_INGEST_BINDINGS, else auto:UDP_INGEST_PORT)")
+    parser.add_argument("--db", default="carbon_footprint.db")
+    parser.add_argument("--rcvbuf", type=int, default=UDP_INGEST_RCVBUF, help="kernel receive buffer per socket, in bytes")
+    args = parser.parse_args()
+
+    bindings = parse_bindings(",".join(args.bind)) if args.bind else None
+    asyncio.run(serve(args.db, bindings, args.rcvbuf))
@@ -1,137 +1,512 @@
 import socket
-import json
 import threading
-import sqlite3
+import argparse
+import multiprocessing
+import queue
 from datetime import datetime
 import time
+from batch_writer import BatchWriter
+import consumption_counters
+import anomaly_detector
+from anomaly_detector import AnomalyDetector
+import device_control
+from device_control import DeviceController
+import ingest_schema
+import packet_codec
+import sample_store
+import tariff_registry
+import energy_integrator
+from energy_integrator import EnergyIntegrator
+from ingest_metrics import IngestMetrics
+
+# Largest datagram accepted
+MAX_DATAGRAM_SIZE = packet_codec.MAX_PACKET_SIZE
+# Rows a worker process collects before sending them to the writer, and the longest it holds them
+WORKER_BATCH_ROWS = 200
+WORKER_BATCH_SECONDS = 0.05
+# How often the standalone servers print an ingest metrics summary
+METRICS_LOG_SECONDS = 60
+# Datagrams buffered between the receive and decode stages; beyond this the receive stage drops them
+RECEIVE_QUEUE_SIZE = 10000
+
+# CO2 per km for commute messages
+COMMUTE_EMISSION_FACTORS = {
+    "car": 0.192,
+    "motorcycle": 0.103,
+    "bus": 0.089,
+    "train": 0.041,
+    "bicycle": 0.0,
+    "walking": 0.0,
+    "electric_car": 0.053,
+    "hybrid_car": 0.120
+}
+
+# Board, price, cost and tariff version stay NULL unless the writer prices rows (see energy_pricer)
+ENERGY_INSERT_SQL = """
+    INSERT INTO energy_consumption 
+    (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg, device_id, user_id,
+     electricity_board, price_per_kwh, cost_rupees, tariff_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+COMMUTE_INSERT_SQL = """
+    INSERT INTO commute_logs 
+    (date, transport_mode, distance_km, co2_emissions_kg, device_id, user_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+def new_integrator():
+    """Per-device energy integration state for a receiver, or None to trust device-supplied durations"""
+    return EnergyIntegrator() if energy_integrator.ENERGY_INTEGRATION == "server" else None
+
+def new_detector(on_event=None):
+    """Per-device anomaly detection state for a receiver, or None when detection is off"""
+    return AnomalyDetector(on_event=on_event) if anomaly_detector.ANOMALY_DETECTION_ENABLED else None
+
+def energy_row(data: dict, integrator: EnergyIntegrator = None, received_ms: int = None) -> tuple:
+    """Build an energy_consumption row (ENERGY_INSERT_SQL order) from an energy message"""
+    power_watts = data.get('power_watts', 0)
+    duration_hours = data.get('duration_hours', 0)
+    device_id = data.get('device_id', 'unknown')
+    user_id = data.get('user_id')
+    timestamp = data.get('timestamp', datetime.now().isoformat())
+    
+    # Calculate energy consumption
+    if integrator is not None:
+        # Integrate from the device's previous reading by receive time instead of trusting duration_hours
+        received_ms = received_ms or int(time.time() * 1000)
+        energy_wh, duration_ms, started = integrator.add(device_id, received_ms, power_watts)
+        if started:
+            # Nothing to integrate from yet; take the device's interval, capped like a gap
+            duration_hours = min(duration_hours, integrator.max_gap_ms / 3600000)
+            energy_kwh = (power_watts * duration_hours) / 1000
+        else:
+            duration_hours = duration_ms / 3600000
+            energy_kwh = energy_wh / 1000
+    else:
+        energy_kwh = (power_watts * duration_hours) / 1000
+    
+    # Calculate CO2 emissions (kg CO2/kWh)
+    co2_emissions = energy_kwh * 0.5  # Adjust based on your region's grid mix
+    
+    return (timestamp.split('T')[0], power_watts, duration_hours, energy_kwh, co2_emissions, device_id, user_id,
+            data.get('electricity_board'), None, None, None)
+
+def commute_row(data: dict) -> tuple:
+    """Build a commute_logs row (COMMUTE_INSERT_SQL order) from a commute message"""
+    distance_km = data.get('distance_km', 0)
+    transport_mode = data.get('transport_mode', 'car')
+    device_id = data.get('device_id', 'unknown')
+    user_id = data.get('user_id')
+    timestamp = data.get('timestamp', datetime.now().isoformat())
+    
+    co2_emissions = distance_km * COMMUTE_EMISSION_FACTORS.get(transport_mode.lower(), 0.1)
+    
+    return (timestamp.split('T')[0], transport_mode, distance_km, co2_emissions, device_id, user_id)
+
+def samples_row(data: dict, integrator: EnergyIntegrator = None, received_ms: int = None) -> tuple:
+    """Build one energy_consumption row summarizing a packet of (ts_ms, power, current) samples"""
+    samples = data['samples']
+    if integrator is not None:
+        # Trapezoids from the device's previous reading (possibly in an earlier packet) through this packet
+        energy_wh, duration_ms = integrator.add_many(data.get('device_id', 'unknown'), samples,
+                                                     received_ms or int(time.time() * 1000))
+        duration_hours = duration_ms / 3600000
+        energy_kwh = energy_wh / 1000
+    else:
+        # Each sample's power holds until the next one; the last holds for the nominal period
+        held_ms = [later[0] - sample[0] for sample, later in zip(samples, samples[1:])] + [data.get('period_ms') or 0]
+        duration_hours = sum(held_ms) / 3600000
+        energy_kwh = sum(sample[1] * ms for sample, ms in zip(samples, held_ms)) / 3.6e9
+    power_watts = energy_kwh * 1000 / duration_hours if duration_hours > 0 else samples[-1][1]
+    co2_emissions = energy_kwh * 0.5  # Same flat grid factor as energy messages
+    date = datetime.fromtimestamp(samples[0][0] / 1000).strftime('%Y-%m-%d')
+    return (date, power_watts, duration_hours, energy_kwh, co2_emissions, data.get('device_id', 'unknown'), data.get('user_id'),
+            data.get('electricity_board'), None, None, None)
+
+# Message type -> (row builder, insert statement)
+MESSAGE_HANDLERS = {
+    'energy': (energy_row, ENERGY_INSERT_SQL),
+    'commute': (commute_row, COMMUTE_INSERT_SQL),
+    'samples': (samples_row, ENERGY_INSERT_SQL),
+}
+
+# Message types whose energy comes from power readings, and so can be integrated server-side
+INTEGRATED_MESSAGES = ('energy', 'samples')
+
+# Row kind -> insert statement; sample packets also store every reading in sensor_samples
+INSERT_STATEMENTS = {
+    **{message_type: sql for message_type, (_, sql) in MESSAGE_HANDLERS.items()},
+    'sample': sample_store.SAMPLE_INSERT_SQL,
+    'anomaly': anomaly_detector.ANOMALY_INSERT_SQL,
+}
+
+def merge_energy_rows(old: tuple, new: tuple) -> tuple:
+    """Fold two energy_consumption rows for the same device and day into one"""
+    duration_hours = old[2] + new[2]
+    energy_kwh = old[3] + new[3]
+    power_watts = energy_kwh * 1000 / duration_hours if duration_hours > 0 else new[1]
+    return (old[0], power_watts, duration_hours, energy_kwh, old[4] + new[4], old[5], old[6], *old[7:])
+
+def merge_commute_rows(old: tuple, new: tuple) -> tuple:
+    """Fold two commute_logs rows for the same device, day and mode into one"""
+    return (old[0], old[1], old[2] + new[2], old[3] + new[3], old[4], old[5])
+
+# Row kind -> (coalescing key, merge) used by the writer's coalesce policy; raw samples keep the latest reading
+COALESCE_RULES = {
+    'energy': (lambda row: (row[5], row[6], row[0], row[7]), merge_energy_rows),
+    'samples': (lambda row: (row[5], row[6], row[0], row[7]), merge_energy_rows),
+    'commute': (lambda row: (row[4], row[5], row[0], row[1]), merge_commute_rows),
+    'sample': (lambda row: row[0], None),
+    'anomaly': (lambda row: None, None),
+}
+
+def energy_pricer(tariff_source, default_board: str = "mseb"):
+    """A BatchWriter.prepare hook pricing energy rows like the API does.
+
+    Each row is priced with tariff_source()'s slab tariff for its board (default_board
+    when the device sent none or one tariff_registry.known_board rejects; a datagram
+    has nobody to return the error to) from its consumer's month-to-date counter, which is
+    advanced in the same transaction. CO2 is recomputed with the board's emission factor.
+    """
+    def prepare(cursor, sql: str, rows: list) -> list:
+        if sql != ENERGY_INSERT_SQL:
+            return rows
+        snapshot = tariff_source()
+        keys = [
+            (row[7] if tariff_registry.known_board(snapshot.boards, row[7]) else default_board,
+             consumption_counters.consumer_key(row[6], row[5]), row[0][:7])
+            for row in rows
+        ]
+        month_to_date = consumption_counters.read_many(cursor, keys)
+        added = {}
+        priced = []
+        for row, key in zip(rows, keys):
+            board, energy_kwh = key[0], row[3]
+            cost_rupees = snapshot.tariff(board).price(energy_kwh, month_to_date[key])
+            month_to_date[key] += energy_kwh
+            added[key] = added.get(key, 0.0) + energy_kwh
+            price_per_kwh = cost_rupees / energy_kwh if energy_kwh > 0 else snapshot.board(board)["price_per_kwh"]
+            co2_emissions = energy_kwh * snapshot.emission_factor(board, 0.5)
+            priced.append((*row[:4], co2_emissions, row[5], row[6], board, price_per_kwh, cost_rupees, snapshot.version))
+        consumption_counters.add_consumption_many(cursor, [(*key, kwh) for key, kwh in added.items()])
+        return priced
+    return prepare
+
+def submit_row(writer: BatchWriter, kind: str, row: tuple, block: bool = True) -> bool:
+    """Queue a decoded row on the writer with its coalescing key"""
+    key, merge = COALESCE_RULES[kind]
+    return writer.submit(INSERT_STATEMENTS[kind], row, block=block, key=key(row), merge=merge)
+
+def decode_rows(data: bytes, addr=None, on_message=None, integrator: EnergyIntegrator = None,
+                parser=packet_codec.decode_datagram, detector: AnomalyDetector = None,
+                received_ms: int = None) -> list:
+    """Decode a JSON, CSV or binary datagram into (row kind, row) pairs, calling on_message for each message.
+
+    With an integrator, energy is integrated over reading timestamps instead of device-supplied durations.
+    parser is one of packet_codec.PARSERS; the default detects the format. With a detector, anomalies
+    the readings raise become 'anomaly' rows. received_ms is when the datagram came off the socket
+    (default now); readings without their own timestamps are integrated at that time.
+    """
+    rows = []
+    received_ms = received_ms or int(time.time() * 1000)
+    for message in parser(data, addr):
+        if on_message is not None:
+            on_message(message)
+        if detector is not None:
+            rows.extend(('anomaly', anomaly_detector.anomaly_row(event)) for event in detector.check(message, received_ms))
+        message_type = message.get('type')
+        if message_type not in MESSAGE_HANDLERS:
+            # Control messages (config_ack, status) are only seen by on_message
+            continue
+        build_row, _ = MESSAGE_HANDLERS[message_type]
+        if integrator is not None and message_type in INTEGRATED_MESSAGES:
+            rows.append((message_type, build_row(message, integrator, received_ms)))
+        else:
+            rows.append((message_type, build_row(message)))
+        if message_type == 'samples':
+            rows.extend(('sample', row) for row in sample_store.sample_rows(message))
+    return rows
+
+def log_metrics(metrics: IngestMetrics, writer: BatchWriter):
+    """Print a one-line ingest health summary"""
+    summary = metrics.snapshot()
+    writer_stats = writer.stats()
+    print(f"Ingest: {summary['packets_per_second']:.1f} pkt/s, {summary['datagrams']} datagrams, "
+          f"{summary['decode_errors']} decode errors, {summary['missing']} missing, "
+          f"{summary['duplicates']} duplicate, {summary['out_of_order']} out of order, "
+          f"queue {writer_stats['queued']}/{writer_stats['queue_capacity']}, "
+          f"{writer_stats['dropped'] + writer_stats['evicted']} dropped, {writer_stats['spilled']} spilled, "
+          f"write p95 {writer_stats['write_latency_ms']['p95']:.1f} ms")
+
+def make_udp_socket(host: str, port: int, rcvbuf: int = None, reuse_port: bool = False) -> socket.socket:
+    """Create and bind a UDP socket, optionally with a larger kernel receive buffer and SO_REUSEPORT"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            sock.close()
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf:
+        # Linux doubles the request and caps it at net.core.rmem_max; report what was granted
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if granted < rcvbuf:
+            print(f"SO_RCVBUF: requested {rcvbuf} bytes, kernel granted {granted} (raise net.core.rmem_max)")
+    sock.bind((host, port))
+    return sock
 
 class UDPServer:
-    def __init__(self, host='0.0.0.0', port=8888, db_path='carbon_footprint.db'):
+    """Threaded UDP ingest staged as receive -> decode -> bounded writer queue -> group commit.
+
+    The receive loop only stamps datagrams with their receive time and moves
+    them into a bounded queue, so neither decoding nor a database stall holds
+    up recvfrom, and a backlog does not skew integration.
+    """
+
+    def __init__(self, host='0.0.0.0', port=8888, db_path='carbon_footprint.db', rcvbuf=None, verbose=False):
         self.host = host
         self.port = port
         self.db_path = db_path
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rcvbuf = rcvbuf
+        # Per-message logging; off by default since it runs for every datagram
+        self.verbose = verbose
+        self.socket = None
         self.running = False
+        # Readings are group-committed instead of one transaction per datagram
+        self.writer = BatchWriter(db_path)
+        self.metrics = IngestMetrics()
+        self.integrator = new_integrator()
+        self.controller = DeviceController() if device_control.DEVICE_CONTROL_ENABLED else None
+        self.detector = new_detector()
+        self.datagrams = queue.Queue(maxsize=RECEIVE_QUEUE_SIZE)
+        self._decoder = None
         
     def start(self):
         """Start the UDP server"""
         try:
-            self.socket.bind((self.host, self.port))
+            self.socket = make_udp_socket(self.host, self.port, self.rcvbuf)
+            self.socket.settimeout(1.0)
+            self.writer.start()
             self.running = True
+            self._decoder = threading.Thread(target=self._decode_loop, daemon=True)
+            self._decoder.start()
             print(f"UDP Server started on {self.host}:{self.port}")
             
+            next_log = time.monotonic() + METRICS_LOG_SECONDS
+            next_control = time.monotonic() + device_control.DEVICE_CONTROL_INTERVAL_SECONDS
+            next_sweep = time.monotonic() + anomaly_detector.ANOMALY_SWEEP_SECONDS
             while self.running:
+                if time.monotonic() >= next_log:
+                    log_metrics(self.metrics, self.writer)
+                    next_log = time.monotonic() + METRICS_LOG_SECONDS
+                if self.controller is not None and time.monotonic() >= next_control:
+                    self.send_configs()
+                    next_control = time.monotonic() + device_control.DEVICE_CONTROL_INTERVAL_SECONDS
+                if self.detector is not None and time.monotonic() >= next_sweep:
+                    self.record_anomalies(self.detector.sweep())
+                    next_sweep = time.monotonic() + anomaly_detector.ANOMALY_SWEEP_SECONDS
                 try:
-                    data, addr = self.socket.recvfrom(1024)
-                    self.handle_data(data, addr)
+                    data, addr = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+                    received_ms = int(time.time() * 1000)
+                    self.metrics.record_datagram()
+                    self.datagrams.put_nowait((data, addr, received_ms))
+                except queue.Full:
+                    self.metrics.record_receive_drop()
                 except socket.timeout:
                     continue
                 except Exception as e:
-                    print(f"Error receiving data: {e}")
+                    if self.running:
+                        print(f"Error receiving data: {e}")
                     
         except Exception as e:
             print(f"Failed to start UDP server: {e}")
         finally:
-            self.socket.close()
+            self.running = False
+            if self.socket is not None:
+                self.socket.close()
+            self._stop_decoder()
+            self.writer.stop()
     
     def stop(self):
-        """Stop the UDP server"""
+        """Stop the UDP server, writing any buffered readings first"""
         self.running = False
-        self.socket.close()
-    
-    def handle_data(self, data, addr):
-        """Handle incoming IoT data"""
-        try:
-            # Parse JSON data from ESP32
-            message = json.loads(data.decode('utf-8'))
-            print(f"Received from {addr}: {message}")
-            
-            # Process different types of IoT data
-            if message.get('type') == 'energy':
-                self.process_energy_data(message)
-            elif message.get('type') == 'commute':
-                self.process_commute_data(message)
-            else:
-                print(f"Unknown message type: {message.get('type')}")
-                
-        except json.JSONDecodeError as e:
-            print(f"Invalid JSON from {addr}: {e}")
-        except Exception as e:
-            print(f"Error processing data from {addr}: {e}")
+        if self.socket is not None:
+            self.socket.close()
+        self._stop_decoder()
+        self.writer.stop()
+
+    def send_configs(self):
+        """Downlink reporting configs that changed for the current ingest load"""
+        pressure = device_control.ingest_pressure(self.metrics, self.writer)
+        for _, addr, payload in self.controller.plan(pressure):
+            try:
+                self.socket.sendto(payload, addr)
+            except OSError as e:
+                print(f"Error sending config to {addr}: {e}")
+
+    def record_anomalies(self, events):
+        """Queue anomaly events for the anomalies table"""
+        for event in events:
+            submit_row(self.writer, 'anomaly', anomaly_detector.anomaly_row(event))
+            if self.verbose:
+                print(f"Anomaly: {event['kind']} on {event['device_id']} ({event['detail']})")
+
+    def _decode_loop(self):
+        """Decode stage: drain received datagrams into the writer until stopped and empty"""
+        while self.running or not self.datagrams.empty():
+            try:
+                data, addr, received_ms = self.datagrams.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.handle_data(data, addr, received_ms)
+
+    def _stop_decoder(self):
+        if self._decoder is not None and self._decoder is not threading.current_thread():
+            self._decoder.join()
+            self._decoder = None
     
-    def process_energy_data(self, data):
-        """Process energy consumption data from IoT sensors"""
+    def handle_data(self, data, addr, received_ms: int = None):
+        """Decode a datagram with the shared decode_rows and queue its rows for the next group commit"""
+        def observe(message):
+            if self.verbose:
+                print(f"Received {message.get('type')} message from {addr}")
+            self.metrics.observe_message(message)
+            if self.controller is not None:
+                self.controller.observe(message, addr)
+        
         try:
-            # Extract data from IoT message
-            power_watts = data.get('power_watts', 0)
-            duration_hours = data.get('duration_hours', 0)
-            device_id = data.get('device_id', 'unknown')
-            timestamp = data.get('timestamp', datetime.now().isoformat())
-            
-            # Calculate energy consumption
-            energy_kwh = (power_watts * duration_hours) / 1000
-            
-            # Calculate CO2 emissions (kg CO2/kWh)
-            co2_emissions = energy_kwh * 0.5  # Adjust based on your region's grid mix
-            
-            # Store in database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO energy_consumption 
-                (date, power_consumption_watts, duration_hours, energy_kwh, co2_emissions_kg)
-                VALUES (?, ?, ?, ?, ?)
-            """, (timestamp.split('T')[0], power_watts, duration_hours, energy_kwh, co2_emissions))
-            
-            conn.commit()
-            conn.close()
-            
-            print(f"Energy data stored: {energy_kwh:.3f} kWh, {co2_emissions:.3f} kg CO2")
-            
+            rows = decode_rows(data, addr, observe, self.integrator, detector=self.detector, received_ms=received_ms)
         except Exception as e:
-            print(f"Error processing energy data: {e}")
-    
-    def process_commute_data(self, data):
-        """Process commute data from IoT devices (e.g., GPS tracking)"""
+            # PacketError, plus anything a registered parser or row builder raises for malformed input
+            self.metrics.record_decode_error()
+            print(f"Invalid packet from {addr}: {type(e).__name__}: {e}")
+            return
+        
+        for kind, row in rows:
+            submit_row(self.writer, kind, row)
+            if self.verbose and kind == 'anomaly':
+                print(f"Anomaly: {row[1]} on {row[0]} ({row[6]})")
+        if self.verbose and rows:
+            print(f"Queued {len(rows)} rows from {addr}")
+
+def _ingest_worker(host, port, rcvbuf, batches, stop_event):
+    """Worker process: receive and parse on its own SO_REUSEPORT socket, send row batches to the writer.
+
+    Each batch is (rows, [(device_id, seq)], datagrams, decode_errors) so the
+    parent can keep one set of ingest metrics for all workers.
+    """
+    sock = make_udp_socket(host, port, rcvbuf, reuse_port=True)
+    sock.settimeout(WORKER_BATCH_SECONDS)
+    rows, sequences, datagrams, decode_errors = [], [], 0, 0
+    # The kernel hashes each sender to one socket, so a device's integration state lives in one worker
+    integrator = new_integrator()
+    detector = new_detector()
+
+    def observe(message):
+        if message.get('seq') is not None:
+            sequences.append((message.get('device_id', 'unknown'), message['seq']))
+
+    flush_at = time.monotonic() + WORKER_BATCH_SECONDS
+    sweep_at = time.monotonic() + anomaly_detector.ANOMALY_SWEEP_SECONDS
+    try:
+        while not stop_event.is_set():
+            if detector is not None and time.monotonic() >= sweep_at:
+                rows.extend(('anomaly', anomaly_detector.anomaly_row(event)) for event in detector.sweep())
+                sweep_at = time.monotonic() + anomaly_detector.ANOMALY_SWEEP_SECONDS
+            try:
+                data, addr = sock.recvfrom(MAX_DATAGRAM_SIZE)
+                received_ms = int(time.time() * 1000)
+                datagrams += 1
+                rows.extend(decode_rows(data, addr, observe, integrator, detector=detector, received_ms=received_ms))
+            except socket.timeout:
+                pass
+            except Exception as e:
+                decode_errors += 1
+                print(f"Worker dropped a datagram: {type(e).__name__}: {e}")
+            if (datagrams or rows) and (len(rows) >= WORKER_BATCH_ROWS or time.monotonic() >= flush_at):
+                batches.put((rows, sequences, datagrams, decode_errors))
+                rows, sequences, datagrams, decode_errors = [], [], 0, 0
+            if time.monotonic() >= flush_at:
+                flush_at = time.monotonic() + WORKER_BATCH_SECONDS
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if datagrams or rows:
+            batches.put((rows, sequences, datagrams, decode_errors))
+        sock.close()
+
+class MultiProcessUDPServer:
+    """UDP ingest spread over N worker processes bound to the same port with SO_REUSEPORT.
+
+    The kernel load-balances datagrams across the workers, which decode and
+    build rows in parallel; the parent process is the single database writer.
+    """
+
+    def __init__(self, host='0.0.0.0', port=8888, db_path='carbon_footprint.db', workers=None, rcvbuf=None):
+        self.host = host
+        self.port = port
+        self.workers = workers or multiprocessing.cpu_count()
+        self.rcvbuf = rcvbuf
+        self.writer = BatchWriter(db_path)
+        self.metrics = IngestMetrics()
+        self.batches = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.processes = []
+
+    def start(self):
+        """Start the workers and write their batches until stopped"""
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+        self.writer.start()
+        for _ in range(self.workers):
+            process = multiprocessing.Process(
+                target=_ingest_worker, args=(self.host, self.port, self.rcvbuf, self.batches, self.stop_event), daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        print(f"UDP Server started on {self.host}:{self.port} with {self.workers} worker processes")
+        
         try:
-            # Extract data from IoT message
-            distance_km = data.get('distance_km', 0)
-            transport_mode = data.get('transport_mode', 'car')
-            device_id = data.get('device_id', 'unknown')
-            timestamp = data.get('timestamp', datetime.now().isoformat())
-            
-            # Calculate CO2 emissions
-            emission_factors = {
-                "car": 0.192,
-                "motorcycle": 0.103,
-                "bus": 0.089,
-                "train": 0.041,
-                "bicycle": 0.0,
-                "walking": 0.0,
-                "electric_car": 0.053,
-                "hybrid_car": 0.120
-            }
-            
-            co2_emissions = distance_km * emission_factors.get(transport_mode.lower(), 0.1)
-            
-            # Store in database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO commute_logs 
-                (date, transport_mode, distance_km, co2_emissions_kg)
-                VALUES (?, ?, ?, ?)
-            """, (timestamp.split('T')[0], transport_mode, distance_km, co2_emissions))
-            
-            conn.commit()
-            conn.close()
-            
-            print(f"Commute data stored: {distance_km} km, {co2_emissions:.3f} kg CO2")
-            
-        except Exception as e:
-            print(f"Error processing commute data: {e}")
+            self._write_until_stopped()
+        except KeyboardInterrupt:
+            print("Stopping UDP server...")
+            self.stop_event.set()
+            self._write_until_stopped()
+        finally:
+            self.writer.stop()
+
+    def stop(self):
+        """Stop the workers; start() returns once their last batches are written"""
+        self.stop_event.set()
+
+    def _write_until_stopped(self):
+        next_log = time.monotonic() + METRICS_LOG_SECONDS
+        while not self.stop_event.is_set() or any(process.is_alive() for process in self.processes):
+            if time.monotonic() >= next_log:
+                log_metrics(self.metrics, self.writer)
+                next_log = time.monotonic() + METRICS_LOG_SECONDS
+            try:
+                self._write(self.batches.get(timeout=0.5))
+            except queue.Empty:
+                continue
+        # Batches the workers sent just before exiting
+        while True:
+            try:
+                self._write(self.batches.get_nowait())
+            except queue.Empty:
+                return
+
+    def _write(self, batch):
+        rows, sequences, datagrams, decode_errors = batch
+        if datagrams:
+            self.metrics.record_datagram(datagrams)
+        if decode_errors:
+            self.metrics.record_decode_error(decode_errors)
+        for device_id, seq in sequences:
+            self.metrics.record_sequence(device_id, seq)
+        for kind, row in rows:
+            submit_row(self.writer, kind, row)
 
 def start_udp_server():
     """Start the UDP server in a separate thread"""
@@ -142,9 +517,26 @@ def start_udp_server():
 
 if __name__ == "__main__":
     # Run UDP server standalone
-    server = UDPServer()
-    try:
-        server.start()
-    except KeyboardInterrupt:
-        print("Stopping UDP server...")
-        server.stop()
+    parser = argparse.ArgumentParser(description="Receive ESP32 readings over UDP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--db", default="carbon_footprint.db")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port via SO_REUSEPORT (0 = one per CPU)")
+    parser.add_argument("--rcvbuf", type=int, default=None, help="kernel receive buffer per socket, in bytes")
+    parser.add_argument("--verbose", action="store_true", help="log every message received (single process only)")
+    args = parser.parse_args()
+    
+    # Running without the API, so nothing else has created the tables
+    ingest_schema.init_ingest_db(args.db)
+    
+    if args.workers != 1:
+        # Handles Ctrl-C itself and returns after the workers' last batches are written
+        MultiProcessUDPServer(args.host, args.port, args.db, workers=args.workers or None, rcvbuf=args.rcvbuf).start()
+    else:
+        server = UDPServer(args.host, args.port, args.db, rcvbuf=args.rcvbuf, verbose=args.verbose)
+        try:
+            server.start()
+        except KeyboardInterrupt:
+            print("Stopping UDP server...")
+            server.stop()